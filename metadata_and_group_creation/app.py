@@ -28,13 +28,16 @@ PAYLOAD = {
     },
 }
 
-pprint.pprint(PAYLOAD)
+# the worker processes of the transform (spawn and forkserver) run this module
+# again as __mp_main__, building the layout there would fetch the project once per worker
+if __name__ != "__mp_main__":
+    pprint.pprint(PAYLOAD)
 
-main_view, import_callbacks, ids = get_components()
+    main_view, import_callbacks, ids = get_components()
 
-app.layout = main_view(payload=PAYLOAD)
+    app.layout = main_view(payload=PAYLOAD)
 
-import_callbacks(app)
+    import_callbacks(app)
 
 
 if __name__ == "__main__":
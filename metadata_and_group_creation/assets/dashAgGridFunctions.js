@@ -0,0 +1,51 @@
+// Formatters of the biosample table (see utils.data.create_column_def)
+//
+// Dash serves this file from the app's assets folder; the column definitions refer
+// to the functions by name (e.g. {"function": "formatNumber(params)"}), so the grid
+// calls them directly instead of evaluating a function string per cell.
+// Derived values (e.g. the size in megabytes) are precomputed by the server.
+
+var dagfuncs = (window.dashAgGridFunctions = window.dashAgGridFunctions || {});
+
+// shared by all cells, creating a formatter is far slower than using one
+const numberFormat = new Intl.NumberFormat("en-US", { maximumFractionDigits: 20 });
+const sizeFormat = new Intl.NumberFormat("en-US", {
+    minimumFractionDigits: 2,
+    maximumFractionDigits: 2,
+});
+// dates are iso strings shared by many rows, each one is formatted once
+const formattedDates = new Map();
+
+function isBlank(value) {
+    return value === null || value === undefined || value === "";
+}
+
+// numbers separated by commas for thousands
+dagfuncs.formatNumber = function (params) {
+    return isBlank(params.value) ? "" : numberFormat.format(params.value);
+};
+
+// size (bytes) displayed in megabytes, from the precomputed "size mb" value
+dagfuncs.formatSize = function (params) {
+    const megabytes = params.data ? params.data["size mb"] : null;
+    return isBlank(megabytes) ? "" : sizeFormat.format(megabytes) + " MB";
+};
+
+// the size column is filtered on megabytes, as displayed
+dagfuncs.sizeInMegabytes = function (params) {
+    return params.data ? params.data["size mb"] : null;
+};
+
+// iso dates displayed as mm/dd/yyyy
+dagfuncs.formatDate = function (params) {
+    const value = params.value;
+    if (isBlank(value)) {
+        return "";
+    }
+    let formatted = formattedDates.get(value);
+    if (formatted === undefined) {
+        formatted = new Date(value).toLocaleDateString("en-US");
+        formattedDates.set(value, formatted);
+    }
+    return formatted;
+};
@@ -12,6 +12,7 @@ from layout.group_selection import (
 )
 from layout.metadata_and_group_creation import (
     get_group_store_id,
+    get_selected_biosamples_store_id,
     import_metadata_and_group_creation_callbacks,
     metadata_and_group_creation_button,
 )
@@ -67,6 +68,7 @@ def get_components():
     # all needed component ids
     ids: dict[str, str | dict[str, str]] = {
         "group_store_id": get_group_store_id(),
+        "selected_biosamples_id": get_selected_biosamples_store_id(),
         "select_groups": {
             "table_id": get_select_groups_table_id(),
             "table_column_name": get_biosample_id_column(),
@@ -1,5 +1,5 @@
+import logging
 import pprint
-from functools import reduce
 
 import dash_ag_grid as dag
 import dash_bootstrap_components as dbc
@@ -10,17 +10,32 @@ from dash_iconify import DashIconify
 
 from layout.group_selection import get_biosample_id_column as get_group_id_column
 from static.ids import IDs
-from utils.appsync import fetch_table_data_from_appsync
+from utils.appsync import BIOSAMPLE_FIELDS
 from utils.data import (
+    column_defs_fingerprint,
     convert_columns_for_export,
-    create_column_defs_and_row_data,
+    fields_for_columns,
     mandatory_columns,
 )
-from utils.layout_utils import html_button
+from utils.groups import select_groups
+from utils.layout_utils import html_button, serve_grid_functions
+from utils.row_model import get_rows
+from utils.sources import (
+    BiosampleSource,
+    source_descriptor,
+    source_from_descriptor,
+    source_from_payload,
+)
+from utils.table_store import table_store
 
 GROUP_SELECTION_BASE_ID = IDs.GROUP_SELECTION_BASE_ID.value
 BASE_ID = IDs.METADATA_AND_GROUP_CREATION_BASE_ID.value
 
+logger = logging.getLogger(__name__)
+
+# rows per block requested by the grid with the infinite row model
+INFINITE_BLOCK_SIZE = 500
+
 
 def get_group_store_id() -> str:
     """
@@ -80,11 +95,14 @@ def select_groups_menu() -> dmc.Menu:
     )
 
 
-def select_columns_menu(custom_columns: list[str]) -> dmc.Menu:
+def select_columns_menu(
+    custom_columns: list[str], visible_columns: list[str] = None
+) -> dmc.Menu:
     """
     Creates a dropdown menu for selecting columns to view in the table.
     Args:
         custom_columns: list[str] - list of custom column names from basejumper's metadata
+        visible_columns: list[str] - columns checked initially (None for all columns)
 
     Returns:
         dmc.Menu - dropdown menu for selecting columns to view in the table
@@ -105,7 +123,7 @@ def select_columns_menu(custom_columns: list[str]) -> dmc.Menu:
                         id=BASE_ID + "metadata_all_column_checkbox",
                         label="select/deselect all",
                         value="",
-                        checked=True,
+                        checked=visible_columns is None,
                     ),
                     # Mandatory columns
                     dmc.MenuLabel("Basejumper"),
@@ -119,7 +137,11 @@ def select_columns_menu(custom_columns: list[str]) -> dmc.Menu:
                             )
                             for column_name in mandatory_columns()
                         ],
-                        value=mandatory_columns(),
+                        value=[
+                            column_name
+                            for column_name in mandatory_columns()
+                            if visible_columns is None or column_name in visible_columns
+                        ],
                     ),
                     # Metadata columns
                     dmc.MenuDivider(),
@@ -134,7 +156,11 @@ def select_columns_menu(custom_columns: list[str]) -> dmc.Menu:
                             )
                             for column_name in custom_columns
                         ],
-                        value=custom_columns,
+                        value=[
+                            column_name
+                            for column_name in custom_columns
+                            if visible_columns is None or column_name in visible_columns
+                        ],
                     ),
                 ],
             ),
@@ -144,7 +170,7 @@ def select_columns_menu(custom_columns: list[str]) -> dmc.Menu:
     )
 
 
-def header(custom_columns: list[str]):
+def header(custom_columns: list[str], visible_columns: list[str] = None):
     """
     Creates the header for the metadata and group creation modal.
 
@@ -155,13 +181,16 @@ def header(custom_columns: list[str]):
 
     Args:
         custom_columns: list[str] - list of custom column names from basejumper's metadata
+        visible_columns: list[str] - columns shown initially (None for all columns)
 
     Returns:
         html.Div - header for the metadata and group creation modal
 
     """
 
-    column_dropdown = select_columns_menu(custom_columns=custom_columns)
+    column_dropdown = select_columns_menu(
+        custom_columns=custom_columns, visible_columns=visible_columns
+    )
     export_button = html_button(
         id=BASE_ID + "table_export_button",
         text="Export",
@@ -249,6 +278,128 @@ def header(custom_columns: list[str]):
     )
 
 
+def get_selected_biosamples_store_id() -> str:
+    """
+    Returns the id for the store that holds the names of the biosamples
+    selected in the table (kept in sync with the table's selectedRows in the browser,
+    so callbacks exchange biosample names instead of whole rows).
+    """
+    return BASE_ID + "selected_biosamples"
+
+
+def get_table_fields_store_id() -> str:
+    """
+    Returns the id for the store that holds the project id of the table,
+    the appsync fields its rows were built from and the descriptor of its
+    biosample source (the payload without credentials, see utils.sources).
+    """
+    return BASE_ID + "table_fields"
+
+
+def get_session_store_id() -> str:
+    """
+    Returns the id for the store (in the browser's session storage) that holds
+    the handle of the session's table on the server (see utils.table_store).
+    The handle is minted per browser session by a callback, as the layout
+    is shared by all sessions.
+    """
+    return BASE_ID + "session"
+
+
+def get_table_refresh_store_id() -> str:
+    """
+    Returns the id for the store that is bumped when the rows of the table
+    changed on the server while the grid uses the infinite row model, so the
+    grid drops its cached blocks and requests them again (see get_table_rows).
+    """
+    return BASE_ID + "table_refresh"
+
+
+def is_infinite_row_model(payload: dict) -> bool:
+    """
+    Whether the table uses the infinite row model (payload["row_model"] == "infinite"):
+    the rows stay on the server, which filters and sorts them and sends the grid
+    only the blocks of rows it displays.
+    """
+    return payload.get("row_model") == "infinite"
+
+
+def table_fields(payload: dict) -> list[str]:
+    """
+    Returns the appsync fields the rows of the table are built from initially
+    """
+    # with the infinite row model, only the displayed rows reach the browser,
+    # so all fields are fetched at once
+    if payload.get("columns") is None or is_infinite_row_model(payload):
+        return BIOSAMPLE_FIELDS
+    return fields_for_columns(payload["columns"])
+
+
+def session_handle(session: dict) -> str:
+    """
+    Returns the handle of the session's table (session store), None before it is minted
+    """
+    return (session or {}).get("handle")
+
+
+def project_source(table_fields: dict) -> BiosampleSource:
+    """
+    Returns the biosample source of the table, with the appsync credentials
+    resolved for the current request (see utils.sources.source_from_descriptor)
+
+    Args:
+        table_fields: dict - table fields store
+
+    Returns:
+        BiosampleSource - the biosample source, None when this server cannot resolve it
+    """
+    try:
+        return source_from_descriptor(table_fields["source"])
+    except (KeyError, ValueError) as error:
+        logger.warning(
+            "Biosample source of project %s is not available: %s",
+            table_fields.get("project_id"),
+            error,
+        )
+        return None
+
+
+def project_row_data(table_fields: dict, session: dict) -> list[dict]:
+    """
+    Returns the rows of the session's table on the server
+
+    The table is looked up by the handle of the session store. When it is not in
+    the table store (first use, evicted, stored by another server process or for
+    another project), it is built again from the biosample source and stored
+    under the same handle.
+
+    Args:
+        table_fields: dict - project id, appsync fields and source descriptor
+            of the table (table fields store)
+        session: dict - handle of the session's table (session store)
+
+    Returns:
+        list[dict] - list of row data for ag grid (read-only),
+            None before the session's handle is minted (the table would be built
+            again on every request) or when the biosample source cannot be resolved
+    """
+    handle = session_handle(session)
+    if not handle:
+        return None
+    project_id = table_fields["project_id"]
+    entry = table_store.lookup(handle, project_id, table_fields["fields"])
+    if entry is not None:
+        return entry["row_data"]
+    source = project_source(table_fields)
+    if source is None:
+        return None
+    column_defs, row_data = source.table(fields=table_fields["fields"])
+    table_store.put(
+        handle, project_id, column_defs, row_data, fields=table_fields["fields"]
+    )
+    return row_data
+
+
 def table(payload: dict) -> tuple[dag.AgGrid, list[str]]:
     """
     Creates the table for the metadata and group creation modal.
@@ -261,19 +412,30 @@ def table(payload: dict) -> tuple[dag.AgGrid, list[str]]:
 
     """
 
-    # unpack the payload object for project id and appsync data
-    project_id = payload["project_id"]
-    app_sync_endpoint = payload["app_sync_endpoint"]
-    app_sync_user = payload["app_sync_user"]
+    # the biosample source of the payload
+    # (appsync by default, or a local snapshot selected by payload["source"])
+    source = source_from_payload(payload)
+    # columns shown initially, only their appsync fields are fetched
+    # (the other columns are fetched when they are enabled in the column selector)
+    visible_columns = payload.get("columns")
 
     # create the column definitions and row data for the table
-    COLUMN_DEFS, ROW_DATA = create_column_defs_and_row_data(
-        fetch_table_data_from_appsync(
-            project_id=project_id,
-            app_sync_endpoint=app_sync_endpoint,
-            app_sync_user=app_sync_user,
-        )
-    )
+    # (served from the project table cache while appsync reports no change,
+    # otherwise pages are transformed while the following ones are still downloading)
+    COLUMN_DEFS, ROW_DATA = source.table(fields=table_fields(payload))
+    if visible_columns is not None:
+        for column_def in COLUMN_DEFS:
+            column_def["hide"] = column_def["field"] not in visible_columns
+    if is_infinite_row_model(payload):
+        # rows are sent block by block by get_table_rows
+        row_model = {"rowModelType": "infinite"}
+        grid_options = {
+            "cacheBlockSize": INFINITE_BLOCK_SIZE,
+            "infiniteInitialRowCount": min(len(ROW_DATA), INFINITE_BLOCK_SIZE),
+        }
+    else:
+        row_model = {"rowData": ROW_DATA}
+        grid_options = {}
 
     # create the table
     table = dag.AgGrid(
@@ -292,9 +454,12 @@ def table(payload: dict) -> tuple[dag.AgGrid, list[str]]:
             "enableCellTextSelection": True,
             "rowSelection": "multiple",
             "rowMultiSelectWithClick": True,
+            **grid_options,
         },
         suppressDragLeaveHidesColumns=True,
-        rowData=ROW_DATA,
+        # rows are identified (and selected) by biosample name
+        getRowId="params.data.biosamplename",
+        **row_model,
     )
 
     # get the list of columns for dropdown menu that selects columns to view
@@ -330,6 +495,19 @@ def metadata_and_group_creation_button(payload: dict) -> html.Div:
     return html.Div(
         [
             dcc.Store(get_group_store_id(), data={}),
+            dcc.Store(get_selected_biosamples_store_id(), data=[]),
+            dcc.Store(
+                get_table_fields_store_id(),
+                data={
+                    "project_id": payload["project_id"],
+                    "fields": table_fields(payload),
+                    # credentials are resolved on the server by every callback
+                    "source": source_descriptor(payload),
+                },
+            ),
+            # the tables stay on the server, every session only holds a handle
+            dcc.Store(get_session_store_id(), storage_type="session"),
+            dcc.Store(get_table_refresh_store_id(), data=0),
             button,
             metadata_and_group_creation_modal(payload),
         ]
@@ -360,7 +538,7 @@ def metadata_and_group_creation_modal(payload: dict) -> dmc.Modal:
         id=BASE_ID + "modal",
         children=[
             group_created_alert(),
-            header(custom_columns),
+            header(custom_columns, visible_columns=payload.get("columns")),
             table_component,
         ],
     )
@@ -406,6 +584,9 @@ def import_metadata_and_group_creation_callbacks(app: Dash) -> None:
 
     """
 
+    # the value formatters named in the column definitions of the table
+    serve_grid_functions(app)
+
     """
         Commented out code is for debugging purposes
     """
@@ -443,6 +624,20 @@ def import_metadata_and_group_creation_callbacks(app: Dash) -> None:
             return not is_open
         return is_open
 
+    @app.callback(
+        Output(get_session_store_id(), "data"),
+        Input(get_session_store_id(), "modified_timestamp"),
+        State(get_session_store_id(), "data"),
+    )
+    def mint_session_handle(modified_timestamp, session):
+        """
+        Mints the handle of the session's table on its first page load
+        (kept in the browser's session storage for the following ones).
+        """
+        if session_handle(session):
+            return no_update
+        return {"handle": table_store.new_handle()}
+
     @app.callback(
         Output(BASE_ID + "table", "filterModel"),
         Input(BASE_ID + "restart_filters_button", "n_clicks"),
@@ -456,6 +651,18 @@ def import_metadata_and_group_creation_callbacks(app: Dash) -> None:
         pprint.pprint(filter_model)
         return {}
 
+    # selected rows are reduced to their biosample names in the browser,
+    # so the selection does not go through the server as whole rows
+    app.clientside_callback(
+        """
+        function(selectedRows) {
+            return (selectedRows || []).map(row => row.biosamplename);
+        }
+        """,
+        Output(get_selected_biosamples_store_id(), "data"),
+        Input(BASE_ID + "table", "selectedRows"),
+    )
+
     @app.callback(
         Output(BASE_ID + "groups_checkbox_group", "children"),
         Output(BASE_ID + "groups_checkbox_group", "value"),
@@ -463,16 +670,18 @@ def import_metadata_and_group_creation_callbacks(app: Dash) -> None:
         Input(BASE_ID + "all_groups_checkbox", "checked"),
         Input(BASE_ID + "groups_checkbox_group", "value"),
         Input(BASE_ID + "group_store", "data"),
-        State(BASE_ID + "table", "rowData"),
         State(BASE_ID + "group_name_input", "value"),
+        State(get_table_fields_store_id(), "data"),
+        State(get_session_store_id(), "data"),
         prevent_initial_call=True,
     )
     def update_groups_checkbox_group(
         all_groups_checked,
         checked_groups,
         group_store,
-        row_data,
         group_name_input,
+        table_fields,
+        session,
     ):
         """
         Updates the groups checkbox group.
@@ -514,15 +723,12 @@ def import_metadata_and_group_creation_callbacks(app: Dash) -> None:
             # when first loading the default groups (no group is selected)
             # so we skip selecting biosamples in the table
             selected_groups = []
-        # flatten all selected group biosamples and filter selected rows by those biosamples
-        selected_biosamples = reduce(
-            lambda acc, x: acc + x,
-            [group_store[group_name] for group_name in selected_groups],
-            [],
-        )
-        selected_rows = list(
-            filter(lambda x: x["biosamplename"] in selected_biosamples, row_data)
-        )
+        row_data = project_row_data(table_fields, session)
+        if row_data is None:
+            return children, selected_groups, no_update
+        # union of the selected groups (as bitsets over the table's biosamples),
+        # the grid selects the rows by id (getRowId)
+        selected_rows = {"ids": select_groups(row_data, group_store, selected_groups)}
         return children, selected_groups, selected_rows
 
     @app.callback(
@@ -577,34 +783,149 @@ def import_metadata_and_group_creation_callbacks(app: Dash) -> None:
 
         return all_columns_checked, basejumper_columns, custom_columns, column_state
 
+    @app.callback(
+        Output(BASE_ID + "table", "getRowsResponse"),
+        Input(BASE_ID + "table", "getRowsRequest"),
+        State(get_table_fields_store_id(), "data"),
+        State(get_session_store_id(), "data"),
+        prevent_initial_call=True,
+    )
+    def get_table_rows(request, table_fields, session):
+        """
+        Sends the grid a block of rows (infinite row model),
+        filtered and sorted on the server.
+        """
+        if not request:
+            return no_update
+        row_data = project_row_data(table_fields, session)
+        if row_data is None:
+            return no_update
+        return get_rows(row_data, request)
+
+    # the infinite grid requests its blocks of rows again when the table refresh
+    # store was bumped or the session's handle was minted (the blocks requested
+    # before were not answered) (dash needs an output, the store's timestamp
+    # is left as it is)
+    app.clientside_callback(
+        f"""
+        function(refresh, session) {{
+            let api;
+            try {{
+                api = dash_ag_grid.getApi("{BASE_ID}table");
+            }} catch (error) {{
+                api = undefined;
+            }}
+            if (api && api.getModel().getType() === "infinite") {{
+                api.purgeInfiniteCache();
+            }}
+            return window.dash_clientside.no_update;
+        }}
+        """,
+        Output(get_table_refresh_store_id(), "modified_timestamp"),
+        Input(get_table_refresh_store_id(), "data"),
+        Input(get_session_store_id(), "data"),
+        prevent_initial_call=True,
+    )
+
+    @app.callback(
+        Output(BASE_ID + "table", "rowData"),
+        Output(BASE_ID + "table", "columnDefs"),
+        Output(get_table_fields_store_id(), "data"),
+        Output(get_table_refresh_store_id(), "data"),
+        Input(BASE_ID + "basejumper_column_checkbox_group", "value"),
+        Input(BASE_ID + "custom_column_checkbox_group", "value"),
+        State(get_table_fields_store_id(), "data"),
+        State(get_session_store_id(), "data"),
+        State(BASE_ID + "table", "columnDefs"),
+        State(BASE_ID + "table", "rowModelType"),
+        State(get_table_refresh_store_id(), "data"),
+        prevent_initial_call=True,
+    )
+    def fetch_enabled_columns(
+        basejumper_columns,
+        custom_columns,
+        table_fields,
+        session,
+        table_column_defs,
+        row_model_type,
+        refresh,
+    ):
+        """
+        Fetches the data of columns enabled in the column selector
+        that were not fetched with the table yet.
+        The column definitions are only sent again when they changed meanwhile
+        (e.g. the project's metadata columns were edited).
+        With the infinite row model the rows stay on the server: the table
+        refresh store is bumped instead, so the grid requests its blocks again.
+        """
+        if not session_handle(session):
+            return no_update, no_update, no_update, no_update
+        view_columns = (basejumper_columns or []) + (custom_columns or [])
+        missing_fields = set(fields_for_columns(view_columns)) - set(
+            table_fields["fields"]
+        )
+        if not missing_fields:
+            return no_update, no_update, no_update, no_update
+        source = project_source(table_fields)
+        if source is None:
+            return no_update, no_update, no_update, no_update
+        column_defs, row_data = source.table_columns(view_columns)
+        fields = sorted(missing_fields | set(table_fields["fields"]))
+        # the session's table now has the enabled columns too
+        table_store.put(
+            session_handle(session),
+            table_fields["project_id"],
+            column_defs,
+            row_data,
+            fields=fields,
+        )
+        if column_defs_fingerprint(column_defs) == column_defs_fingerprint(
+            table_column_defs
+        ):
+            column_defs = no_update
+        else:
+            for column_def in column_defs:
+                column_def["hide"] = column_def["field"] not in view_columns
+        table_fields = {**table_fields, "fields": fields}
+        if row_model_type == "infinite":
+            return no_update, column_defs, table_fields, (refresh or 0) + 1
+        return row_data, column_defs, table_fields, no_update
+
     @app.callback(
         Output(BASE_ID + "group_store", "data"),
         Output(GROUP_SELECTION_BASE_ID + "table", "rowData"),
         Input(BASE_ID + "create_edit_group_button", "n_clicks"),
+        Input(get_session_store_id(), "data"),
         State(BASE_ID + "group_name_input", "value"),
-        State(BASE_ID + "table", "selectedRows"),
+        State(get_selected_biosamples_store_id(), "data"),
         State(BASE_ID + "group_store", "data"),
-        State(BASE_ID + "table", "rowData"),
+        State(get_table_fields_store_id(), "data"),
         prevent_initial_call=False,  # set to False so default groups are created on first load
     )
-    def add_group(n_clicks, group_name, selected_rows, group_store, all_row_data):
+    def add_group(
+        n_clicks,
+        session,
+        group_name,
+        selected_rows_biosamples,
+        group_store,
+        table_fields,
+    ):
         """
         Adds a group to the group store and group selection table.
         """
-        if not ctx.triggered:
-            # first time the app is loaded
-            # add default groups
-            default_groups_store, row_data = create_default_groups(all_row_data)
-            return default_groups_store, row_data
-
-        if not group_name or group_name.isspace() or not selected_rows:
+        if not ctx.triggered or ctx.triggered_id == get_session_store_id():
+            # first time the app is loaded (or the session's handle was just minted)
+            # add default groups (from the rows on the server)
+            all_row_data = project_row_data(table_fields, session)
+            if all_row_data is None:
+                return no_update, no_update
+            return create_default_groups(all_row_data)
+
+        if not group_name or group_name.isspace() or not selected_rows_biosamples:
             return no_update, no_update
 
         group_name = group_name.strip()
 
-        selected_rows_biosamples = list(
-            map(lambda x: x["biosamplename"], selected_rows)
-        )
         group_store = {**group_store, group_name: selected_rows_biosamples}
 
         # pprint.pprint(group_store)
@@ -627,10 +948,10 @@ def import_metadata_and_group_creation_callbacks(app: Dash) -> None:
         State(BASE_ID + "group_created_alert", "hide"),
         State(BASE_ID + "group_name_input", "value"),
         State(BASE_ID + "group_store", "data"),
-        State(BASE_ID + "table", "selectedRows"),
+        State(get_selected_biosamples_store_id(), "data"),
         prevent_initial_call=True,
     )
-    def alert(n_clicks, hide, group_name, existing_groups, selected_rows):
+    def alert(n_clicks, hide, group_name, existing_groups, selected_biosamples):
         """
         Creates an alert for when a group is created.
         """
@@ -641,7 +962,7 @@ def import_metadata_and_group_creation_callbacks(app: Dash) -> None:
                 f"Please provide a name for your group",
                 "red",
             )
-        if not selected_rows:
+        if not selected_biosamples:
             return (
                 False,
                 "No biosamples selected",
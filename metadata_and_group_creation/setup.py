@@ -5,4 +5,10 @@ setup(
     version="0.1",
     packages=find_packages(),
     install_requires=[],
+    # optional backends: orjson/msgspec for json decoding (utils/codec.py),
+    # pyarrow for parquet snapshots (utils/sources.py)
+    extras_require={
+        "json": ["orjson>=3.8", "msgspec>=0.18"],
+        "parquet": ["pyarrow>=14"],
+    },
 )
@@ -0,0 +1,182 @@
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+import pytest
+
+# the modules are imported as top-level packages (utils, layout), as app.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from utils import appsync  # noqa: E402
+from utils.appsync_stub import AppSyncStub  # noqa: E402
+
+APP_SYNC_USER = {
+    "username": "user",
+    "password": "password",
+    "clientId": "client",
+    "appClientSecret": "secret",
+}
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    """
+    Starts the appsync stand-in and points cognito and the token cache at it
+    """
+    stub = AppSyncStub()
+    url = stub.start()
+    monkeypatch.setenv("COGNITO_ENDPOINT_URL", url + "/cognito")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setattr(appsync, "_cognito_client", None)
+    monkeypatch.setattr(appsync, "_token_cache", {})
+    appsync.configure_appsync_transport(backoff=0.01)
+    stub.url = url
+    stub.endpoint = url + "/graphql"
+    stub.user = APP_SYNC_USER
+    yield stub
+    stub.stop()
+
+
+class FakeResponse:
+    """
+    Response of the fake appsync endpoint (the attributes call_appsync reads)
+    """
+
+    def __init__(self, status_code: int, payload: dict):
+        self.status_code = status_code
+        self.content = json.dumps(payload).encode("utf-8")
+        self.text = self.content.decode("utf-8")
+
+
+class FakeAppsync:
+    """
+    In-process appsync and cognito: answers the getProject queries of utils.appsync
+    (plain, aliased and delta sync) from the added projects
+
+    Args:
+        latency (float): Seconds added to every graphql request
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.requests = 0
+        self.authentications = 0
+        self._tokens = set()
+        self._projects = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def project(biosample_count: int) -> dict:
+        """
+        Returns a project (getProject shape) with the given number of biosamples
+        """
+        columns = [
+            {"editable": True, "name": "cell_type", "description": "", "type": "Text"},
+            {"editable": True, "name": "sorted_on", "description": "", "type": "Date"},
+        ]
+        items = [
+            {
+                "biosampleName": f"biosample-{i:04d}",
+                "fastqValidationStatus": "Pass",
+                "size": float(10**7 * (i + 1)),
+                "r1FastqTotalReads": 1000 * i,
+                "r2FastqTotalReads": 1000 * i,
+                "r1FastqLength": 151,
+                "created": "2023-05-01T08:34:27.277Z",
+                "updatedAt": "2023-05-01T08:34:27.277Z",
+                "lotId": "LOT-0001",
+                "metadata": json.dumps(
+                    {
+                        "cell_type": ["K562", "HEK293", "Molm13"][i % 3],
+                        "sorted_on": f"2023-{i % 12 + 1:02d}-01",
+                    }
+                ),
+            }
+            for i in range(biosample_count)
+        ]
+        return {
+            "biosampleMetadataColumns": json.dumps({"columns": columns}),
+            "biosamples": {"items": items},
+        }
+
+    def add_project(self, project_id: str, project: dict) -> None:
+        with self._lock:
+            self._projects[project_id] = project
+
+    def revoke_token(self, token: str) -> None:
+        with self._lock:
+            self._tokens.discard(token)
+
+    def authenticate_user(
+        self, app_sync_user: dict, secret_hash: bool = False, refresh_token: str = None
+    ) -> dict:
+        with self._lock:
+            self.authentications += 1
+            token = f"fake-access-token-{self.authentications}"
+            self._tokens.add(token)
+        return {
+            "access_token": token,
+            "refresh_token": None,
+            "expires_at": time.monotonic() + 3600,
+        }
+
+    def post_appsync(
+        self, appsync_endpoint_url: str, access_token: str, body: bytes
+    ) -> FakeResponse:
+        time.sleep(self.latency)
+        with self._lock:
+            self.requests += 1
+            if access_token not in self._tokens:
+                return FakeResponse(401, {"errors": [{"message": "Unauthorized"}]})
+            body = json.loads(body)
+            variables = body.get("variables") or {}
+            fields = re.search(r"items\s*\{([^}]*)\}", body["query"]).group(1).split()
+            if "id" in variables:
+                data = {"getProject": self.page(variables, fields)}
+            else:
+                data = {
+                    f"p{i}": self.page(variables, fields, str(i))
+                    for i in range(len(body["query"].split("getProject(")) - 1)
+                }
+        return FakeResponse(200, {"data": data})
+
+    def page(self, variables: dict, fields: list[str], suffix: str = "") -> dict:
+        """
+        Returns a page of a project (the variables of an alias end with suffix)
+        """
+        project = self._projects.get(variables["id" + suffix])
+        if project is None:
+            return None
+        items = project["biosamples"]["items"]
+        updated_since = (variables.get("filter") or {}).get("updatedAt", {}).get("gt")
+        if updated_since:
+            items = [item for item in items if item["updatedAt"] > updated_since]
+        start = int(variables.get("nextToken" + suffix) or 0)
+        end = start + variables["limit"]
+        return {
+            "biosampleMetadataColumns": project["biosampleMetadataColumns"],
+            "biosamples": {
+                "items": [
+                    {field: item.get(field) for field in fields}
+                    for item in items[start:end]
+                ],
+                "nextToken": str(end) if end < len(items) else None,
+            },
+        }
+
+
+@pytest.fixture
+def fake_appsync(monkeypatch):
+    """
+    Serves the appsync requests and token requests of utils.appsync in process
+    """
+    fake = FakeAppsync()
+    monkeypatch.setattr(appsync, "_token_cache", {})
+    monkeypatch.setattr(appsync, "authenticate_user", fake.authenticate_user)
+    monkeypatch.setattr(appsync, "post_appsync", fake.post_appsync)
+    fake.endpoint = "https://appsync.test/graphql"
+    fake.user = APP_SYNC_USER
+    return fake
@@ -0,0 +1,229 @@
+import itertools
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from utils import appsync
+
+
+def prefetch_threads() -> list[threading.Thread]:
+    return [
+        thread for thread in threading.enumerate() if thread.name == "appsync-prefetch"
+    ]
+
+
+def wait_for_prefetch_threads(timeout: float = 2.0) -> list[threading.Thread]:
+    deadline = time.monotonic() + timeout
+    while prefetch_threads() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return prefetch_threads()
+
+
+def test_prefetch_yields_pages_in_order():
+    pages = [{"page": i} for i in range(10)]
+    assert list(appsync._prefetch(iter(pages), prefetch=2)) == pages
+    assert wait_for_prefetch_threads() == []
+
+
+def test_prefetch_reraises_producer_errors():
+    def pages():
+        yield {"page": 0}
+        raise ValueError("appsync failed")
+
+    prefetched = appsync._prefetch(pages(), prefetch=2)
+    assert next(prefetched) == {"page": 0}
+    with pytest.raises(ValueError, match="appsync failed"):
+        next(prefetched)
+    assert wait_for_prefetch_threads() == []
+
+
+@pytest.mark.parametrize("page_count", [3, 4, None])
+def test_prefetch_thread_exits_when_consumer_stops_early(page_count):
+    # the producer is waiting for buffer space (or has more pages, None: endless)
+    for _ in range(5):
+        pages = ({"page": i} for i in itertools.islice(itertools.count(), page_count))
+        prefetched = appsync._prefetch(pages, prefetch=1)
+        assert next(prefetched) == {"page": 0}
+        time.sleep(0.05)
+        prefetched.close()
+    assert wait_for_prefetch_threads() == []
+
+
+def test_unknown_project_raises(monkeypatch):
+    response = {
+        "data": {"getProject": None},
+        "errors": [{"message": "Not Authorized to access getProject"}],
+    }
+    monkeypatch.setattr(appsync, "get_user_access_token", lambda user: "token")
+    monkeypatch.setattr(appsync, "call_appsync", lambda *args, **kwargs: response)
+    pages = appsync.fetch_biosample_pages_from_appsync("missing", "url", {})
+    with pytest.raises(ValueError, match="missing not found.*Not Authorized"):
+        next(pages)
+
+
+def test_rejected_token_is_renewed_once(fake_appsync):
+    fake_appsync.add_project("project", fake_appsync.project(10))
+    token = appsync.get_user_access_token(fake_appsync.user)
+    fake_appsync.revoke_token(token)
+    project = appsync.fetch_table_data_from_appsync(
+        "project", fake_appsync.endpoint, fake_appsync.user
+    )
+    assert len(project["biosamples"]["items"]) == 10
+    assert fake_appsync.authentications == 2
+    assert appsync.get_user_access_token(fake_appsync.user) != token
+
+
+def test_rejected_token_without_user_raises(fake_appsync):
+    token = appsync.get_user_access_token(fake_appsync.user)
+    fake_appsync.revoke_token(token)
+    with pytest.raises(Exception, match="Unauthorized"):
+        appsync.call_appsync(
+            fake_appsync.endpoint,
+            token,
+            appsync.biosample_query(tuple(appsync.BIOSAMPLE_FIELDS)),
+        )
+
+
+def test_invalidate_keeps_a_renewed_token(fake_appsync):
+    token = appsync.get_user_access_token(fake_appsync.user)
+    appsync.invalidate_user_access_token(fake_appsync.user)
+    renewed = appsync.get_user_access_token(fake_appsync.user)
+    # a late rejection of the old token does not drop the renewed one
+    appsync.invalidate_user_access_token(fake_appsync.user, token)
+    assert appsync.get_user_access_token(fake_appsync.user) == renewed != token
+    assert fake_appsync.authentications == 2
+
+
+def test_only_delta_queries_declare_the_filter():
+    fields = appsync.select_biosample_fields(["size"])
+    query = appsync.biosample_query(fields)
+    assert "$filter" not in query
+    assert "biosamples(limit: $limit, nextToken: $nextToken)" in query
+    delta_query = appsync.biosample_query(fields, delta=True)
+    assert "$filter: ModelBiosampleFilterInput" in delta_query
+    assert "biosamples(filter: $filter, limit: $limit" in delta_query
+    assert "filter" not in appsync.biosample_query_variables("project")
+
+
+def test_updated_since_requests_only_updated_biosamples(fake_appsync):
+    project = fake_appsync.project(20)
+    updated_since = max(item["updatedAt"] for item in project["biosamples"]["items"])
+    project["biosamples"]["items"][5]["updatedAt"] = "2100-01-01T00:00:00.000Z"
+    fake_appsync.add_project("project", project)
+    pages = appsync.fetch_biosample_pages_from_appsync(
+        "project", fake_appsync.endpoint, fake_appsync.user, updated_since=updated_since
+    )
+    items = [item for page in pages for item in page["biosamples"]["items"]]
+    assert [item["biosampleName"] for item in items] == [
+        project["biosamples"]["items"][5]["biosampleName"]
+    ]
+
+
+class FakeSession:
+    """
+    Stands in for the pooled session, answers with the given status codes
+    (or raises the given exceptions) in order
+    """
+
+    def __init__(self, responses: list):
+        self.responses = list(responses)
+        self.requests = []
+
+    def request(self, **kwargs):
+        self.requests.append(kwargs)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return SimpleNamespace(status_code=response)
+
+
+@pytest.fixture
+def session(monkeypatch):
+    def use(responses: list) -> FakeSession:
+        fake = FakeSession(responses)
+        monkeypatch.setattr(appsync, "get_appsync_session", lambda: fake)
+        return fake
+
+    monkeypatch.setattr(appsync, "APPSYNC_MAX_RETRIES", 3)
+    monkeypatch.setattr(appsync, "backoff_delay", lambda attempt: 0)
+    return use
+
+
+def test_throttled_and_server_errors_are_retried(session):
+    fake = session([429, 503, requests.ConnectionError(), 200])
+    response = appsync.post_appsync("url", "token", b"{}")
+    assert response.status_code == 200
+    assert len(fake.requests) == 4
+    assert all(request["data"] == b"{}" for request in fake.requests)
+    assert fake.requests[0]["headers"]["authorization"] == "token"
+    assert fake.requests[0]["timeout"] == (
+        appsync.APPSYNC_CONNECT_TIMEOUT,
+        appsync.APPSYNC_READ_TIMEOUT,
+    )
+
+    # other errors are not retried
+    fake = session([400])
+    assert appsync.post_appsync("url", "token", b"{}").status_code == 400
+    assert len(fake.requests) == 1
+
+
+def test_retries_give_up_after_max_retries(session):
+    fake = session([500] * 5)
+    assert appsync.post_appsync("url", "token", b"{}").status_code == 500
+    assert len(fake.requests) == 4
+    session([requests.Timeout()] * 4)
+    with pytest.raises(requests.Timeout):
+        appsync.post_appsync("url", "token", b"{}")
+
+
+def test_session_is_shared_until_the_transport_is_configured(monkeypatch):
+    monkeypatch.setattr(appsync, "_session", None)
+    monkeypatch.setattr(appsync, "APPSYNC_POOL_SIZE", appsync.APPSYNC_POOL_SIZE)
+    session = appsync.get_appsync_session()
+    assert appsync.get_appsync_session() is session
+    assert session.get_adapter("https://appsync.test")._pool_maxsize == (
+        appsync.APPSYNC_POOL_SIZE
+    )
+
+    appsync.configure_appsync_transport(pool_size=3)
+    configured = appsync.get_appsync_session()
+    assert configured is not session
+    assert configured.get_adapter("https://appsync.test")._pool_maxsize == 3
+
+
+def test_projects_are_fetched_in_aliased_chunks(fake_appsync):
+    sizes = {"a": 5, "b": 12, "c": 0, "d": 3}
+    for project_id, size in sizes.items():
+        fake_appsync.add_project(project_id, fake_appsync.project(size))
+    responses = appsync.fetch_projects_from_appsync(
+        ["a", "missing", "b", "c", "d"],
+        fake_appsync.endpoint,
+        fake_appsync.user,
+        page_size=5,
+        fields=["size"],
+        max_projects_per_request=2,
+        max_items_per_request=10,
+    )
+    assert list(responses) == ["a", "missing", "b", "c", "d"]
+    assert responses["missing"] is None
+    for project_id, size in sizes.items():
+        items = responses[project_id]["biosamples"]["items"]
+        assert items == [
+            {"biosampleName": item["biosampleName"], "size": item["size"]}
+            for item in fake_appsync.project(size)["biosamples"]["items"]
+        ]
+        assert "nextToken" not in responses[project_id]["biosamples"]
+    # 5 projects in requests of 2 aliases, then b continued twice with its nextToken
+    assert fake_appsync.requests == 4
+
+
+def test_multi_project_query_aliases_the_projects():
+    query = appsync.multi_project_query(3, ("biosampleName", "size"))
+    for i in range(3):
+        assert f"p{i}: getProject(id: $id{i})" in query
+        assert f"nextToken: $nextToken{i})" in query
+    assert query.count("$limit") == 4
+    assert appsync.multi_project_query(3, ("biosampleName", "size")) is query
@@ -0,0 +1,95 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from utils import appsync, appsync_async
+
+
+class FakeAppsync:
+    """Serves two pages per project and records the requests in flight"""
+
+    def __init__(self, delay: float = 0.02):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.requests = []
+
+    def __call__(self, url, token, query, variables=None, app_sync_user=None):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            self.requests.append((variables["id"], variables.get("nextToken")))
+        time.sleep(self.delay)
+        with self.lock:
+            self.in_flight -= 1
+        project_id, next_token = variables["id"], variables.get("nextToken")
+        if project_id == "missing":
+            return {"data": {"getProject": None}}
+        page = 1 if next_token else 0
+        return {
+            "data": {
+                "getProject": {
+                    "projectName": project_id,
+                    "biosamples": {
+                        "items": [{"biosampleName": f"{project_id}-{page}"}],
+                        "nextToken": None if page else "page-1",
+                    },
+                }
+            }
+        }
+
+
+@pytest.fixture
+def fake_appsync(monkeypatch):
+    fake = FakeAppsync()
+    monkeypatch.setattr(appsync, "get_user_access_token", lambda user: "token")
+    monkeypatch.setattr(appsync, "call_appsync", fake)
+    return fake
+
+
+def biosample_names(response: dict) -> list[str]:
+    return [item["biosampleName"] for item in response["biosamples"]["items"]]
+
+
+def test_fetch_projects_keeps_project_order(fake_appsync):
+    project_ids = [f"project-{i}" for i in range(5)]
+    responses = appsync_async.fetch_projects_sync(project_ids, "url", {})
+    assert [response["projectName"] for response in responses] == project_ids
+    assert [biosample_names(response) for response in responses] == [
+        [f"{project_id}-0", f"{project_id}-1"] for project_id in project_ids
+    ]
+    # pages of a project are requested one after the other
+    for project_id in project_ids:
+        tokens = [token for id_, token in fake_appsync.requests if id_ == project_id]
+        assert tokens == [None, "page-1"]
+
+
+def test_concurrency_follows_the_configured_pool_size(fake_appsync, monkeypatch):
+    monkeypatch.setattr(appsync, "APPSYNC_POOL_SIZE", 2)
+    project_ids = [f"project-{i}" for i in range(6)]
+    appsync_async.fetch_projects_sync(project_ids, "url", {})
+    assert fake_appsync.max_in_flight == 2
+
+    fake_appsync.max_in_flight = 0
+    appsync_async.fetch_projects_sync(project_ids, "url", {}, max_concurrency=10)
+    assert fake_appsync.max_in_flight == 2
+
+    fake_appsync.max_in_flight = 0
+    appsync_async.fetch_projects_sync(project_ids, "url", {}, max_concurrency=1)
+    assert fake_appsync.max_in_flight == 1
+
+
+def test_fetch_projects_sync_inside_a_running_loop(fake_appsync):
+    async def callback():
+        return appsync_async.fetch_projects_sync(["project"], "url", {})
+
+    (response,) = asyncio.run(callback())
+    assert biosample_names(response) == ["project-0", "project-1"]
+
+
+def test_unknown_project_raises(fake_appsync):
+    with pytest.raises(ValueError, match="missing not found"):
+        appsync_async.fetch_projects_sync(["project", "missing"], "url", {})
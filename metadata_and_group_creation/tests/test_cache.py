@@ -0,0 +1,198 @@
+import copy
+import json
+import threading
+from datetime import datetime, timezone
+
+from utils.cache import (
+    ProjectTableCache,
+    get_project_table,
+    get_project_table_columns,
+)
+
+
+def with_metadata_columns(project: dict, names: list[str]) -> dict:
+    project = copy.deepcopy(project)
+    project["biosampleMetadataColumns"] = json.dumps(
+        {
+            "columns": [
+                {"editable": True, "name": name, "description": "", "type": "Text"}
+                for name in names
+            ]
+        }
+    )
+    return project
+
+
+def test_concurrent_callers_wait_for_a_single_rebuild(fake_appsync):
+    fake_appsync.latency = 0.02
+    fake_appsync.add_project("project", fake_appsync.project(30))
+    cache = ProjectTableCache()
+    tables = []
+
+    def get_table():
+        tables.append(
+            get_project_table(
+                "project",
+                fake_appsync.endpoint,
+                fake_appsync.user,
+                page_size=10,
+                cache=cache,
+            )
+        )
+
+    threads = [threading.Thread(target=get_table) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # three pages of a single fetch
+    assert fake_appsync.requests == 3
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["hits"] == 3
+    assert all(row_data is tables[0][1] for _, row_data in tables)
+
+
+def test_cached_table_of_the_new_metadata_columns_is_synced(fake_appsync):
+    project = fake_appsync.project(20)
+    cache = ProjectTableCache(ttl=0)
+    fake_appsync.add_project("project", with_metadata_columns(project, ["cell_type"]))
+    _, first_rows = get_project_table(
+        "project", fake_appsync.endpoint, fake_appsync.user, cache=cache
+    )
+    fake_appsync.add_project("project", with_metadata_columns(project, ["sorted_on"]))
+    get_project_table("project", fake_appsync.endpoint, fake_appsync.user, cache=cache)
+    assert cache.stats()["misses"] == 2
+
+    # back to the first columns: their cached table is delta synced, not rebuilt
+    fake_appsync.add_project("project", with_metadata_columns(project, ["cell_type"]))
+    _, row_data = get_project_table(
+        "project", fake_appsync.endpoint, fake_appsync.user, cache=cache
+    )
+    assert cache.stats()["misses"] == 2
+    assert cache.stats()["revalidations"] == 1
+    assert row_data is first_rows
+
+
+def updated_now() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+
+def test_delta_sync_merges_changed_and_new_biosamples(fake_appsync):
+    project = fake_appsync.project(50)
+    fake_appsync.add_project("project", project)
+    cache = ProjectTableCache(ttl=0)
+    _, row_data = get_project_table(
+        "project", fake_appsync.endpoint, fake_appsync.user, page_size=20, cache=cache
+    )
+
+    project = copy.deepcopy(project)
+    items = project["biosamples"]["items"]
+    for i in (3, 7):
+        items[i]["metadata"] = json.dumps({"cell_type": f"changed-{i}"})
+        items[i]["updatedAt"] = updated_now()
+    new_item = dict(items[0], biosampleName="new-biosample", updatedAt=updated_now())
+    items.append(new_item)
+    fake_appsync.add_project("project", project)
+    requests = fake_appsync.requests
+
+    _, merged = get_project_table(
+        "project", fake_appsync.endpoint, fake_appsync.user, page_size=20, cache=cache
+    )
+    # the three changed biosamples fit in a single page
+    assert fake_appsync.requests == requests + 1
+    assert cache.stats()["delta_syncs"] == 1
+    assert list(map(lambda row: row["biosamplename"], merged)) == list(
+        map(lambda row: row["biosamplename"], row_data)
+    ) + ["new-biosample"]
+    assert merged[3]["cell_type"] == "changed-3"
+    assert merged[7]["cell_type"] == "changed-7"
+    assert merged[-1]["cell_type"] == row_data[0]["cell_type"]
+    unchanged = set(range(len(row_data))) - {3, 7}
+    assert all(merged[i] is row_data[i] for i in unchanged)
+
+
+def test_delta_sync_without_changes_revalidates(fake_appsync):
+    fake_appsync.add_project("project", fake_appsync.project(50))
+    cache = ProjectTableCache(ttl=0)
+    _, row_data = get_project_table(
+        "project", fake_appsync.endpoint, fake_appsync.user, cache=cache
+    )
+    requests = fake_appsync.requests
+    _, synced = get_project_table(
+        "project", fake_appsync.endpoint, fake_appsync.user, cache=cache
+    )
+    assert synced is row_data
+    assert fake_appsync.requests == requests + 1
+    assert cache.stats()["revalidations"] == 1
+
+
+def test_tables_past_max_age_drop_deleted_biosamples(fake_appsync):
+    project = fake_appsync.project(30)
+    fake_appsync.add_project("project", project)
+    cache = ProjectTableCache(ttl=0)
+    get_project_table("project", fake_appsync.endpoint, fake_appsync.user, cache=cache)
+    deleted = project["biosamples"]["items"].pop(4)["biosampleName"]
+
+    # a delta sync only sees updated biosamples
+    _, row_data = get_project_table(
+        "project", fake_appsync.endpoint, fake_appsync.user, cache=cache
+    )
+    assert deleted in map(lambda row: row["biosamplename"], row_data)
+    assert cache.stats()["misses"] == 1
+
+    cache.max_age = 0
+    _, row_data = get_project_table(
+        "project", fake_appsync.endpoint, fake_appsync.user, cache=cache
+    )
+    assert cache.stats()["misses"] == 2
+    assert len(row_data) == 29
+    assert deleted not in map(lambda row: row["biosamplename"], row_data)
+
+
+def test_delta_sync_casts_changed_rows_to_the_table_types(fake_appsync):
+    project = fake_appsync.project(30)
+    for item in project["biosamples"]["items"]:
+        item["metadata"] = json.dumps({"batch": "1", "cell_type": "K562"})
+    fake_appsync.add_project("project", project)
+    cache = ProjectTableCache(ttl=0)
+    _, row_data = get_project_table(
+        "project", fake_appsync.endpoint, fake_appsync.user, cache=cache
+    )
+    assert row_data[0]["batch"] == 1
+
+    project = copy.deepcopy(project)
+    items = project["biosamples"]["items"]
+    items[4]["metadata"] = json.dumps({"batch": "2", "cell_type": "K562"})
+    items[4]["updatedAt"] = updated_now()
+    fake_appsync.add_project("project", project)
+    _, merged = get_project_table(
+        "project", fake_appsync.endpoint, fake_appsync.user, cache=cache
+    )
+    assert merged[4]["batch"] == 2
+    assert all(type(row["batch"]) is int for row in merged)
+
+    # the same table as a full rebuild
+    _, rebuilt = get_project_table(
+        "project", fake_appsync.endpoint, fake_appsync.user, cache=ProjectTableCache()
+    )
+    assert merged == rebuilt
+
+
+def test_lazy_columns_are_cast_like_the_full_table(fake_appsync):
+    project = fake_appsync.project(30)
+    for i, item in enumerate(project["biosamples"]["items"]):
+        item["metadata"] = json.dumps({"batch": str(i % 4)})
+    fake_appsync.add_project("project", project)
+    cache = ProjectTableCache()
+    get_project_table(
+        "project",
+        fake_appsync.endpoint,
+        fake_appsync.user,
+        fields=["size"],
+        cache=cache,
+    )
+    _, row_data = get_project_table_columns(
+        "project", fake_appsync.endpoint, fake_appsync.user, ["batch"], cache=cache
+    )
+    assert [row["batch"] for row in row_data[:5]] == [0, 1, 2, 3, 0]
@@ -0,0 +1,76 @@
+import dataclasses
+import json
+
+import pytest
+
+from utils import codec
+from utils.codec import JsonCodec, available_backends
+
+DOCUMENTS = [
+    '{"cell_type": "HEK293", "concentration": 96.78, "passed_qc": "false"}',
+    "{}",
+    ' {"nested": {"list": [1, 2.5, null, true]}} ',
+    '"text"',
+    "3",
+    '{"unicode": "\\u00e9t\\u00e9"}',
+]
+
+
+@pytest.fixture(params=available_backends())
+def json_codec(request) -> JsonCodec:
+    return JsonCodec(request.param)
+
+
+def test_decode_batch_matches_documents_decoded_one_by_one(json_codec):
+    assert json_codec.decode_batch(DOCUMENTS) == list(map(json.loads, DOCUMENTS))
+    assert json_codec.decode_batch([]) == []
+
+
+@pytest.mark.parametrize(
+    "documents",
+    [
+        ["1,2", "[3", "4]"],
+        ['{"a": 1}', '{"b": 2}, {"c": 3}'],
+        ['{"a": 1} trailing'],
+        [""],
+    ],
+)
+def test_decode_batch_rejects_documents_that_are_not_json_alone(json_codec, documents):
+    with pytest.raises(ValueError):
+        json_codec.decode_batch(documents)
+
+
+@dataclasses.dataclass
+class Metadata:
+    cell_type: str
+    concentration: float
+
+
+def test_decode_batch_into_a_type(json_codec):
+    documents = [
+        '{"cell_type": "HEK293", "concentration": 96.78}',
+        '{"cell_type": "K562", "concentration": 3.5}',
+    ]
+    assert json_codec.decode_batch(documents, type=Metadata) == [
+        Metadata("HEK293", 96.78),
+        Metadata("K562", 3.5),
+    ]
+
+
+def test_dumps_round_trips(json_codec):
+    value = {"size": 1.5, "reads": 3, "names": ["a", "é"], "empty": None}
+    assert isinstance(json_codec.dumps(value), bytes)
+    assert json_codec.loads(json_codec.dumps(value)) == value
+    assert json_codec.loads(json_codec.dumps(value).decode("utf-8")) == value
+
+
+def test_set_json_backend():
+    backend = codec.codec.backend
+    try:
+        codec.set_json_backend("json")
+        assert codec.codec.backend == "json"
+        assert codec.decode_batch(["[1]", "{}"]) == [[1], {}]
+    finally:
+        codec.set_json_backend(backend)
+    with pytest.raises(ValueError, match="Unknown json backend"):
+        JsonCodec("yaml")
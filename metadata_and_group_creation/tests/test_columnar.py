@@ -0,0 +1,282 @@
+import copy
+import json
+import logging
+import random
+
+import numpy as np
+import pytest
+
+from utils.appsync_stub import EXAMPLE_RESPONSE, synthetic_project
+from utils.columnar import (
+    CategoricalColumn,
+    ColumnarTable,
+    NumberColumn,
+    create_column_defs_and_row_data_columnar,
+)
+from utils.data import (
+    create_column_defs_and_row_data,
+    create_column_defs_and_row_data_from_pages,
+)
+from utils import parallel
+from utils.parallel import shutdown_transform_pool, transform_pages_parallel
+
+
+def typed_rows(row_data: list[dict]) -> list[list[tuple]]:
+    # keys in order, values and their types (1 and 1.0 compare equal)
+    return [
+        [(key, value, type(value)) for key, value in row.items()] for row in row_data
+    ]
+
+
+def assert_same_table(pages: list[dict]):
+    column_defs, row_data = create_column_defs_and_row_data_from_pages(
+        copy.deepcopy(pages)
+    )
+    columnar_defs, columnar_rows = create_column_defs_and_row_data_columnar(
+        copy.deepcopy(pages)
+    )
+    assert columnar_defs == column_defs
+    assert typed_rows(columnar_rows) == typed_rows(row_data)
+    table = ColumnarTable.from_pages(copy.deepcopy(pages))
+    assert typed_rows(map(dict, table.rows())) == typed_rows(row_data)
+
+
+def paginate(project: dict, page_size: int) -> list[dict]:
+    items = project["biosamples"]["items"]
+    return [
+        {
+            "biosampleMetadataColumns": project["biosampleMetadataColumns"],
+            "biosamples": {"items": items[start : start + page_size]},
+        }
+        for start in range(0, len(items), page_size)
+    ]
+
+
+def project_fields(project: dict, fields: list[str]) -> dict:
+    project = copy.deepcopy(project)
+    project["biosamples"]["items"] = [
+        {field: item[field] for field in fields}
+        for item in project["biosamples"]["items"]
+    ]
+    return project
+
+
+with open(EXAMPLE_RESPONSE) as f:
+    EXAMPLE_PROJECT = json.load(f)
+
+
+def test_example_project():
+    assert_same_table(paginate(EXAMPLE_PROJECT, 7))
+
+
+def test_synthetic_project_keeps_raw_fields():
+    project = synthetic_project(500)
+    assert_same_table(paginate(project, 128))
+    _, row_data = create_column_defs_and_row_data_columnar(paginate(project, 128))
+    assert row_data[0]["updatedat"] == project["biosamples"]["items"][0]["updatedAt"]
+
+
+@pytest.mark.parametrize(
+    "fields",
+    [
+        ["biosampleName", "size"],
+        ["biosampleName", "r1FastqTotalReads", "metadata"],
+        ["biosampleName", "created", "metadata", "r2FastqTotalReads"],
+        ["biosampleName", "lotId", "r1FastqLength", "updatedAt"],
+    ],
+)
+def test_projected_fields(fields):
+    assert_same_table(paginate(project_fields(synthetic_project(100), fields), 30))
+
+
+def test_metadata_key_order_of_each_biosample():
+    project = synthetic_project(200, seed=3)
+    rng = random.Random(0)
+    for item in project["biosamples"]["items"]:
+        metadata = list(json.loads(item["metadata"]).items())
+        rng.shuffle(metadata)
+        # some biosamples lack keys, others have keys of their own
+        metadata = metadata[: rng.randint(1, len(metadata))]
+        if rng.random() < 0.2:
+            metadata.append(("size", "override"))
+        if rng.random() < 0.2:
+            metadata.insert(0, (f"extra_{rng.randint(0, 3)}", rng.randint(0, 9)))
+        item["metadata"] = json.dumps(dict(metadata))
+    assert_same_table(paginate(project, 64))
+
+
+@pytest.mark.parametrize("integer_pages", [{0, 1, 2}, {0, 2}, {1}])
+def test_integer_sizes(integer_pages):
+    # sizes of some pages stored as integers (e.g. by a sqlite snapshot)
+    project = copy.deepcopy(EXAMPLE_PROJECT)
+    for i, item in enumerate(project["biosamples"]["items"]):
+        if i // 10 in integer_pages and item["size"] is not None:
+            item["size"] = int(item["size"])
+    pages = paginate(project, 10)
+    assert len(pages) > max(integer_pages)
+    assert_same_table(pages)
+    _, row_data = create_column_defs_and_row_data_columnar(pages)
+    assert {type(row["size"]) for row in row_data} <= {float, type(None)}
+
+
+def with_undeclared_metadata(project: dict, seed: int = 0) -> dict:
+    # json strings of numbers, booleans and dates in metadata keys without a type
+    project = copy.deepcopy(project)
+    rng = random.Random(seed)
+    for i, item in enumerate(project["biosamples"]["items"]):
+        metadata = json.loads(item["metadata"])
+        metadata["batch"] = str(rng.randint(1, 9))
+        metadata["rerun"] = rng.choice(["true", "false", "TRUE"])
+        metadata["prepared_on"] = f"2023-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}"
+        if i % 3:
+            metadata["dilution"] = rng.choice(["0.5", "1", "2.25", ""])
+        item["metadata"] = json.dumps(metadata)
+    return project
+
+
+def test_undeclared_metadata_is_cast_by_both_transforms():
+    project = with_undeclared_metadata(synthetic_project(300))
+    assert_same_table(paginate(project, 64))
+    _, row_data = create_column_defs_and_row_data_from_pages(paginate(project, 64))
+    assert type(row_data[0]["batch"]) is int
+    assert row_data[0]["rerun"] in ("true", "false")
+    assert row_data[0]["prepared_on"].startswith("2023-")
+
+
+def test_declared_columns_report_values_that_cannot_be_cast(caplog):
+    project = synthetic_project(40)
+    items = project["biosamples"]["items"]
+    for i, key, value in [
+        (3, "concentration", "n/a"),
+        (17, "concentration", "n/a"),
+        (5, "sorted_on", "not a date"),
+    ]:
+        metadata = json.loads(items[i]["metadata"])
+        metadata[key] = value
+        items[i]["metadata"] = json.dumps(metadata)
+    pages = paginate(project, 16)
+    assert_same_table(pages)
+
+    for transform in [
+        create_column_defs_and_row_data_from_pages,
+        create_column_defs_and_row_data_columnar,
+    ]:
+        caplog.clear()
+        with caplog.at_level(logging.WARNING, logger="utils.coercion"):
+            _, row_data = transform(copy.deepcopy(pages))
+        assert row_data[3]["concentration"] is None
+        assert row_data[17]["concentration"] is None
+        assert row_data[5]["sorted_on"] is None
+        assert isinstance(row_data[4]["concentration"], float)
+        assert sorted(caplog.messages) == [
+            "1 values of metadata column sorted_on could not be cast to Date, "
+            "e.g. ['not a date']",
+            "2 values of metadata column concentration could not be cast to Number, "
+            "e.g. ['n/a']",
+        ]
+
+
+def test_parallel_transform_matches_columnar():
+    project = with_undeclared_metadata(synthetic_project(400), seed=1)
+    pages = paginate(project, 50)
+    columnar_defs, columnar_rows = create_column_defs_and_row_data_columnar(
+        copy.deepcopy(pages)
+    )
+    column_defs, row_data, types = transform_pages_parallel(
+        copy.deepcopy(pages), max_workers=1, min_biosamples=100
+    )
+    assert column_defs == columnar_defs
+    assert typed_rows(row_data) == typed_rows(columnar_rows)
+    assert types == ColumnarTable.from_pages(copy.deepcopy(pages)).types
+    assert types["batch"] == "Number"
+    shutdown_transform_pool()
+
+
+def test_parallel_transform_in_worker_process(monkeypatch):
+    # a transform running in a worker stays in-process but keeps every page
+    pages = paginate(synthetic_project(400), 50)
+    _, columnar_rows = create_column_defs_and_row_data_columnar(copy.deepcopy(pages))
+    monkeypatch.setattr(parallel.multiprocessing, "parent_process", object)
+    monkeypatch.setattr(parallel, "transform_pool", None)
+    _, row_data, _ = transform_pages_parallel(
+        copy.deepcopy(pages), max_workers=1, min_biosamples=100
+    )
+    assert typed_rows(row_data) == typed_rows(columnar_rows)
+
+
+def test_single_response_transform():
+    column_defs, row_data = create_column_defs_and_row_data(
+        copy.deepcopy(EXAMPLE_PROJECT)
+    )
+    columnar_defs, columnar_rows = create_column_defs_and_row_data_columnar(
+        [copy.deepcopy(EXAMPLE_PROJECT)]
+    )
+    assert columnar_defs == column_defs
+    assert typed_rows(columnar_rows) == typed_rows(row_data)
+
+
+def test_project_without_biosamples():
+    project = project_fields(EXAMPLE_PROJECT, [])
+    project["biosamples"]["items"] = []
+    assert_same_table([project])
+
+
+def test_row_views():
+    table = ColumnarTable.from_pages(paginate(EXAMPLE_PROJECT, 8))
+    row_data = table.to_row_data()
+    assert len(table) == len(row_data)
+    for i, row in enumerate(row_data):
+        view = table.row(i)
+        assert list(view) == list(row)
+        assert dict(view) == row
+    with pytest.raises(KeyError):
+        table.row(0)["not a column"]
+
+
+def test_repeated_values_are_dictionary_encoded():
+    values = ["Pass", "Pass", "Missing FASTQs", "Pass", ""] * 20
+    column = CategoricalColumn.encode(values)
+    assert isinstance(column, CategoricalColumn)
+    assert column.to_list() == values
+    assert column.get(2) == "Missing FASTQs"
+    # numbers and (mostly) distinct values are left as they are
+    assert CategoricalColumn.encode([1, 1.0, True, 1] * 5) == [1, 1.0, True, 1] * 5
+    distinct = list(map(str, range(10)))
+    assert CategoricalColumn.encode(distinct) is distinct
+
+
+def test_table_dictionary_encodes_low_cardinality_columns():
+    table = ColumnarTable.from_pages([synthetic_project(500)])
+    status = table.columns["fastq validation status"]
+    assert isinstance(status, CategoricalColumn)
+    assert status.codes.dtype == np.uint8
+    assert sorted(status.categories) == ["Missing FASTQs", "Pass"]
+    # biosample names are distinct, they stay a list
+    assert isinstance(table.columns["biosamplename"], list)
+    # rows share the interned category
+    values = list(map(lambda row: row["fastq validation status"], table.rows()))
+    assert values == status.to_list()
+    assert values[0] is next(value for value in values[1:] if value == values[0])
+    assert (
+        table.to_row_data()
+        == create_column_defs_and_row_data_columnar([synthetic_project(500)])[1]
+    )
+    # a byte per row (and the categories) instead of a pointer per row
+    assert status.nbytes() < 8 * len(table)
+
+
+def test_category_codes_widen_with_the_categories():
+    values = list(map(lambda i: f"lot-{i % 300}", range(3000)))
+    column = CategoricalColumn.encode(values)
+    assert column.codes.dtype == np.uint16
+    assert column.to_list() == values
+    assert column.get(299) == "lot-299"
+    assert CategoricalColumn.encode([["unhashable"]] * 10) == [["unhashable"]] * 10
+
+
+def test_number_columns_keep_nulls():
+    column = NumberColumn.from_list([3, None, 5])
+    assert column.values.dtype == np.int64
+    assert column.to_list() == [3, None, 5]
+    assert NumberColumn.from_list([1.5, None]).to_list() == [1.5, None]
+    assert NumberColumn.concatenate([column, column]).to_list() == [3, None, 5] * 2
@@ -0,0 +1,53 @@
+import copy
+
+from utils.appsync_stub import synthetic_project
+from utils.cache import ProjectTableCache, get_project_table
+from utils.data import (
+    column_defs_fingerprint,
+    create_column_def,
+    create_column_defs,
+    registered_column_def,
+)
+
+
+def test_registered_column_defs_are_copies():
+    column_def = registered_column_def("sorted_on", "Date")
+    assert column_def == create_column_def("sorted_on", "Date")
+    column_def["hide"] = True
+    column_def["filterParams"]["browserDatePicker"] = False
+    column_def["menuTabs"].append("changed")
+    assert registered_column_def("sorted_on", "Date") == create_column_def(
+        "sorted_on", "Date"
+    )
+    # additions are part of the definition
+    pinned = registered_column_def("sorted_on", "Date", {"pinned": "left"})
+    assert pinned["pinned"] == "left"
+    assert "pinned" not in registered_column_def("sorted_on", "Date")
+
+
+def test_fingerprint_ignores_hidden_columns():
+    project = synthetic_project(1)
+    mandatory, metadata = create_column_defs(project["biosampleMetadataColumns"])
+    column_defs = mandatory + metadata
+    fingerprint = column_defs_fingerprint(column_defs)
+    hidden = copy.deepcopy(column_defs)
+    hidden[2]["hide"] = True
+    assert column_defs_fingerprint(hidden) == fingerprint
+    assert column_defs_fingerprint(column_defs[:-1]) != fingerprint
+    retyped = copy.deepcopy(column_defs)
+    retyped[-1] = create_column_def(retyped[-1]["field"], "Text")
+    assert column_defs_fingerprint(retyped) != fingerprint
+
+
+def test_cached_tables_hand_out_column_def_copies(stub):
+    stub.add_project("project", synthetic_project(10))
+    cache = ProjectTableCache()
+    column_defs, _ = get_project_table("project", stub.endpoint, stub.user, cache=cache)
+    fingerprint = column_defs_fingerprint(column_defs)
+    for column_def in column_defs:
+        column_def["hide"] = True
+        column_def["headerName"] = "changed"
+    cached_defs, _ = get_project_table("project", stub.endpoint, stub.user, cache=cache)
+    assert cache.stats()["hits"] == 1
+    assert column_defs_fingerprint(cached_defs) == fingerprint
+    assert not any(column_def.get("hide") for column_def in cached_defs)
@@ -0,0 +1,44 @@
+import pytest
+
+from utils import dates
+
+
+@pytest.fixture(autouse=True)
+def clear_date_cache():
+    dates.parse_iso_date.cache_clear()
+    yield
+    dates.parse_iso_date.cache_clear()
+
+
+def test_iso_dates():
+    assert (
+        dates.iso_date("2023-10-17T08:34:27.211Z") == "2023-10-17T08:34:27.211000+00:00"
+    )
+    assert dates.iso_date("2023-10-17") == "2023-10-17T00:00:00"
+    assert dates.iso_date("10/17/2023") == "2023-10-17T00:00:00"
+
+
+def test_failed_parses_are_memoized(monkeypatch):
+    calls = []
+    to_datetime = dates.to_datetime
+    monkeypatch.setattr(
+        dates, "to_datetime", lambda value: calls.append(value) or to_datetime(value)
+    )
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            dates.iso_date("not a date")
+        assert dates.normalize_date("not a date") == "not a date"
+        assert dates.normalize_date_value("2023-13-45") == "2023-13-45"
+    assert calls == ["not a date", "2023-13-45"]
+
+
+def test_normalize_date_column():
+    values = ["2023-01-02", None, "n/a", "2023-01-02", "", 5]
+    assert dates.normalize_date_column(values) == [
+        "2023-01-02T00:00:00",
+        None,
+        "n/a",
+        "2023-01-02T00:00:00",
+        "",
+        5,
+    ]
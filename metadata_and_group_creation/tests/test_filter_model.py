@@ -0,0 +1,199 @@
+import random
+
+import pytest
+
+from utils.filter_model import FILTER_VALUE_COLUMNS
+from utils.row_model import filter_rows
+
+NUMBER_OPTIONS = [
+    "equals",
+    "notEqual",
+    "lessThan",
+    "lessThanOrEqual",
+    "greaterThan",
+    "greaterThanOrEqual",
+    "inRange",
+    "blank",
+    "notBlank",
+]
+TEXT_OPTIONS = [
+    "equals",
+    "notEqual",
+    "contains",
+    "notContains",
+    "startsWith",
+    "endsWith",
+    "blank",
+    "notBlank",
+]
+
+
+def random_rows(count: int, seed: int = 0) -> list[dict]:
+    generator = random.Random(seed)
+    return [
+        {
+            "biosamplename": f"sample-{i}",
+            "batch": generator.choice([None, "", 0, 1, 2, 2.5, 7, "3", "x"]),
+            "size": i * 1000,
+            "size mb": generator.choice([None, 0.5, 1.0, 2.25]),
+            "updated": generator.choice(
+                [None, "", "2023-01-01T10:00:00", "2023-01-02", "2023-01-03T00:00:00Z"]
+            ),
+            "tissue": generator.choice([None, "", "Blood", "bone marrow", "BLOOD"]),
+        }
+        for i in range(count)
+    ]
+
+
+def random_condition(generator: random.Random, filter_type: str) -> dict:
+    # operands are left out now and then, ag grid sends such conditions while typing
+    if filter_type == "text":
+        return {
+            "filterType": "text",
+            "type": generator.choice(TEXT_OPTIONS),
+            "filter": generator.choice([None, "blood", "b", "marrow", "x"]),
+        }
+    option = generator.choice(NUMBER_OPTIONS)
+    if filter_type == "number":
+        return {
+            "filterType": "number",
+            "type": option,
+            "filter": generator.choice([None, 0, 1, 2, 2.5]),
+            "filterTo": generator.choice([None, 1, 2.5, 7]),
+        }
+    return {
+        "filterType": "date",
+        "type": option,
+        "dateFrom": generator.choice(
+            [None, "2023-01-01 00:00:00", "2023-01-02 00:00:00"]
+        ),
+        "dateTo": generator.choice([None, "2023-01-03 00:00:00"]),
+    }
+
+
+def random_filter_model(generator: random.Random) -> dict:
+    columns = {"batch": "number", "size": "number", "updated": "date", "tissue": "text"}
+    filter_model = {}
+    for column in generator.sample(sorted(columns), generator.randint(1, 3)):
+        if generator.random() < 0.5:
+            filter_model[column] = random_condition(generator, columns[column])
+        else:
+            filter_model[column] = {
+                "filterType": columns[column],
+                "operator": generator.choice(["AND", "OR"]),
+                "conditions": [
+                    random_condition(generator, columns[column]),
+                    random_condition(generator, columns[column]),
+                ],
+            }
+    return filter_model
+
+
+def as_number(value):
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def scan_condition(value, condition: dict):
+    # whether the cell passes, None when the condition is not applied
+    option = condition["type"]
+    if option == "blank":
+        return value is None or value == ""
+    if option == "notBlank":
+        return not (value is None or value == "")
+    if condition["filterType"] == "text":
+        if condition.get("filter") is None:
+            return None
+        if value is None:
+            return option in ("notEqual", "notContains")
+        text, filter_text = str(value).lower(), condition["filter"].lower()
+        return {
+            "equals": text == filter_text,
+            "notEqual": text != filter_text,
+            "contains": filter_text in text,
+            "notContains": filter_text not in text,
+            "startsWith": text.startswith(filter_text),
+            "endsWith": text.endswith(filter_text),
+        }[option]
+    if condition["filterType"] == "number":
+        low, high = condition.get("filter"), condition.get("filterTo")
+        cell = as_number(value)
+    else:
+        low, high = condition.get("dateFrom"), condition.get("dateTo")
+        low, high = low and low[:10], high and high[:10]
+        cell = value[:10] if value else None
+    if low is None or (option == "inRange" and high is None):
+        return None
+    if cell is None:
+        return False
+    return {
+        "equals": cell == low,
+        "notEqual": cell != low,
+        "lessThan": cell < low,
+        "lessThanOrEqual": cell <= low,
+        "greaterThan": cell > low,
+        "greaterThanOrEqual": cell >= low,
+        "inRange": option == "inRange" and low < cell < high,
+    }[option]
+
+
+def scan(row_data: list[dict], filter_model: dict) -> list[dict]:
+    def passes(row, column, column_model):
+        value = row.get(FILTER_VALUE_COLUMNS.get(column, column))
+        conditions = column_model.get("conditions") or [column_model]
+        results = [
+            result
+            for result in (
+                scan_condition(value, {"filterType": column_model["filterType"], **c})
+                for c in conditions
+            )
+            if result is not None
+        ]
+        if not results:
+            return True
+        return all(results) if column_model.get("operator") == "AND" else any(results)
+
+    return [
+        row
+        for row in row_data
+        if all(passes(row, column, model) for column, model in filter_model.items())
+    ]
+
+
+def test_filter_rows_matches_a_scan():
+    row_data = random_rows(300)
+    generator = random.Random(1)
+    for _ in range(300):
+        filter_model = random_filter_model(generator)
+        assert filter_rows(row_data, filter_model) == scan(row_data, filter_model)
+
+
+@pytest.mark.parametrize(
+    "column_model",
+    [
+        {"filterType": "number", "type": "equals", "filter": None},
+        {"filterType": "number", "type": "inRange", "filter": 1, "filterTo": None},
+        {"filterType": "number", "type": "greaterThan"},
+        {"filterType": "date", "type": "lessThan", "dateFrom": None},
+        {"filterType": "date", "type": "inRange", "dateFrom": "2023-01-01 00:00:00"},
+        {"filterType": "text", "type": "contains", "filter": None},
+    ],
+)
+def test_conditions_missing_operands_are_not_applied(column_model):
+    row_data = random_rows(50)
+    column = {"number": "batch", "date": "updated", "text": "tissue"}[
+        column_model["filterType"]
+    ]
+    assert filter_rows(row_data, {column: column_model}) == row_data
+    # the other condition of a combined model still applies
+    combined = {
+        "filterType": column_model["filterType"],
+        "operator": "AND",
+        "conditions": [column_model, {"type": "notBlank"}],
+    }
+    not_blank = [row for row in row_data if row[column] not in (None, "")]
+    assert filter_rows(row_data, {column: combined}) == not_blank
@@ -0,0 +1,81 @@
+import operator
+import random
+
+import numpy as np
+import pytest
+
+from utils.groups import BiosampleIndex, Group, biosample_index, select_groups
+
+# set operations of groups and the python sets they must match
+SET_OPERATIONS = [operator.or_, operator.and_, operator.sub, operator.xor]
+
+
+def random_positions(generator: random.Random, size: int) -> set[int]:
+    return set(generator.sample(range(size), generator.randint(0, size)))
+
+
+def group_of(positions: set[int], size: int) -> Group:
+    return Group.from_positions(np.array(sorted(positions), dtype=np.int64), size)
+
+
+# sizes around the byte boundaries of the bitsets (padding bits must stay unset)
+@pytest.mark.parametrize("size", [0, 1, 7, 8, 9, 64, 100])
+def test_group_set_operations_match_sets(size):
+    generator = random.Random(size)
+    for _ in range(50):
+        a, b = random_positions(generator, size), random_positions(generator, size)
+        for operation in SET_OPERATIONS:
+            group = operation(group_of(a, size), group_of(b, size))
+            expected = operation(a, b)
+            assert group.positions().tolist() == sorted(expected)
+            assert len(group) == len(expected)
+            assert group.mask().tolist() == [i in expected for i in range(size)]
+            assert group == group_of(expected, size)
+
+
+def test_group_equality_and_empty():
+    assert Group.empty(10) == group_of(set(), 10)
+    assert len(Group.empty(10)) == 0
+    assert group_of({1}, 10) != group_of({2}, 10)
+    # same positions over indexes of different sizes are different groups
+    assert group_of({1}, 10) != group_of({1}, 11)
+    assert group_of({1}, 10) != {1}
+
+
+def test_group_operations_of_different_indexes():
+    for operation in SET_OPERATIONS:
+        with pytest.raises(ValueError):
+            operation(group_of({1}, 10), group_of({1}, 11))
+
+
+def test_biosample_index():
+    names = [f"sample-{i}" for i in range(20)]
+    row_data = [{"biosamplename": name, "n": i} for i, name in enumerate(names)]
+    index = BiosampleIndex.from_row_data(row_data)
+    assert len(index) == 20
+    # names missing from the table are left out, duplicates count once
+    group = index.group(["sample-3", "missing", "sample-1", "sample-3"])
+    assert group.positions().tolist() == [1, 3]
+    assert index.names(group) == ["sample-1", "sample-3"]
+    assert index.rows(group, row_data) == [row_data[1], row_data[3]]
+    assert index.union([]) == Group.empty(20)
+    assert index.names(
+        index.union([index.group(["sample-5"]), index.group(["sample-2", "sample-5"])])
+    ) == ["sample-2", "sample-5"]
+    assert biosample_index(row_data) is biosample_index(row_data)
+
+
+def test_select_groups():
+    row_data = [{"biosamplename": f"sample-{i}"} for i in range(30)]
+    group_store = {
+        "a": ["sample-9", "sample-2"],
+        "b": ["sample-2", "sample-20", "deleted"],
+        "c": ["sample-29"],
+    }
+    assert select_groups(row_data, group_store, ["a", "b"]) == [
+        "sample-2",
+        "sample-9",
+        "sample-20",
+    ]
+    assert select_groups(row_data, group_store, ["c"]) == ["sample-29"]
+    assert select_groups(row_data, group_store, []) == []
@@ -0,0 +1,253 @@
+import json
+
+import pytest
+
+pytest.importorskip("dash_design_kit")
+
+from dash import Dash  # noqa: E402
+
+from layout.group_selection import (  # noqa: E402
+    get_biosample_id_column as get_group_id_column,
+)
+from layout.main import get_components  # noqa: E402
+from layout.metadata_and_group_creation import (  # noqa: E402
+    BASE_ID,
+    GROUP_SELECTION_BASE_ID,
+    get_selected_biosamples_store_id,
+    get_session_store_id,
+    get_table_fields_store_id,
+    get_table_refresh_store_id,
+)
+from utils.appsync_stub import EXAMPLE_RESPONSE  # noqa: E402
+from utils.sources import JsonFileSource  # noqa: E402
+from utils.table_store import table_store  # noqa: E402
+
+TABLE_ID = BASE_ID + "table"
+
+
+def create_client(row_model: str = None):
+    """
+    Returns a test client of an app showing the example project (json snapshot)
+    and the data of its table fields store
+    """
+    payload = {
+        "project_id": "project",
+        "source": {"type": "json", "path": EXAMPLE_RESPONSE},
+        "columns": ["biosamplename", "size"],
+        "row_model": row_model,
+    }
+    app = Dash(__name__)
+    main_view, import_callbacks, _ = get_components()
+    app.layout = main_view(payload)
+    import_callbacks(app)
+    client = app.server.test_client()
+    layout = json.loads(client.get("/_dash-layout").data)
+    return client, find_props(layout, get_table_fields_store_id())["data"]
+
+
+def find_props(node, id: str) -> dict:
+    if isinstance(node, dict):
+        if node.get("props", {}).get("id") == id:
+            return node["props"]
+        return next(filter(None, (find_props(v, id) for v in node.values())), None)
+    if isinstance(node, list):
+        return next(filter(None, (find_props(v, id) for v in node)), None)
+    return None
+
+
+def call_callback(
+    client, outputs: list, inputs: list, state: list, changed: int = 0
+) -> dict:
+    """
+    Calls a callback like the browser does (after the input at index CHANGED
+    changed, None for the initial call), returns the updated properties by id
+    (None when nothing is updated)
+    """
+    outputs = list(
+        map(lambda output: {"id": output[0], "property": output[1]}, outputs)
+    )
+    response = client.post(
+        "/_dash-update-component",
+        json={
+            # a single output is sent on its own
+            "output": (
+                "{id}.{property}".format(**outputs[0])
+                if len(outputs) == 1
+                else "..{}..".format(
+                    "...".join(map(lambda o: f"{o['id']}.{o['property']}", outputs))
+                )
+            ),
+            "outputs": outputs[0] if len(outputs) == 1 else outputs,
+            "inputs": list(
+                map(lambda i: {"id": i[0], "property": i[1], "value": i[2]}, inputs)
+            ),
+            "state": list(
+                map(lambda s: {"id": s[0], "property": s[1], "value": s[2]}, state)
+            ),
+            "changedPropIds": (
+                []
+                if changed is None
+                else [f"{inputs[changed][0]}.{inputs[changed][1]}"]
+            ),
+        },
+    )
+    assert response.status_code in (200, 204), response.data
+    if response.status_code == 204:
+        return None
+    return json.loads(response.data)["response"]
+
+
+def select_groups(client, table_fields: dict, session: dict, group_store, groups):
+    return call_callback(
+        client,
+        [
+            (BASE_ID + "groups_checkbox_group", "children"),
+            (BASE_ID + "groups_checkbox_group", "value"),
+            (TABLE_ID, "selectedRows"),
+        ],
+        [
+            (BASE_ID + "all_groups_checkbox", "checked", False),
+            (BASE_ID + "groups_checkbox_group", "value", groups),
+            (BASE_ID + "group_store", "data", group_store),
+        ],
+        [
+            (BASE_ID + "group_name_input", "value", None),
+            (get_table_fields_store_id(), "data", table_fields),
+            (get_session_store_id(), "data", session),
+        ],
+        changed=1,
+    )
+
+
+def test_selected_groups_select_rows_by_id():
+    client, table_fields = create_client()
+    session = {"handle": table_store.new_handle()}
+    with open(EXAMPLE_RESPONSE) as f:
+        names = list(
+            map(lambda item: item["biosampleName"], json.load(f)["biosamples"]["items"])
+        )
+    group_store = {"first": names[:3], "last": names[-2:] + ["missing"]}
+
+    response = select_groups(client, table_fields, session, group_store, ["last"])
+    assert response[TABLE_ID] == {"selectedRows": {"ids": names[-2:]}}
+    assert response[BASE_ID + "groups_checkbox_group"]["value"] == ["last"]
+
+    # the union of the groups, in row order
+    response = select_groups(
+        client, table_fields, session, group_store, ["last", "first"]
+    )
+    assert response[TABLE_ID]["selectedRows"]["ids"] == names[:3] + names[-2:]
+
+    response = select_groups(client, table_fields, session, group_store, [])
+    assert response[TABLE_ID]["selectedRows"] == {"ids": []}
+
+
+def enable_columns(client, table_fields: dict, session: dict, custom_columns, grid):
+    return call_callback(
+        client,
+        [
+            (TABLE_ID, "rowData"),
+            (TABLE_ID, "columnDefs"),
+            (get_table_fields_store_id(), "data"),
+            (get_table_refresh_store_id(), "data"),
+        ],
+        [
+            (BASE_ID + "basejumper_column_checkbox_group", "value", ["biosamplename"]),
+            (BASE_ID + "custom_column_checkbox_group", "value", custom_columns),
+        ],
+        [
+            (get_table_fields_store_id(), "data", table_fields),
+            (get_session_store_id(), "data", session),
+            (TABLE_ID, "columnDefs", []),
+            (TABLE_ID, "rowModelType", grid),
+            (get_table_refresh_store_id(), "data", 0),
+        ],
+    )
+
+
+@pytest.mark.parametrize("grid", [None, "infinite"])
+def test_enabled_columns_refresh_the_grid(grid):
+    client, table_fields = create_client()
+    session = {"handle": table_store.new_handle()}
+    response = enable_columns(client, table_fields, session, ["new_excel_column"], grid)
+    assert "metadata" in response[get_table_fields_store_id()]["data"]["fields"]
+    if grid == "infinite":
+        # the rows stay on the server, the grid requests its blocks again
+        assert TABLE_ID not in response or "rowData" not in response[TABLE_ID]
+        assert response[get_table_refresh_store_id()] == {"data": 1}
+    else:
+        row_data = response[TABLE_ID]["rowData"]
+        assert all("metadata" in row for row in row_data)
+        assert any("new_excel_column" in row for row in row_data)
+        assert get_table_refresh_store_id() not in response
+    assert "metadata" in table_store.get(session["handle"])["fields"]
+
+
+def add_group(client, table_fields: dict, session: dict, changed: int = None):
+    return call_callback(
+        client,
+        [
+            (BASE_ID + "group_store", "data"),
+            (GROUP_SELECTION_BASE_ID + "table", "rowData"),
+        ],
+        [
+            (BASE_ID + "create_edit_group_button", "n_clicks", None),
+            (get_session_store_id(), "data", session),
+        ],
+        [
+            (BASE_ID + "group_name_input", "value", None),
+            (get_selected_biosamples_store_id(), "data", []),
+            (BASE_ID + "group_store", "data", {}),
+            (get_table_fields_store_id(), "data", table_fields),
+        ],
+        changed=changed,
+    )
+
+
+def test_callbacks_wait_for_the_session_handle(monkeypatch):
+    client, table_fields = create_client()
+    builds = []
+    table = JsonFileSource.table
+    monkeypatch.setattr(
+        JsonFileSource,
+        "table",
+        lambda self, *args, **kwargs: builds.append(self)
+        or table(self, *args, **kwargs),
+    )
+
+    # before the handle is minted the table is not built on every request
+    response = select_groups(client, table_fields, None, {"all": ["a"]}, ["all"])
+    assert TABLE_ID not in response
+    assert (
+        enable_columns(client, table_fields, None, ["new_excel_column"], None) is None
+    )
+    rows_request = {"startRow": 0, "endRow": 10, "sortModel": [], "filterModel": {}}
+    assert (
+        call_callback(
+            client,
+            [(TABLE_ID, "getRowsResponse")],
+            [(TABLE_ID, "getRowsRequest", rows_request)],
+            [
+                (get_table_fields_store_id(), "data", table_fields),
+                (get_session_store_id(), "data", None),
+            ],
+        )
+        is None
+    )
+    assert add_group(client, table_fields, None) is None
+    assert builds == []
+
+    # the default groups are created once the handle is minted
+    session = {"handle": table_store.new_handle()}
+    response = add_group(client, table_fields, session, changed=1)
+    names = response[BASE_ID + "group_store"]["data"]["ALL BIOSAMPLES"]
+    assert names == list(
+        map(
+            lambda row: row["biosamplename"],
+            table_store.get(session["handle"])["row_data"],
+        )
+    )
+    assert response[GROUP_SELECTION_BASE_ID + "table"]["rowData"] == [
+        {get_group_id_column(): "ALL BIOSAMPLES"}
+    ]
+    assert len(builds) == 1
@@ -0,0 +1,38 @@
+import os
+
+from dash import Dash, html
+
+from utils.layout_utils import GRID_FUNCTIONS_PATH, serve_grid_functions
+
+
+def grid_functions_app(assets_folder: str, **kwargs) -> Dash:
+    app = Dash(__name__, assets_folder=assets_folder, **kwargs)
+    app.layout = html.Div()
+    serve_grid_functions(app)
+    # imported callbacks twice (e.g. two embedded views) register it once
+    serve_grid_functions(app)
+    return app
+
+
+def test_grid_functions_served_from_the_package(tmp_path):
+    app = grid_functions_app(str(tmp_path), url_base_pathname="/embedded/")
+    assert len(app.config.external_scripts) == 1
+    url = app.config.external_scripts[0]
+    assert url.startswith(
+        "/embedded/_metadata-and-group-creation/dashAgGridFunctions.js?v="
+    )
+
+    client = app.server.test_client()
+    assert url in client.get("/embedded/").get_data(as_text=True)
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.mimetype == "application/javascript"
+    with open(GRID_FUNCTIONS_PATH, "rb") as file:
+        assert response.get_data() == file.read()
+
+
+def test_grid_functions_left_to_the_assets_folder():
+    app = grid_functions_app(os.path.dirname(GRID_FUNCTIONS_PATH))
+    assert app.config.external_scripts == []
+    page = app.server.test_client().get("/").get_data(as_text=True)
+    assert "/assets/dashAgGridFunctions.js" in page
@@ -0,0 +1,97 @@
+from collections import OrderedDict
+
+from utils import row_model
+from utils.row_model import get_rows, sort_rows
+
+ROW_DATA = [
+    {"biosamplename": "c", "size": 3.0, "lot": "LOT-2"},
+    {"biosamplename": "a", "size": None, "lot": "LOT-1"},
+    {"biosamplename": "e", "size": 1.0, "lot": "LOT-2"},
+    {"biosamplename": "b", "size": 2.0, "lot": ""},
+    {"biosamplename": "d", "size": 1.0, "lot": "LOT-1"},
+]
+
+
+def names(rows: list[dict]) -> list[str]:
+    return list(map(lambda row: row["biosamplename"], rows))
+
+
+def test_sort_puts_blanks_first_and_keeps_ties_in_order():
+    assert names(sort_rows(ROW_DATA, [{"colId": "size", "sort": "asc"}])) == [
+        "a",
+        "e",
+        "d",
+        "b",
+        "c",
+    ]
+    assert names(sort_rows(ROW_DATA, [{"colId": "size", "sort": "desc"}])) == [
+        "c",
+        "b",
+        "e",
+        "d",
+        "a",
+    ]
+    # most significant column first
+    sort_model = [{"colId": "lot", "sort": "asc"}, {"colId": "size", "sort": "desc"}]
+    assert names(sort_rows(ROW_DATA, sort_model)) == ["b", "d", "a", "c", "e"]
+    mixed = [{"value": "text"}, {"value": 2}, {"value": None}, {"value": 1}]
+    assert sort_rows(mixed, [{"colId": "value", "sort": "asc"}]) == [
+        {"value": None},
+        {"value": 1},
+        {"value": 2},
+        {"value": "text"},
+    ]
+    assert sort_rows(ROW_DATA, []) == ROW_DATA
+
+
+def test_get_rows_answers_blocks_of_the_sorted_view():
+    request = {
+        "startRow": 0,
+        "endRow": 2,
+        "sortModel": [{"colId": "biosamplename", "sort": "asc"}],
+    }
+    assert get_rows(ROW_DATA, request) == {
+        "rowData": [ROW_DATA[1], ROW_DATA[3]],
+        "rowCount": 5,
+    }
+    response = get_rows(ROW_DATA, {**request, "startRow": 4, "endRow": 6})
+    assert names(response["rowData"]) == ["e"]
+    assert response["rowCount"] == 5
+    # without a model the block is sliced from the table itself
+    assert get_rows(ROW_DATA, {"startRow": 1, "endRow": 3})["rowData"] == ROW_DATA[1:3]
+
+
+def test_get_rows_filters_before_counting():
+    request = {
+        "startRow": 0,
+        "endRow": 100,
+        "filterModel": {
+            "lot": {"filterType": "text", "type": "equals", "filter": "lot-2"}
+        },
+        "sortModel": [{"colId": "size", "sort": "asc"}],
+    }
+    assert get_rows(ROW_DATA, request) == {
+        "rowData": [ROW_DATA[2], ROW_DATA[0]],
+        "rowCount": 2,
+    }
+
+
+def test_views_are_kept_while_scrolling(monkeypatch):
+    monkeypatch.setattr(row_model, "_views", OrderedDict())
+    sorts = []
+    sort = row_model.sort_rows
+    monkeypatch.setattr(
+        row_model,
+        "sort_rows",
+        lambda row_data, sort_model: sorts.append(sort_model)
+        or sort(row_data, sort_model),
+    )
+    sort_model = [{"colId": "size", "sort": "desc"}]
+    for start in range(0, 5, 2):
+        get_rows(
+            ROW_DATA, {"startRow": start, "endRow": start + 2, "sortModel": sort_model}
+        )
+    assert len(sorts) == 1
+    # another table is sorted on its own
+    get_rows(list(ROW_DATA), {"startRow": 0, "endRow": 2, "sortModel": sort_model})
+    assert len(sorts) == 2
@@ -0,0 +1,39 @@
+import json
+from collections import OrderedDict
+
+from utils import schema
+from utils.schema import compile_schema
+
+
+def metadata_columns(*names: str) -> str:
+    return json.dumps(
+        {
+            "columns": [
+                {"editable": True, "name": name, "description": "", "type": "Number"}
+                for name in names
+            ]
+        }
+    )
+
+
+def test_projects_with_the_same_columns_share_a_schema(monkeypatch):
+    monkeypatch.setattr(schema, "_schemas", OrderedDict())
+    compiled = compile_schema(metadata_columns("batch"))
+    assert compile_schema(metadata_columns("batch")) is compiled
+    assert compile_schema(metadata_columns("concentration")) is not compiled
+    assert compiled.types == {"batch": "Number"}
+    row = compiled.transform({"biosampleName": "a", "metadata": '{"batch": "3"}'})
+    assert row["batch"] == 3
+
+
+def test_least_recently_used_schemas_are_evicted(monkeypatch):
+    monkeypatch.setattr(schema, "_schemas", OrderedDict())
+    monkeypatch.setattr(schema, "SCHEMA_CACHE_SIZE", 2)
+    first = compile_schema(metadata_columns("a"))
+    second = compile_schema(metadata_columns("b"))
+    # using the first one keeps it, the second one is evicted by a third schema
+    assert compile_schema(metadata_columns("a")) is first
+    compile_schema(metadata_columns("c"))
+    assert len(schema._schemas) == 2
+    assert compile_schema(metadata_columns("a")) is first
+    assert compile_schema(metadata_columns("b")) is not second
@@ -0,0 +1,145 @@
+import json
+import os
+import sqlite3
+
+import pytest
+
+from utils.appsync_stub import EXAMPLE_RESPONSE, synthetic_project
+from utils.sources import (
+    AppSyncSource,
+    BiosampleSource,
+    FallbackSource,
+    JsonFileSource,
+    ParquetSource,
+    SQLiteSource,
+    set_app_sync_user_resolver,
+    source_descriptor,
+    source_from_descriptor,
+    source_from_payload,
+    write_parquet_snapshot,
+    write_sqlite_snapshot,
+)
+
+
+def test_biosample_source_is_abstract():
+    with pytest.raises(TypeError):
+        BiosampleSource()
+
+
+def test_payload_without_source_and_endpoint_is_rejected():
+    with pytest.raises(ValueError):
+        source_from_payload({"project_id": "project"})
+
+
+@pytest.fixture
+def resolver():
+    yield set_app_sync_user_resolver
+    set_app_sync_user_resolver()
+
+
+def test_descriptor_resolves_credentials_per_request(resolver, tmp_path):
+    user = {"username": "user", "clientId": "client"}
+    payload = {
+        "project_id": "project",
+        "app_sync_endpoint": "http://appsync/graphql",
+        "app_sync_user": user,
+        "source": {"type": "json", "path": str(tmp_path / "project.json")},
+    }
+    descriptor = source_descriptor(payload)
+    assert "app_sync_user" not in descriptor
+    assert descriptor["source"] == payload["source"]
+
+    requests = []
+    resolver(lambda descriptor: requests.append(descriptor) or user)
+    source = source_from_descriptor(descriptor)
+    assert isinstance(source, FallbackSource)
+    assert source.fallback.app_sync_user == user
+    assert requests == [descriptor]
+
+    # without credentials the snapshot is used on its own
+    resolver(lambda descriptor: None)
+    assert isinstance(source_from_descriptor(descriptor), JsonFileSource)
+    del descriptor["source"]
+    with pytest.raises(ValueError):
+        source_from_descriptor(descriptor)
+
+
+def test_stale_snapshot_falls_back_to_appsync_pages(stub, tmp_path):
+    stub.add_project("project", synthetic_project(25))
+    appsync_source = AppSyncSource("project", stub.endpoint, stub.user, page_size=10)
+    source = FallbackSource(
+        JsonFileSource(str(tmp_path / "missing.json")), appsync_source
+    )
+    pages = list(source.pages(["size"]))
+    assert list(map(lambda page: len(page["biosamples"]["items"]), pages)) == [
+        10,
+        10,
+        5,
+    ]
+    assert set(pages[0]["biosamples"]["items"][0]) == {"biosampleName", "size"}
+
+
+def test_snapshots_store_sizes_as_integers(tmp_path):
+    pages = list(JsonFileSource(EXAMPLE_RESPONSE, page_size=4).pages())
+    sqlite_path = str(tmp_path / "project.sqlite")
+    write_sqlite_snapshot("project", pages, sqlite_path)
+    with sqlite3.connect(sqlite_path) as connection:
+        types = {
+            row[0]
+            for row in connection.execute(
+                "SELECT typeof(size) FROM biosamples WHERE size IS NOT NULL"
+            )
+        }
+    assert types == {"integer"}
+
+    sizes = [item["size"] for page in pages for item in page["biosamples"]["items"]]
+    sqlite_source = SQLiteSource(sqlite_path, "project", page_size=4)
+    assert [
+        item["size"]
+        for page in sqlite_source.pages()
+        for item in page["biosamples"]["items"]
+    ] == sizes
+    assert sqlite_source.table() == JsonFileSource(EXAMPLE_RESPONSE).table()
+
+    pytest.importorskip("pyarrow")
+    parquet_path = str(tmp_path / "project.parquet")
+    write_parquet_snapshot(pages, parquet_path)
+    parquet_source = ParquetSource(parquet_path, page_size=4)
+    parquet_sizes = [
+        item["size"]
+        for page in parquet_source.pages()
+        for item in page["biosamples"]["items"]
+    ]
+    assert parquet_sizes == sizes
+    assert all(isinstance(size, (int, type(None))) for size in parquet_sizes)
+    assert parquet_source.table() == JsonFileSource(EXAMPLE_RESPONSE).table()
+
+
+def test_parquet_snapshot_keeps_fractional_sizes(tmp_path):
+    pytest.importorskip("pyarrow")
+    project = synthetic_project(3)
+    sizes = [1.5, 2048.0, None]
+    for item, size in zip(project["biosamples"]["items"], sizes):
+        item["size"] = size
+    path = str(tmp_path / "project.parquet")
+    write_parquet_snapshot([project], path)
+    items = next(ParquetSource(path).pages(["size"]))["biosamples"]["items"]
+    assert [item["size"] for item in items] == sizes
+    assert type(items[1]["size"]) is int
+
+
+def test_json_snapshot_is_parsed_once_per_change(tmp_path, monkeypatch):
+    path = tmp_path / "project.json"
+    path.write_text(json.dumps(synthetic_project(5)))
+    loads = []
+    load = json.load
+    monkeypatch.setattr(json, "load", lambda f: loads.append(f.name) or load(f))
+    source = JsonFileSource(str(path), page_size=2)
+    first = list(source.pages())
+    assert list(source.pages()) == first
+    assert len(loads) == 1
+
+    path.write_text(json.dumps(synthetic_project(7)))
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1))
+    assert len(list(source.pages())) == 4
+    assert len(loads) == 2
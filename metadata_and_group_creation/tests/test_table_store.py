@@ -0,0 +1,31 @@
+from utils.table_store import TableStore
+
+
+def test_sessions_have_their_own_tables():
+    store = TableStore()
+    first, second = store.new_handle(), store.new_handle()
+    assert first != second
+    rows = [{"biosamplename": "a", "batch": 1}]
+    store.put(first, "p1", [], rows, fields=["biosampleName", "metadata"])
+    assert store.lookup(first, "p1", ["biosampleName"])["row_data"] is rows
+    assert store.lookup(second, "p1", ["biosampleName"]) is None
+
+
+def test_lookup_of_another_project_or_fewer_fields():
+    store = TableStore()
+    handle = store.new_handle()
+    store.put(handle, "p1", [], [], fields=["biosampleName", "size"])
+    assert store.lookup(handle, "p2", ["biosampleName"]) is None
+    assert store.lookup(handle, "p1", ["biosampleName", "metadata"]) is None
+    assert store.lookup(handle, "p1", ["size", "biosampleName"]) is not None
+
+
+def test_least_recently_used_tables_are_evicted():
+    store = TableStore(max_entries=2)
+    handles = [store.new_handle() for _ in range(3)]
+    for handle in handles:
+        store.put(handle, "p1", [], [], fields=["biosampleName"])
+        store.get(handles[0])
+    assert store.get(handles[0]) is not None
+    assert store.get(handles[1]) is None
+    assert store.stats()["evictions"] == 1
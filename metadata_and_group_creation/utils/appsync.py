@@ -1,106 +1,742 @@
 import base64
+import functools
 import hashlib
 import hmac
 import json
-import pprint
+import os
+import queue
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Iterator
 
 import boto3
 import requests
+import requests.adapters
 
+from utils import codec
 
-def call_appsync(appsync_endpoint_url, access_token, json_as_str) -> dict:
+# transport settings for appsync requests (see configure_appsync_transport)
+APPSYNC_POOL_SIZE = 10
+APPSYNC_CONNECT_TIMEOUT = 5
+APPSYNC_READ_TIMEOUT = 60
+APPSYNC_MAX_RETRIES = 3
+APPSYNC_BACKOFF = 0.5
+# throttling and transient server errors worth retrying
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# responses to requests with an expired or revoked access token
+AUTH_ERROR_STATUS_CODES = {401, 403}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def configure_appsync_transport(
+    pool_size: int = None,
+    connect_timeout: float = None,
+    read_timeout: float = None,
+    max_retries: int = None,
+    backoff: float = None,
+) -> None:
+    """
+    Configures the pooled http transport used by call_appsync
+
+    Arguments left as None keep their current value. The pooled session is
+    rebuilt on the next call so the new pool size takes effect.
+
+    Args:
+        pool_size (int): Maximum number of kept-alive connections per host
+        connect_timeout (float): Seconds to wait for a connection
+        read_timeout (float): Seconds to wait for the response
+        max_retries (int): Number of retries for throttled/5xx responses and connection errors
+        backoff (float): Base delay in seconds for the exponential (jittered) backoff
+    """
+    global _session, APPSYNC_POOL_SIZE, APPSYNC_CONNECT_TIMEOUT, APPSYNC_READ_TIMEOUT
+    global APPSYNC_MAX_RETRIES, APPSYNC_BACKOFF
+    with _session_lock:
+        if pool_size is not None:
+            APPSYNC_POOL_SIZE = pool_size
+        if connect_timeout is not None:
+            APPSYNC_CONNECT_TIMEOUT = connect_timeout
+        if read_timeout is not None:
+            APPSYNC_READ_TIMEOUT = read_timeout
+        if max_retries is not None:
+            APPSYNC_MAX_RETRIES = max_retries
+        if backoff is not None:
+            APPSYNC_BACKOFF = backoff
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def get_appsync_session() -> requests.Session:
+    """
+    Returns the module-level keep-alive session shared by all appsync requests
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=APPSYNC_POOL_SIZE, pool_maxsize=APPSYNC_POOL_SIZE
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update(
+                {"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"}
+            )
+            _session = session
+        return _session
+
+
+def backoff_delay(attempt: int) -> float:
+    """
+    Returns the delay before the given retry attempt (full jitter exponential backoff)
+    """
+    return random.uniform(0, APPSYNC_BACKOFF * 2**attempt)
+
+
+def post_appsync(
+    appsync_endpoint_url: str, access_token: str, body: bytes
+) -> requests.Response:
+    """
+    Posts a request body to the appsync endpoint through the pooled session
+
+    Throttled (429) and 5xx responses as well as connection errors are retried
+    up to APPSYNC_MAX_RETRIES times with jittered exponential backoff.
+
+    Args:
+        appsync_endpoint_url (str): The appsync endpoint url
+        access_token (str): The access token
+        body (bytes): The json request body
+
+    Returns:
+        response (requests.Response): The last response
+    """
+    session = get_appsync_session()
+    attempt = 0
+    while True:
+        try:
+            response = session.request(
+                url=appsync_endpoint_url,
+                method="POST",
+                headers={
+                    "authorization": access_token,
+                    "content-type": "application/json",
+                },
+                data=body,
+                timeout=(APPSYNC_CONNECT_TIMEOUT, APPSYNC_READ_TIMEOUT),
+            )
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt >= APPSYNC_MAX_RETRIES:
+                raise
+        else:
+            if (
+                response.status_code not in RETRY_STATUS_CODES
+                or attempt >= APPSYNC_MAX_RETRIES
+            ):
+                return response
+        time.sleep(backoff_delay(attempt))
+        attempt += 1
+
+
+def call_appsync(
+    appsync_endpoint_url,
+    access_token,
+    json_as_str,
+    variables: dict = None,
+    app_sync_user: dict = None,
+) -> dict:
     """
     Calls the appsync endpoint with the given access token and json query
 
+    Throttled (429) and 5xx responses as well as connection errors are retried
+    up to APPSYNC_MAX_RETRIES times with jittered exponential backoff. When the
+    appsync user is given, a request rejected as unauthorized (the cached token
+    expired or was revoked early) drops the token and is retried once with a new one.
+
     Args:
         appsync_endpoint_url (str): The appsync endpoint url
         access_token (str): The access token
         json_as_str (str): The json query (in appsync string format)
+        variables (dict): Values of the query's graphql variables
+        app_sync_user (dict): The appsync user the access token belongs to
 
     Returns:
         response (dict): The response from the appsync endpoint
     """
-    session = requests.Session()
-    response = session.request(
-        url=appsync_endpoint_url,
-        method="POST",
-        headers={"authorization": access_token},
-        json={"query": json_as_str},
-    )
+    body = {"query": json_as_str}
+    if variables:
+        body["variables"] = variables
+    body = codec.dumps(body)
+    response = post_appsync(appsync_endpoint_url, access_token, body)
+    if response.status_code in AUTH_ERROR_STATUS_CODES and app_sync_user:
+        invalidate_user_access_token(app_sync_user, access_token)
+        response = post_appsync(
+            appsync_endpoint_url, get_user_access_token(app_sync_user), body
+        )
     if response.status_code != 200:  # TODO : make this more robust
         # print(response.text)
         raise Exception(response.text)
-    return response.json()
+    return codec.loads(response.content)
 
 
-def get_user_access_token(app_sync_user: dict, secret_hash: bool = False) -> str:
+# refresh cached access tokens this many seconds before cognito expires them
+TOKEN_REFRESH_MARGIN = 60
+
+# cached tokens keyed by (username, clientId):
+# {"access_token": str, "refresh_token": str, "expires_at": float}
+_token_cache: dict[tuple[str, str], dict] = {}
+_token_locks: dict[tuple[str, str], threading.Lock] = {}
+_token_cache_lock = threading.Lock()
+_cognito_client = None
+
+
+def get_cognito_client():
     """
-    Gets the user access token for the given appsync user
+    Returns the cognito-idp client shared by all token requests (created on first use)
+
+    The COGNITO_ENDPOINT_URL environment variable points the client to another
+    endpoint (e.g. the local stand-in in utils/appsync_stub.py).
+    """
+    global _cognito_client
+    with _token_cache_lock:
+        if _cognito_client is None:
+            _cognito_client = boto3.client(
+                "cognito-idp", endpoint_url=os.environ.get("COGNITO_ENDPOINT_URL")
+            )
+        return _cognito_client
+
+
+def get_secret_hash(app_sync_user: dict) -> str:
+    """
+    Computes the cognito secret hash for the given appsync user
+
+    Args:
+        app_sync_user (dict): The appsync user
+
+    Returns:
+        secret_hash (str): base64 encoded HMAC-SHA256 of username + clientId
+    """
+    message = bytes(app_sync_user["username"] + app_sync_user["clientId"], "utf-8")
+    key = bytes(app_sync_user["appClientSecret"], "utf-8")
+    return base64.b64encode(
+        hmac.new(key, message, digestmod=hashlib.sha256).digest()
+    ).decode()
+
+
+def authenticate_user(
+    app_sync_user: dict, secret_hash: bool = False, refresh_token: str = None
+) -> dict:
+    """
+    Authenticates the appsync user against cognito
+
+    Uses REFRESH_TOKEN_AUTH when a refresh token is given and USER_PASSWORD_AUTH otherwise.
+
     Args:
         app_sync_user (dict): The appsync user
         secret_hash (bool): Whether to use secret hash or not
+        refresh_token (str): Refresh token from a previous authentication
 
     Returns:
-        access_token (str): The access token
+        token (dict): access_token, refresh_token and expires_at (time.monotonic based)
     """
-    cognito_client = boto3.client("cognito-idp")
-    username = app_sync_user["username"]
-    app_client_id = app_sync_user["clientId"]
-    auth_paramaters = {
-        "USERNAME": app_sync_user["username"],
-        "PASSWORD": app_sync_user["password"],
-    }
+    if refresh_token:
+        auth_flow = "REFRESH_TOKEN_AUTH"
+        auth_paramaters = {"REFRESH_TOKEN": refresh_token}
+    else:
+        auth_flow = "USER_PASSWORD_AUTH"
+        auth_paramaters = {
+            "USERNAME": app_sync_user["username"],
+            "PASSWORD": app_sync_user["password"],
+        }
     if secret_hash:
-        key = app_sync_user["appClientSecret"]
-        message = bytes(username + app_client_id, "utf-8")
-        key = bytes(key, "utf-8")
-        secret_hash = base64.b64encode(
-            hmac.new(key, message, digestmod=hashlib.sha256).digest()
-        ).decode()
-        auth_paramaters["SECRET_HASH"] = secret_hash
-    response = cognito_client.initiate_auth(
+        auth_paramaters["SECRET_HASH"] = get_secret_hash(app_sync_user)
+    requested_at = time.monotonic()
+    response = get_cognito_client().initiate_auth(
         ClientId=app_sync_user["clientId"],
-        AuthFlow="USER_PASSWORD_AUTH",
+        AuthFlow=auth_flow,
         AuthParameters=auth_paramaters,
     )
+    result = response["AuthenticationResult"]
+    return {
+        "access_token": result["AccessToken"],
+        # REFRESH_TOKEN_AUTH does not return a new refresh token
+        "refresh_token": result.get("RefreshToken", refresh_token),
+        "expires_at": requested_at + result["ExpiresIn"],
+    }
 
-    return response["AuthenticationResult"]["AccessToken"]
 
+def get_token_lock(key: tuple[str, str]) -> threading.Lock:
+    """
+    Returns the lock guarding the cached token of a (username, clientId) key
+    """
+    with _token_cache_lock:
+        return _token_locks.setdefault(key, threading.Lock())
 
-def fetch_table_data_from_appsync(
-    project_id: str, app_sync_endpoint: str, app_sync_user: dict
-) -> dict:
+
+def get_user_access_token(app_sync_user: dict, secret_hash: bool = False) -> str:
     """
-    Fetches the table data from the appsync endpoint
+    Gets the user access token for the given appsync user
+
+    Tokens are cached per (username, clientId) and refreshed shortly before they expire.
+    Concurrent callers for the same user wait for a single cognito request.
 
     Args:
-        project_id (str): The project id
-        app_sync_endpoint (str): The appsync endpoint url
         app_sync_user (dict): The appsync user
+        secret_hash (bool): Whether to use secret hash or not
 
     Returns:
-        response (dict): The response from the appsync endpoint with biosample data
+        access_token (str): The access token
+    """
+    key = (app_sync_user["username"], app_sync_user["clientId"])
+    with get_token_lock(key):
+        cached = _token_cache.get(key)
+        if cached and time.monotonic() < cached["expires_at"] - TOKEN_REFRESH_MARGIN:
+            return cached["access_token"]
+        token = None
+        if cached and cached["refresh_token"]:
+            try:
+                token = authenticate_user(
+                    app_sync_user, secret_hash, refresh_token=cached["refresh_token"]
+                )
+            except Exception:
+                # refresh token expired or revoked, fall back to the password flow
+                token = None
+        if token is None:
+            token = authenticate_user(app_sync_user, secret_hash)
+        _token_cache[key] = token
+        return token["access_token"]
+
+
+def invalidate_user_access_token(app_sync_user: dict, access_token: str = None) -> None:
+    """
+    Drops the cached token of the given appsync user (e.g. after appsync rejected it)
+
+    Args:
+        app_sync_user (dict): The appsync user
+        access_token (str): The rejected token; the cached token is only dropped
+            while it is still this one (None: drop it anyway)
+    """
+    key = (app_sync_user["username"], app_sync_user["clientId"])
+    with get_token_lock(key):
+        cached = _token_cache.get(key)
+        if cached and access_token in (None, cached["access_token"]):
+            del _token_cache[key]
+
+
+BIOSAMPLE_FIELDS = [
+    "biosampleName",
+    "fastqValidationStatus",
+    "size",
+    "r1FastqTotalReads",
+    "r2FastqTotalReads",
+    "r1FastqLength",
+    "created",
+    "lotId",
+    "metadata",
+]
+
+# number of biosamples requested per getProject page
+DEFAULT_PAGE_SIZE = 1000
+# limits of a batched multi-project request (aliased getProject fields)
+MAX_PROJECTS_PER_REQUEST = 20
+MAX_ITEMS_PER_REQUEST = 5000
+# seconds a delta sync watermark is moved back to tolerate clock skew
+SYNC_WATERMARK_OVERLAP = 300
+# seconds a prefetching thread waits for room in its buffer before checking
+# whether the consumer stopped
+PREFETCH_POLL_INTERVAL = 0.1
+
+
+def select_biosample_fields(fields: Iterable[str] = None) -> tuple[str, ...]:
+    """
+    Normalizes a set of biosample fields to request
+
+    biosampleName is always included (it identifies the rows) and the fields keep
+    the order of BIOSAMPLE_FIELDS, so equal sets produce the same query.
+
+    Args:
+        fields (Iterable[str]): Appsync biosample fields (None for all of them)
+
+    Returns:
+        fields (tuple[str, ...]): The normalized fields
+    """
+    if fields is None:
+        return tuple(BIOSAMPLE_FIELDS)
+    fields = set(fields) | {"biosampleName"}
+    return tuple(field for field in BIOSAMPLE_FIELDS if field in fields)
+
+
+@functools.lru_cache(maxsize=64)
+def biosample_query(
+    fields: tuple[str, ...] = tuple(BIOSAMPLE_FIELDS), delta: bool = False
+) -> str:
+    """
+    Builds the getProject query for a page of biosamples with only the given fields
+
+    The project id, page size, nextToken and delta filter are passed as graphql
+    variables (see biosample_query_variables), so the query text only depends on
+    the selected fields and is built once per field set. Only delta sync queries
+    declare the $filter variable; full fetches send the plain query.
+
+    Args:
+        fields (tuple[str, ...]): Appsync biosample fields (see select_biosample_fields)
+        delta (bool): Whether to filter the biosamples by updatedAt (delta sync)
+
+    Returns:
+        query (str): The query (in appsync string format)
     """
-    token = get_user_access_token(app_sync_user)
-    query = f"""
-        query MyQuery {{
-            getProject(id: "{project_id}") {{
+    selection = "\n".join(" " * 24 + field for field in fields)
+    filter_variable = (
+        "\n            $filter: ModelBiosampleFilterInput" if delta else ""
+    )
+    filter_argument = "filter: $filter, " if delta else ""
+    return f"""
+        query GetProjectBiosamples(
+            $id: ID!
+            $limit: Int
+            $nextToken: String{filter_variable}
+        ) {{
+            getProject(id: $id) {{
                 biosampleMetadataColumns
-                biosamples {{
+                biosamples({filter_argument}limit: $limit, nextToken: $nextToken) {{
                     items {{
-                        biosampleName
-                        fastqValidationStatus
-                        size
-                        r1FastqTotalReads
-                        r2FastqTotalReads
-                        r1FastqLength
-                        created
-                        lotId
-                        metadata
+{selection}
                     }}
+                    nextToken
                 }}
             }}
         }}
     """
-    response = call_appsync(app_sync_endpoint, token, query)["data"]["getProject"]
+
+
+def biosample_query_variables(
+    project_id: str,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    next_token: str = None,
+    updated_since: str = None,
+) -> dict:
+    """
+    Builds the variables of biosample_query for a single page
+
+    Args:
+        project_id (str): The project id
+        page_size (int): Maximum number of biosamples in the page
+        next_token (str): The nextToken returned by the previous page (None for the first page)
+        updated_since (str): Only request biosamples updated after this AWSDateTime
+            (the query has to be built with delta=True)
+
+    Returns:
+        variables (dict): The graphql variables
+    """
+    variables = {"id": project_id, "limit": int(page_size), "nextToken": next_token}
+    if updated_since:
+        variables["filter"] = {"updatedAt": {"gt": updated_since}}
+    return variables
+
+
+@functools.lru_cache(maxsize=64)
+def multi_project_query(
+    project_count: int, fields: tuple[str, ...] = tuple(BIOSAMPLE_FIELDS)
+) -> str:
+    """
+    Builds a query that fetches a page of biosamples of several projects at once
+
+    Every project is an aliased getProject field (p0, p1, ...) with its own
+    $id<i> and $nextToken<i> variables; $limit is shared.
+
+    Args:
+        project_count (int): Number of projects in the query
+        fields (tuple[str, ...]): Appsync biosample fields (see select_biosample_fields)
+
+    Returns:
+        query (str): The query (in appsync string format)
+    """
+    selection = "\n".join(" " * 24 + field for field in fields)
+    variables = "\n".join(
+        f"            $id{i}: ID!\n            $nextToken{i}: String"
+        for i in range(project_count)
+    )
+    projects = "\n".join(f"""            p{i}: getProject(id: $id{i}) {{
+                biosampleMetadataColumns
+                biosamples(limit: $limit, nextToken: $nextToken{i}) {{
+                    items {{
+{selection}
+                    }}
+                    nextToken
+                }}
+            }}""" for i in range(project_count))
+    return f"""
+        query GetProjectsBiosamples(
+            $limit: Int
+{variables}
+        ) {{
+{projects}
+        }}
+    """
+
+
+def project_not_found_message(project_id: str, response: dict) -> str:
+    """
+    Returns the error message for a getProject that returned no project
+    (the project does not exist or the user has no access to it)
+    """
+    errors = "; ".join(
+        map(lambda error: str(error.get("message")), response.get("errors") or [])
+    )
+    message = f"Project {project_id} not found on appsync (or not accessible)"
+    return f"{message}: {errors}" if errors else message
+
+
+def _fetch_biosample_pages(
+    project_id: str,
+    app_sync_endpoint: str,
+    app_sync_user: dict,
+    page_size: int,
+    updated_since: str = None,
+    fields: Iterable[str] = None,
+) -> Iterator[dict]:
+    """
+    Sequentially fetches biosample pages, following nextToken until it is exhausted
+    """
+    query = biosample_query(select_biosample_fields(fields), delta=bool(updated_since))
+    next_token = None
+    while True:
+        variables = biosample_query_variables(
+            project_id, page_size, next_token, updated_since
+        )
+        response = call_appsync(
+            app_sync_endpoint,
+            get_user_access_token(app_sync_user),
+            query,
+            variables,
+            app_sync_user=app_sync_user,
+        )
+        page = (response.get("data") or {}).get("getProject")
+        if page is None:
+            raise ValueError(project_not_found_message(project_id, response))
+        next_token = page["biosamples"].get("nextToken")
+        yield page
+        if not next_token:
+            return
+
+
+def _prefetch(pages: Iterator[dict], prefetch: int) -> Iterator[dict]:
+    """
+    Pulls pages from the given iterator in a background thread, keeping up to
+    `prefetch` pages downloaded ahead of the consumer
+
+    When the consumer stops early (closes the generator or raises), the thread
+    finishes its current request and exits instead of waiting for buffer space.
+    """
+    done = object()
+    buffer = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        # a blocking put would wait forever once the consumer is gone
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=PREFETCH_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def producer():
+        try:
+            for page in pages:
+                if not put(page):
+                    return
+        except Exception as error:  # re-raised in the consumer thread
+            put(error)
+            return
+        put(done)
+
+    worker = threading.Thread(target=producer, name="appsync-prefetch", daemon=True)
+    worker.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # consumer stopped early: the producer exits after its current request
+        stop.set()
+        while not buffer.empty():
+            buffer.get_nowait()
+
+
+def fetch_biosample_pages_from_appsync(
+    project_id: str,
+    app_sync_endpoint: str,
+    app_sync_user: dict,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    prefetch: int = 0,
+    updated_since: str = None,
+    fields: Iterable[str] = None,
+) -> Iterator[dict]:
+    """
+    Fetches the table data from the appsync endpoint page by page
+
+    Each page has the same shape as the getProject response
+    (biosampleMetadataColumns and biosamples.items), so it can be passed
+    straight to the data utils.
+
+    Args:
+        project_id (str): The project id
+        app_sync_endpoint (str): The appsync endpoint url
+        app_sync_user (dict): The appsync user
+        page_size (int): Maximum number of biosamples per page
+        prefetch (int): Number of pages to download ahead of the consumer
+            in a background thread (0 disables prefetching)
+        updated_since (str): Delta mode, only fetch biosamples updated after
+            this watermark (see sync_watermark)
+        fields (Iterable[str]): Appsync biosample fields to request (None for all,
+            see utils.data.fields_for_columns)
+
+    Yields:
+        page (dict): The response from the appsync endpoint for a single page
+
+    Raises:
+        ValueError: If the project does not exist or the user has no access to it
+    """
+    pages = _fetch_biosample_pages(
+        project_id, app_sync_endpoint, app_sync_user, page_size, updated_since, fields
+    )
+    if prefetch > 0:
+        # pages are chained by nextToken, so the next request can only start once
+        # the previous one returned; prefetching overlaps downloads with the consumer
+        pages = _prefetch(pages, prefetch)
+    yield from pages
+
+
+def sync_watermark() -> str:
+    """
+    Returns the watermark to store for a sync that is about to start
+
+    Biosamples updated after the watermark are fetched by the next delta sync.
+    The watermark is taken before the sync and moved back by SYNC_WATERMARK_OVERLAP
+    to tolerate clock skew with appsync; rows fetched twice are simply merged again.
+
+    Returns:
+        watermark (str): AWSDateTime string (UTC, millisecond precision)
+    """
+    watermark = datetime.now(timezone.utc) - timedelta(seconds=SYNC_WATERMARK_OVERLAP)
+    return watermark.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+
+def fetch_table_data_from_appsync(
+    project_id: str,
+    app_sync_endpoint: str,
+    app_sync_user: dict,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    updated_since: str = None,
+    fields: Iterable[str] = None,
+) -> dict:
+    """
+    Fetches the table data from the appsync endpoint
+
+    In delta mode (updated_since given) only the biosamples updated after the
+    watermark are returned; merge them into the previously synced rows with
+    utils.data.merge_row_data. Deleted biosamples are not reported by a delta sync.
+
+    Args:
+        project_id (str): The project id
+        app_sync_endpoint (str): The appsync endpoint url
+        app_sync_user (dict): The appsync user
+        page_size (int): Maximum number of biosamples per page
+        updated_since (str): Only fetch biosamples updated after this watermark
+        fields (Iterable[str]): Appsync biosample fields to request (None for all)
+
+    Returns:
+        response (dict): The response from the appsync endpoint with biosample data
+    """
+    response = None
+    for page in fetch_biosample_pages_from_appsync(
+        project_id,
+        app_sync_endpoint,
+        app_sync_user,
+        page_size=page_size,
+        updated_since=updated_since,
+        fields=fields,
+    ):
+        if response is None:
+            response = page
+        else:
+            response["biosamples"]["items"].extend(page["biosamples"]["items"])
+    response["biosamples"].pop("nextToken", None)
     return response
+
+
+def fetch_projects_from_appsync(
+    project_ids: list[str],
+    app_sync_endpoint: str,
+    app_sync_user: dict,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    fields: Iterable[str] = None,
+    max_projects_per_request: int = MAX_PROJECTS_PER_REQUEST,
+    max_items_per_request: int = MAX_ITEMS_PER_REQUEST,
+) -> dict[str, dict]:
+    """
+    Fetches the table data of several projects with batched (aliased) requests
+
+    Projects are packed into requests of at most max_projects_per_request aliases
+    and max_items_per_request biosamples. Projects with more biosamples than one
+    page are continued (with their nextToken) in the following requests.
+
+    Args:
+        project_ids (list[str]): The project ids
+        app_sync_endpoint (str): The appsync endpoint url
+        app_sync_user (dict): The appsync user
+        page_size (int): Maximum number of biosamples per project and request
+        fields (Iterable[str]): Appsync biosample fields to request (None for all)
+        max_projects_per_request (int): Maximum number of projects per request
+        max_items_per_request (int): Maximum number of biosamples per request
+
+    Returns:
+        responses (dict[str, dict]): Responses by project id, in the order of project_ids,
+            in the getProject shape that create_column_defs_and_row_data understands
+            (None for projects that do not exist)
+    """
+    fields = select_biosample_fields(fields)
+    page_size = min(page_size, max_items_per_request)
+    chunk_size = max(
+        1, min(max_projects_per_request, max_items_per_request // page_size)
+    )
+
+    responses = {project_id: None for project_id in project_ids}
+    # (project id, nextToken) of the pages still to fetch
+    pending = [(project_id, None) for project_id in responses]
+    while pending:
+        chunk, pending = pending[:chunk_size], pending[chunk_size:]
+        variables = {"limit": page_size}
+        for i, (project_id, next_token) in enumerate(chunk):
+            variables[f"id{i}"] = project_id
+            variables[f"nextToken{i}"] = next_token
+        data = call_appsync(
+            app_sync_endpoint,
+            get_user_access_token(app_sync_user),
+            multi_project_query(len(chunk), fields),
+            variables,
+            app_sync_user=app_sync_user,
+        )["data"]
+        for i, (project_id, _) in enumerate(chunk):
+            page = data[f"p{i}"]
+            if page is None:
+                continue
+            next_token = page["biosamples"].pop("nextToken", None)
+            if responses[project_id] is None:
+                responses[project_id] = page
+            else:
+                responses[project_id]["biosamples"]["items"].extend(
+                    page["biosamples"]["items"]
+                )
+            if next_token:
+                pending.append((project_id, next_token))
+    return responses
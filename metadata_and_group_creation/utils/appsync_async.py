@@ -0,0 +1,216 @@
+import asyncio
+import threading
+
+from utils import appsync
+
+
+def max_concurrency_for(max_concurrency: int = None) -> int:
+    """
+    Returns the number of appsync requests allowed in flight at the same time
+
+    Bounded by the current pool size of the appsync transport (read at call time,
+    see configure_appsync_transport), which is also the default: more requests
+    than pooled connections would open connections that are not kept alive.
+    """
+    pool_size = appsync.APPSYNC_POOL_SIZE
+    return max(1, min(max_concurrency or pool_size, pool_size))
+
+
+async def call_appsync_async(
+    appsync_endpoint_url: str,
+    access_token: str,
+    json_as_str: str,
+    variables: dict = None,
+    limiter: asyncio.Semaphore = None,
+    app_sync_user: dict = None,
+) -> dict:
+    """
+    Async counterpart of call_appsync
+
+    This is not an async http client: the blocking call_appsync is offloaded with
+    asyncio.to_thread, so the request goes through the same pooled keep-alive
+    session (and retry policy) while the event loop stays free.
+
+    Args:
+        appsync_endpoint_url (str): The appsync endpoint url
+        access_token (str): The access token
+        json_as_str (str): The json query (in appsync string format)
+        variables (dict): Values of the query's graphql variables
+        limiter (asyncio.Semaphore): Limits the number of requests in flight
+        app_sync_user (dict): The appsync user the access token belongs to
+            (a rejected token is then renewed, see call_appsync)
+
+    Returns:
+        response (dict): The response from the appsync endpoint
+    """
+    if limiter is None:
+        return await asyncio.to_thread(
+            appsync.call_appsync,
+            appsync_endpoint_url,
+            access_token,
+            json_as_str,
+            variables,
+            app_sync_user,
+        )
+    async with limiter:
+        return await asyncio.to_thread(
+            appsync.call_appsync,
+            appsync_endpoint_url,
+            access_token,
+            json_as_str,
+            variables,
+            app_sync_user,
+        )
+
+
+async def fetch_table_data_from_appsync_async(
+    project_id: str,
+    app_sync_endpoint: str,
+    app_sync_user: dict,
+    page_size: int = appsync.DEFAULT_PAGE_SIZE,
+    limiter: asyncio.Semaphore = None,
+    fields: list[str] = None,
+) -> dict:
+    """
+    Async counterpart of fetch_table_data_from_appsync
+    (blocking requests offloaded with asyncio.to_thread, see call_appsync_async)
+
+    Args:
+        project_id (str): The project id
+        app_sync_endpoint (str): The appsync endpoint url
+        app_sync_user (dict): The appsync user
+        page_size (int): Maximum number of biosamples per page
+        limiter (asyncio.Semaphore): Limits the number of requests in flight
+        fields (list[str]): Appsync biosample fields to request (None for all)
+
+    Returns:
+        response (dict): The response from the appsync endpoint with biosample data
+
+    Raises:
+        ValueError: If the project does not exist or the user has no access to it
+    """
+    query = appsync.biosample_query(appsync.select_biosample_fields(fields))
+    response, next_token = None, None
+    while True:
+        token = await asyncio.to_thread(appsync.get_user_access_token, app_sync_user)
+        variables = appsync.biosample_query_variables(project_id, page_size, next_token)
+        result = await call_appsync_async(
+            app_sync_endpoint,
+            token,
+            query,
+            variables,
+            limiter=limiter,
+            app_sync_user=app_sync_user,
+        )
+        page = (result.get("data") or {}).get("getProject")
+        if page is None:
+            raise ValueError(appsync.project_not_found_message(project_id, result))
+        next_token = page["biosamples"].pop("nextToken", None)
+        if response is None:
+            response = page
+        else:
+            response["biosamples"]["items"].extend(page["biosamples"]["items"])
+        if not next_token:
+            return response
+
+
+async def fetch_projects(
+    project_ids: list[str],
+    app_sync_endpoint: str,
+    app_sync_user: dict,
+    page_size: int = appsync.DEFAULT_PAGE_SIZE,
+    max_concurrency: int = None,
+) -> list[dict]:
+    """
+    Fetches the table data of several projects concurrently
+
+    Pages of a single project are chained by nextToken, so they are fetched in
+    order; different projects are fetched at the same time, in worker threads
+    (asyncio.to_thread over the blocking client, see call_appsync_async).
+
+    Args:
+        project_ids (list[str]): The project ids
+        app_sync_endpoint (str): The appsync endpoint url
+        app_sync_user (dict): The appsync user
+        page_size (int): Maximum number of biosamples per page
+        max_concurrency (int): Maximum number of appsync requests in flight
+            (None: the pool size of the appsync transport, never more than it)
+
+    Returns:
+        responses (list[dict]): The appsync responses, in the order of project_ids
+    """
+    limiter = asyncio.Semaphore(max_concurrency_for(max_concurrency))
+    return list(
+        await asyncio.gather(
+            *[
+                fetch_table_data_from_appsync_async(
+                    project_id,
+                    app_sync_endpoint,
+                    app_sync_user,
+                    page_size=page_size,
+                    limiter=limiter,
+                )
+                for project_id in project_ids
+            ]
+        )
+    )
+
+
+def run_sync(coroutine):
+    """
+    Runs a coroutine to completion from synchronous code (e.g. a dash callback)
+
+    When the calling thread already runs an event loop, the coroutine is run
+    on a fresh loop in a separate thread.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+
+    result = {}
+
+    def runner():
+        try:
+            result["value"] = asyncio.run(coroutine)
+        except BaseException as error:
+            result["error"] = error
+
+    thread = threading.Thread(target=runner)
+    thread.start()
+    thread.join()
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
+
+
+def fetch_projects_sync(
+    project_ids: list[str],
+    app_sync_endpoint: str,
+    app_sync_user: dict,
+    page_size: int = appsync.DEFAULT_PAGE_SIZE,
+    max_concurrency: int = None,
+) -> list[dict]:
+    """
+    Synchronous wrapper around fetch_projects for dash callbacks
+
+    Args:
+        project_ids (list[str]): The project ids
+        app_sync_endpoint (str): The appsync endpoint url
+        app_sync_user (dict): The appsync user
+        page_size (int): Maximum number of biosamples per page
+        max_concurrency (int): Maximum number of appsync requests in flight
+            (None: the pool size of the appsync transport, never more than it)
+
+    Returns:
+        responses (list[dict]): The appsync responses, in the order of project_ids
+    """
+    return run_sync(
+        fetch_projects(
+            project_ids,
+            app_sync_endpoint,
+            app_sync_user,
+            page_size=page_size,
+            max_concurrency=max_concurrency,
+        )
+    )
@@ -0,0 +1,419 @@
+"""
+Offline stand-in for the appsync graphql endpoint and cognito
+
+Serves the getProject queries built by utils/appsync.py (pagination, aliased
+multi-project queries, field selection and the updatedAt delta filter) from
+local fixtures, and answers cognito InitiateAuth requests with fake tokens
+(revoke_token makes the graphql endpoint reject one, as with an expired token).
+
+Usage (from the metadata_and_group_creation directory):
+
+    python -m utils.appsync_stub --port 8765 --latency 0.05 --error-rate 0.01
+
+    export APP_SYNC_GRAPHQL_ENDPOINT=http://127.0.0.1:8765/graphql
+    export COGNITO_ENDPOINT_URL=http://127.0.0.1:8765/cognito
+    export AWS_DEFAULT_REGION=us-east-1
+
+Project ids resolve to:
+    - <fixtures_dir>/<project_id>.json (recorded with record_project)
+    - "synthetic-<n>": a generated project with n biosamples
+    - anything else: data_example/appsync_response.json
+"""
+
+import argparse
+import gzip
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils.appsync import fetch_table_data_from_appsync
+
+EXAMPLE_RESPONSE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+    "data_example",
+    "appsync_response.json",
+)
+SYNTHETIC_PREFIX = "synthetic-"
+STUB_ACCESS_TOKEN = "stub-access-token"
+STUB_REFRESH_TOKEN = "stub-refresh-token"
+
+
+def synthetic_project(biosample_count: int, seed: int = 0) -> dict:
+    """
+    Generates a project in the getProject shape with the given number of biosamples
+
+    Args:
+        biosample_count (int): Number of biosamples
+        seed (int): Seed of the random values (same seed, same project)
+
+    Returns:
+        project (dict): biosampleMetadataColumns and biosamples.items
+    """
+    rng = random.Random(seed)
+    metadata_columns = [
+        {"editable": True, "name": "cell_type", "description": "", "type": "Text"},
+        {
+            "editable": True,
+            "name": "concentration",
+            "description": "",
+            "type": "Number",
+        },
+        {
+            "editable": True,
+            "name": "passed_qc",
+            "description": "",
+            "type": "True/False",
+        },
+        {"editable": True, "name": "sorted_on", "description": "", "type": "Date"},
+    ]
+    items = []
+    for i in range(biosample_count):
+        missing = rng.random() < 0.05
+        reads = None if missing else rng.randint(100_000, 5_000_000)
+        created = (
+            f"2023-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T08:34:27.277Z"
+        )
+        items.append(
+            {
+                "biosampleName": f"synthetic-{seed}-{i:07d}",
+                "fastqValidationStatus": "Missing FASTQs" if missing else "Pass",
+                "size": None if missing else float(rng.randint(10**7, 10**9)),
+                "r1FastqTotalReads": reads,
+                "r2FastqTotalReads": reads,
+                "r1FastqLength": None if missing else rng.choice([51, 76, 151]),
+                "created": created,
+                "updatedAt": created,
+                "lotId": rng.choice(["", "LOT-0001", "LOT-0002"]),
+                "metadata": json.dumps(
+                    {
+                        "cell_type": rng.choice(["K562", "HEK293", "Molm13"]),
+                        "concentration": round(rng.uniform(0, 100), 2),
+                        "passed_qc": rng.choice(["true", "false"]),
+                        "sorted_on": f"2023-{rng.randint(1, 12):02d}-01",
+                    }
+                ),
+            }
+        )
+    return {
+        "biosampleMetadataColumns": json.dumps({"columns": metadata_columns}),
+        "biosamples": {"items": items},
+    }
+
+
+def record_project(
+    project_id: str,
+    app_sync_endpoint: str,
+    app_sync_user: dict,
+    fixtures_dir: str,
+) -> str:
+    """
+    Records a project from the live appsync endpoint as a fixture for the stand-in
+
+    Args:
+        project_id (str): The project id
+        app_sync_endpoint (str): The appsync endpoint url
+        app_sync_user (dict): The appsync user
+        fixtures_dir (str): Directory the fixture is written to
+
+    Returns:
+        path (str): Path of the recorded fixture
+    """
+    response = fetch_table_data_from_appsync(
+        project_id, app_sync_endpoint, app_sync_user
+    )
+    os.makedirs(fixtures_dir, exist_ok=True)
+    path = os.path.join(fixtures_dir, f"{project_id}.json")
+    with open(path, "w") as f:
+        json.dump(response, f, indent=4)
+    return path
+
+
+def matching_brace(text: str, start: int) -> int:
+    """
+    Returns the index of the brace closing the one opened at text[start]
+    """
+    depth = 0
+    for i in range(start, len(text)):
+        if text[i] == "{":
+            depth += 1
+        elif text[i] == "}":
+            depth -= 1
+            if depth == 0:
+                return i
+    raise ValueError("unbalanced braces in query")
+
+
+def parse_arguments(arguments: str, variables: dict) -> dict:
+    """
+    Parses graphql field arguments (variables, strings and integers)
+    """
+    parsed = {}
+    pattern = r'(\w+)\s*:\s*(\$\w+|"(?:[^"\\]|\\.)*"|-?\d+|null)'
+    for name, value in re.findall(pattern, arguments):
+        if value.startswith("$"):
+            parsed[name] = variables.get(value[1:])
+        elif value == "null":
+            parsed[name] = None
+        elif value.startswith('"'):
+            parsed[name] = json.loads(value)
+        else:
+            parsed[name] = int(value)
+    return parsed
+
+
+class AppSyncStub:
+    """
+    Local http server answering appsync getProject queries and cognito InitiateAuth
+
+    Args:
+        fixtures_dir (str): Directory with recorded projects (<project_id>.json)
+        latency (float): Seconds added to every response
+        max_page_size (int): Upper bound for the limit of a biosamples page
+        error_rate (float): Share of graphql requests answered with a 503
+        throttle_rate (float): Share of graphql requests answered with a 429
+    """
+
+    def __init__(
+        self,
+        fixtures_dir: str = None,
+        latency: float = 0.0,
+        max_page_size: int = 1000,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+    ):
+        self.fixtures_dir = fixtures_dir
+        self.latency = latency
+        self.max_page_size = max_page_size
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.requests = 0
+        self.authentications = 0
+        self._tokens = set()
+        self._projects = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def issue_token(self) -> str:
+        """
+        Returns a new access token accepted by the graphql endpoint
+        """
+        with self._lock:
+            self.authentications += 1
+            token = f"{STUB_ACCESS_TOKEN}-{self.authentications}"
+            self._tokens.add(token)
+        return token
+
+    def revoke_token(self, token: str) -> None:
+        """
+        Revokes an access token, requests using it are answered with a 401
+        """
+        with self._lock:
+            self._tokens.discard(token)
+
+    def add_project(self, project_id: str, project: dict) -> None:
+        """
+        Serves the given project (getProject shape) under project_id
+        """
+        with self._lock:
+            self._projects[project_id] = project
+
+    def get_project(self, project_id: str) -> dict:
+        """
+        Returns the project served under project_id (see module docstring)
+        """
+        with self._lock:
+            if project_id in self._projects:
+                return self._projects[project_id]
+        path = self.fixtures_dir and os.path.join(
+            self.fixtures_dir, f"{project_id}.json"
+        )
+        if path and os.path.exists(path):
+            with open(path) as f:
+                project = json.load(f)
+        elif project_id.startswith(SYNTHETIC_PREFIX):
+            project = synthetic_project(int(project_id[len(SYNTHETIC_PREFIX) :]))
+        else:
+            with open(EXAMPLE_RESPONSE) as f:
+                project = json.load(f)
+        self.add_project(project_id, project)
+        return project
+
+    def resolve_project(self, project_id: str, body: str, variables: dict) -> dict:
+        """
+        Resolves the selection set of a getProject field
+        """
+        project = self.get_project(project_id)
+        result = {}
+        if re.search(r"\bbiosampleMetadataColumns\b", body):
+            result["biosampleMetadataColumns"] = project["biosampleMetadataColumns"]
+        match = re.search(r"biosamples\s*(\(([^)]*)\))?\s*\{", body)
+        if match:
+            arguments = parse_arguments(match.group(2) or "", variables)
+            selection = body[match.end() - 1 : matching_brace(body, match.end() - 1)]
+            items_match = re.search(r"items\s*\{([^}]*)\}", selection)
+            fields = items_match.group(1).split() if items_match else []
+            items = project["biosamples"]["items"]
+            updated_after = (
+                (arguments.get("filter") or {}).get("updatedAt") or {}
+            ).get("gt")
+            if updated_after:
+                items = [
+                    item
+                    for item in items
+                    if (item.get("updatedAt") or item.get("created") or "")
+                    > updated_after
+                ]
+            limit = min(
+                arguments.get("limit") or self.max_page_size, self.max_page_size
+            )
+            start = int(arguments.get("nextToken") or 0)
+            page = items[start : start + limit]
+            result["biosamples"] = {
+                "items": [
+                    {field: item.get(field) for field in fields if field in item}
+                    for item in page
+                ],
+                "nextToken": str(start + limit) if start + limit < len(items) else None,
+            }
+        return result
+
+    def execute(self, query: str, variables: dict) -> dict:
+        """
+        Executes a getProject query (plain or with aliases)
+        """
+        data = {}
+        pattern = r"(?:(\w+)\s*:\s*)?getProject\s*\(([^)]*)\)\s*\{"
+        for match in re.finditer(pattern, query):
+            alias = match.group(1) or "getProject"
+            body = query[match.end() - 1 : matching_brace(query, match.end() - 1)]
+            # the id argument uses its own variable, the other arguments are shared
+            project_id = parse_arguments(match.group(2), variables)["id"]
+            data[alias] = self.resolve_project(project_id, body, variables)
+        return {"data": data}
+
+    def handler(self):
+        """
+        Returns the request handler class bound to this stand-in
+        """
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def send_json(self, status: int, payload: dict, content_type: str):
+                body = json.dumps(payload).encode("utf-8")
+                gzipped = "gzip" in self.headers.get("Accept-Encoding", "")
+                if gzipped:
+                    body = gzip.compress(body)
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                if gzipped:
+                    self.send_header("Content-Encoding", "gzip")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                request = json.loads(
+                    self.rfile.read(int(self.headers.get("Content-Length", 0))) or "{}"
+                )
+                time.sleep(stub.latency)
+                target = self.headers.get("X-Amz-Target", "")
+                if target.endswith("InitiateAuth"):
+                    self.send_json(
+                        200,
+                        {
+                            "AuthenticationResult": {
+                                "AccessToken": stub.issue_token(),
+                                "ExpiresIn": 3600,
+                                "TokenType": "Bearer",
+                                "RefreshToken": STUB_REFRESH_TOKEN,
+                                "IdToken": "stub-id-token",
+                            }
+                        },
+                        "application/x-amz-json-1.1",
+                    )
+                    return
+                with stub._lock:
+                    stub.requests += 1
+                    authorized = self.headers.get("authorization") in stub._tokens
+                if not authorized:
+                    self.send_json(401, {"message": "Unauthorized"}, "application/json")
+                    return
+                draw = random.random()
+                if draw < stub.throttle_rate:
+                    self.send_json(429, {"message": "Throttled"}, "application/json")
+                    return
+                if draw < stub.throttle_rate + stub.error_rate:
+                    self.send_json(
+                        503, {"message": "Injected error"}, "application/json"
+                    )
+                    return
+                try:
+                    response = stub.execute(
+                        request["query"], request.get("variables") or {}
+                    )
+                except Exception as error:
+                    response = {"data": None, "errors": [{"message": str(error)}]}
+                self.send_json(200, response, "application/json")
+
+        return Handler
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """
+        Starts the server in a background thread
+
+        Args:
+            host (str): Interface to listen on
+            port (int): Port to listen on (0 picks a free port)
+
+        Returns:
+            url (str): Base url of the server (graphql endpoint is <url>/graphql)
+        """
+        self._server = ThreadingHTTPServer((host, port), self.handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return f"http://{host}:{self._server.server_port}"
+
+    def stop(self) -> None:
+        """
+        Stops the server started with start
+        """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fixtures-dir", default=None)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--max-page-size", type=int, default=1000)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    stub = AppSyncStub(
+        fixtures_dir=args.fixtures_dir,
+        latency=args.latency,
+        max_page_size=args.max_page_size,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+    )
+    server = ThreadingHTTPServer((args.host, args.port), stub.handler())
+    print(f"appsync stand-in listening on http://{args.host}:{args.port}/graphql")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
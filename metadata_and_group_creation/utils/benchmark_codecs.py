@@ -0,0 +1,109 @@
+"""
+Compares the installed json backends on project data
+
+Usage (from the metadata_and_group_creation directory):
+
+    python -m utils.benchmark_codecs fixtures/<project_id>.json --repeat 5
+    python -m utils.benchmark_codecs --synthetic 100000
+
+Projects are getProject responses as recorded by utils.appsync_stub.record_project
+(data_example/appsync_response.json when none are given). For every backend the
+benchmark reports the best of --repeat runs of:
+    - response: decoding the whole response body
+    - metadata: decoding the metadata strings one by one
+    - metadata_batch: decoding the metadata strings with decode_batch
+"""
+
+import argparse
+import json
+import os
+import time
+
+from utils.appsync_stub import EXAMPLE_RESPONSE, synthetic_project
+from utils.codec import JsonCodec, available_backends
+
+
+def best_time(function, repeat: int) -> float:
+    """
+    Returns the shortest of repeat runs of function in seconds
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def benchmark_project(project: dict, repeat: int = 5) -> dict[str, dict]:
+    """
+    Times the json backends on a project
+
+    Args:
+        project (dict): The project in the getProject shape
+        repeat (int): Number of runs per measurement
+
+    Returns:
+        timings (dict[str, dict]): Seconds per measurement by backend
+    """
+    body = json.dumps({"data": {"getProject": project}}).encode("utf-8")
+    metadata_strings = [
+        item.get("metadata") or "{}" for item in project["biosamples"]["items"]
+    ]
+    timings = {}
+    for backend in available_backends():
+        codec = JsonCodec(backend)
+        timings[backend] = {
+            "response": best_time(lambda: codec.loads(body), repeat),
+            "metadata": best_time(
+                lambda: list(map(codec.loads, metadata_strings)), repeat
+            ),
+            "metadata_batch": best_time(
+                lambda: codec.decode_batch(metadata_strings), repeat
+            ),
+        }
+    return timings
+
+
+def print_timings(name: str, biosample_count: int, timings: dict[str, dict]) -> None:
+    """
+    Prints the timings of a project as a table (milliseconds)
+    """
+    measurements = list(next(iter(timings.values())))
+    print(f"{name} ({biosample_count} biosamples)")
+    print("".join([f"{'backend':<10}"] + [f"{m:>16}" for m in measurements]))
+    for backend, times in timings.items():
+        print(
+            "".join(
+                [f"{backend:<10}"]
+                + [f"{times[m] * 1000:>14.2f}ms" for m in measurements]
+            )
+        )
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("projects", nargs="*", help="recorded getProject responses")
+    parser.add_argument("--synthetic", type=int, default=None)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    projects = []
+    for path in args.projects or ([] if args.synthetic else [EXAMPLE_RESPONSE]):
+        with open(path) as f:
+            projects.append((os.path.basename(path), json.load(f)))
+    if args.synthetic:
+        projects.append(
+            (f"synthetic-{args.synthetic}", synthetic_project(args.synthetic))
+        )
+    for name, project in projects:
+        print_timings(
+            name,
+            len(project["biosamples"]["items"]),
+            benchmark_project(project, repeat=args.repeat),
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,549 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from itertools import chain
+from typing import Iterable
+
+from utils.appsync import (
+    BIOSAMPLE_FIELDS,
+    DEFAULT_PAGE_SIZE,
+    fetch_biosample_pages_from_appsync,
+    select_biosample_fields,
+    sync_watermark,
+)
+from utils.coercion import log_coercion_report
+from utils.columnar import ColumnarTable
+from utils.data import (
+    copy_column_defs,
+    fields_for_columns,
+    merge_row_columns,
+    merge_row_data,
+)
+from utils.parallel import transform_pages_parallel
+from utils.schema import compile_schema, metadata_columns_hash
+
+# seconds a cached table is served without asking appsync whether it changed
+PROJECT_TABLE_TTL = 300
+# seconds after which a cached table is rebuilt instead of delta synced
+# (delta syncs only see updated biosamples, a rebuild drops the deleted ones)
+PROJECT_TABLE_MAX_AGE = 3600
+# upper bound for the estimated size of all cached tables
+PROJECT_TABLE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# number of rows measured when estimating the size of a table
+SIZE_ESTIMATE_SAMPLE = 100
+
+
+def estimate_size(obj) -> int:
+    """
+    Estimates the memory used by a json-like object (dicts, lists, scalars)
+
+    Args:
+        obj: The object to measure
+
+    Returns:
+        size (int): Estimated size in bytes
+    """
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(estimate_size(k) + estimate_size(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(estimate_size(x) for x in obj)
+    return size
+
+
+def estimate_table_size(column_defs: list[dict], row_data: list[dict]) -> int:
+    """
+    Estimates the memory used by a table, extrapolating from a sample of rows
+
+    Args:
+        column_defs (list[dict]): Column definitions of the table
+        row_data (list[dict]): Row data of the table
+
+    Returns:
+        size (int): Estimated size in bytes
+    """
+    sample = row_data[:SIZE_ESTIMATE_SAMPLE]
+    rows_size = 0
+    if sample:
+        rows_size = estimate_size(sample) * len(row_data) // len(sample)
+    return estimate_size(column_defs) + rows_size
+
+
+class ProjectTableCache:
+    """
+    LRU cache of transformed project tables bounded by their estimated size in bytes
+
+    Entries are keyed by (project_id, metadata columns hash) and hold the column
+    definitions, the row data, the watermark of the sync they were built from, the
+    appsync biosample fields that were fetched and the types of the metadata columns
+    (declared or inferred), which the rows of delta syncs are cast to.
+    Tables older than max_age (since they were last built from all biosamples)
+    are rebuilt rather than delta synced, so deleted biosamples do not stay cached.
+    Cached tables are shared between callers and must be treated as read-only
+    (get_project_table hands out copies of their column definitions).
+    Syncs of a project are serialized by its lock (see lock), so concurrent callers
+    wait for a single rebuild instead of each fetching the project.
+    """
+
+    def __init__(
+        self,
+        ttl: float = PROJECT_TABLE_TTL,
+        max_bytes: int = PROJECT_TABLE_CACHE_MAX_BYTES,
+        max_age: float = PROJECT_TABLE_MAX_AGE,
+    ):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.delta_syncs = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        # most recent key per project, used for lookups within the ttl
+        self._latest = {}
+        self._lock = threading.RLock()
+        self._project_locks = {}
+
+    def lock(self, project_id: str) -> threading.RLock:
+        """
+        Returns the lock serializing the syncs (rebuilds, delta syncs and lazy
+        column fetches) of a project
+        """
+        with self._lock:
+            return self._project_locks.setdefault(project_id, threading.RLock())
+
+    def latest_key(self, project_id: str):
+        """
+        Returns the key of the most recently stored entry of the project (or None)
+        """
+        with self._lock:
+            return self._latest.get(project_id)
+
+    def get(self, key: tuple[str, str]):
+        """
+        Returns the entry stored under key (or None) and marks it as recently used
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(
+        self,
+        key: tuple[str, str],
+        column_defs: list[dict],
+        row_data: list[dict],
+        watermark: str,
+        fields: tuple[str, ...] = BIOSAMPLE_FIELDS,
+        types: dict[str, str] = None,
+        built_at: float = None,
+    ) -> dict:
+        """
+        Stores a table and evicts the least recently used ones above max_bytes
+
+        Args:
+            key (tuple[str, str]): (project_id, metadata columns hash)
+            column_defs (list[dict]): Column definitions of the table
+            row_data (list[dict]): Row data of the table
+            watermark (str): Watermark of the sync the table was built from
+            fields (tuple[str, ...]): Appsync biosample fields the rows were built from
+            types (dict[str, str]): Types of the metadata columns (declared or inferred)
+            built_at (float): time.monotonic() of the last sync that fetched all
+                biosamples (None for now, i.e. the table was just rebuilt)
+
+        Returns:
+            entry (dict): The stored entry
+        """
+        entry = {
+            "column_defs": column_defs,
+            "row_data": row_data,
+            "watermark": watermark,
+            "fields": select_biosample_fields(fields),
+            "types": types or {},
+            "validated_at": time.monotonic(),
+            "built_at": time.monotonic() if built_at is None else built_at,
+            "bytes": estimate_table_size(column_defs, row_data),
+        }
+        with self._lock:
+            self.discard(key)
+            self._entries[key] = entry
+            self._latest[key[0]] = key
+            self.bytes += entry["bytes"]
+            # always keep the newest entry, even if it is larger than the budget
+            while self.bytes > self.max_bytes and len(self._entries) > 1:
+                oldest = next(iter(self._entries))
+                self.discard(oldest)
+                self.evictions += 1
+        return entry
+
+    def discard(self, key: tuple[str, str]) -> None:
+        """
+        Removes the entry stored under key (if any)
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return
+            self.bytes -= entry["bytes"]
+            if self._latest.get(key[0]) == key:
+                del self._latest[key[0]]
+
+    def clear(self) -> None:
+        """
+        Removes all entries (counters are kept)
+        """
+        with self._lock:
+            self._entries.clear()
+            self._latest.clear()
+            self.bytes = 0
+
+    def revalidate(self, key: tuple[str, str]) -> None:
+        """
+        Marks the entry stored under key as validated now (appsync reported no change)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry["validated_at"] = time.monotonic()
+            self._latest[key[0]] = key
+            self.revalidations += 1
+
+    def record(self, hit: bool, delta: bool = False) -> None:
+        """
+        Counts a cache hit or miss (and whether the hit needed a delta sync)
+        """
+        with self._lock:
+            if delta:
+                self.delta_syncs += 1
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def is_fresh(self, entry: dict) -> bool:
+        """
+        Whether the entry was validated less than ttl seconds ago
+        """
+        return time.monotonic() - entry["validated_at"] < self.ttl
+
+    def is_expired(self, entry: dict) -> bool:
+        """
+        Whether the entry was built from all biosamples more than max_age seconds ago
+        (it is then rebuilt instead of delta synced)
+        """
+        return time.monotonic() - entry["built_at"] >= self.max_age
+
+    def stats(self) -> dict:
+        """
+        Returns the cache counters
+        (hits, misses, revalidations, delta_syncs, evictions, entries, bytes)
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidations": self.revalidations,
+                "delta_syncs": self.delta_syncs,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+            }
+
+
+project_table_cache = ProjectTableCache()
+
+
+def delta_sync_project_table(
+    entry: dict,
+    key: tuple[str, str],
+    project_id: str,
+    app_sync_endpoint: str,
+    app_sync_user: dict,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    cache: ProjectTableCache = None,
+):
+    """
+    Brings a cached table up to date with the biosamples updated since its watermark
+
+    Only the changed biosamples are fetched and transformed, then merged into the
+    cached row data by biosamplename.
+
+    Args:
+        entry (dict): Cached entry of the project
+        key (tuple[str, str]): Key the entry is stored under
+        project_id (str): The project id
+        app_sync_endpoint (str): The appsync endpoint url
+        app_sync_user (dict): The appsync user
+        page_size (int): Maximum number of biosamples per page
+        cache (ProjectTableCache): Cache the entry belongs to
+            (defaults to project_table_cache)
+
+    Returns:
+        entry (dict): The up to date entry, or None when the metadata columns
+            changed and no table of the new columns is cached (it has to be rebuilt)
+    """
+    cache = cache or project_table_cache
+    watermark = sync_watermark()
+    pages = fetch_biosample_pages_from_appsync(
+        project_id,
+        app_sync_endpoint,
+        app_sync_user,
+        page_size=page_size,
+        updated_since=entry["watermark"],
+        fields=entry["fields"],
+    )
+    first_page = next(pages)
+    columns = first_page["biosampleMetadataColumns"]
+    columns_key = (project_id, metadata_columns_hash(columns))
+    if columns_key != key:
+        pages.close()
+        # a table of the new metadata columns may still be cached, sync that one
+        columns_entry = cache.get(columns_key)
+        if (
+            columns_entry is None
+            or cache.is_expired(columns_entry)
+            or not set(entry["fields"]) <= set(columns_entry["fields"])
+        ):
+            return None
+        return delta_sync_project_table(
+            columns_entry,
+            columns_key,
+            project_id,
+            app_sync_endpoint,
+            app_sync_user,
+            page_size=page_size,
+            cache=cache,
+        )
+    changed_biosamples = list(first_page["biosamples"]["items"])
+    for page in pages:
+        changed_biosamples.extend(page["biosamples"]["items"])
+    if not changed_biosamples:
+        cache.revalidate(key)
+        cache.record(hit=True)
+        return entry
+
+    # the changed rows are cast to the types of the cached table
+    changed_row_data, types = compile_schema(columns).typed_rows(
+        changed_biosamples, entry["types"]
+    )
+    row_data = merge_row_data(entry["row_data"], changed_row_data)
+    cache.record(hit=True, delta=True)
+    return cache.put(
+        key,
+        entry["column_defs"],
+        row_data,
+        watermark,
+        entry["fields"],
+        types,
+        built_at=entry["built_at"],
+    )
+
+
+def get_project_table(
+    project_id: str,
+    app_sync_endpoint: str,
+    app_sync_user: dict,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    prefetch: int = 0,
+    fields: Iterable[str] = None,
+    cache: ProjectTableCache = None,
+    workers: int = 0,
+) -> tuple[list, list]:
+    """
+    Returns the column definitions and row data of a project, using the table cache
+
+    Within the ttl the cached table is returned without contacting appsync. After
+    that, a delta sync fetches only the biosamples updated since the last sync and
+    merges them into the cached table; when none changed, this is a single small
+    request. The table is rebuilt from scratch when it is not cached, when the
+    project's metadata columns changed, when it lacks some of the requested fields
+    or when it is older than the cache's max_age (delta syncs do not see deleted
+    biosamples).
+
+    Args:
+        project_id (str): The project id
+        app_sync_endpoint (str): The appsync endpoint url
+        app_sync_user (dict): The appsync user
+        page_size (int): Maximum number of biosamples per page
+        prefetch (int): Number of pages to download ahead of the transform
+        fields (Iterable[str]): Appsync biosample fields the rows need (None for all,
+            see utils.data.fields_for_columns)
+        cache (ProjectTableCache): Cache to use (defaults to project_table_cache)
+        workers (int): Number of processes transforming the pages of large projects
+            (0 transforms in-process, see utils.parallel)
+
+    Returns:
+        column_defs (list): List of column definitions for ag grid (copies)
+        row_data (list): List of row data for ag grid (read-only)
+    """
+    cache = cache or project_table_cache
+    fields = select_biosample_fields(fields)
+    entry = cache.get(cache.latest_key(project_id))
+    if (
+        entry is not None
+        and set(fields) <= set(entry["fields"])
+        and cache.is_fresh(entry)
+    ):
+        cache.record(hit=True)
+        return copy_column_defs(entry["column_defs"]), entry["row_data"]
+    with cache.lock(project_id):
+        # the table may have been synced while waiting for the lock
+        key = cache.latest_key(project_id)
+        entry = cache.get(key)
+        if (
+            entry is not None
+            and set(fields) <= set(entry["fields"])
+            and not cache.is_expired(entry)
+        ):
+            if cache.is_fresh(entry):
+                cache.record(hit=True)
+                return copy_column_defs(entry["column_defs"]), entry["row_data"]
+            entry = delta_sync_project_table(
+                entry,
+                key,
+                project_id,
+                app_sync_endpoint,
+                app_sync_user,
+                page_size=page_size,
+                cache=cache,
+            )
+            if entry is not None:
+                return copy_column_defs(entry["column_defs"]), entry["row_data"]
+        elif entry is not None:
+            # rebuild with the fields of the cached table too, so other users keep them
+            fields = select_biosample_fields(set(fields) | set(entry["fields"]))
+
+        cache.record(hit=False)
+        watermark = sync_watermark()
+        pages = iter(
+            fetch_biosample_pages_from_appsync(
+                project_id,
+                app_sync_endpoint,
+                app_sync_user,
+                page_size=page_size,
+                prefetch=prefetch,
+                fields=fields,
+            )
+        )
+        first_page = next(pages)
+        key = (
+            project_id,
+            metadata_columns_hash(first_page["biosampleMetadataColumns"]),
+        )
+        if workers > 0:
+            column_defs, row_data, types = transform_pages_parallel(
+                chain([first_page], pages), max_workers=workers
+            )
+        else:
+            table = ColumnarTable.from_pages(chain([first_page], pages))
+            log_coercion_report(table.coercion_report)
+            column_defs, row_data, types = (
+                table.column_defs,
+                table.to_row_data(),
+                table.types,
+            )
+        cache.put(key, column_defs, row_data, watermark, fields, types)
+        return copy_column_defs(column_defs), row_data
+
+
+def get_project_table_columns(
+    project_id: str,
+    app_sync_endpoint: str,
+    app_sync_user: dict,
+    columns: Iterable[str],
+    page_size: int = DEFAULT_PAGE_SIZE,
+    cache: ProjectTableCache = None,
+) -> tuple[list, list]:
+    """
+    Returns the project table with (at least) the given columns filled in
+
+    Columns that were left out of the cached table (column projection) are fetched
+    lazily: only biosampleName and the missing fields are requested and the new
+    values are merged into the cached rows.
+
+    Args:
+        project_id (str): The project id
+        app_sync_endpoint (str): The appsync endpoint url
+        app_sync_user (dict): The appsync user
+        columns (Iterable[str]): Table columns that need data
+        page_size (int): Maximum number of biosamples per page
+        cache (ProjectTableCache): Cache to use (defaults to project_table_cache)
+
+    Returns:
+        column_defs (list): List of column definitions for ag grid (copies)
+        row_data (list): List of row data for ag grid (read-only)
+    """
+    cache = cache or project_table_cache
+    fields = fields_for_columns(columns)
+    with cache.lock(project_id):
+        key = cache.latest_key(project_id)
+        entry = cache.get(key)
+        if entry is None:
+            return get_project_table(
+                project_id,
+                app_sync_endpoint,
+                app_sync_user,
+                page_size=page_size,
+                fields=fields,
+                cache=cache,
+            )
+        missing_fields = set(fields) - set(entry["fields"])
+        if not missing_fields:
+            return copy_column_defs(entry["column_defs"]), entry["row_data"]
+
+        pages = iter(
+            fetch_biosample_pages_from_appsync(
+                project_id,
+                app_sync_endpoint,
+                app_sync_user,
+                page_size=page_size,
+                fields=missing_fields,
+            )
+        )
+        first_page = next(pages)
+        biosample_metadata_columns = first_page["biosampleMetadataColumns"]
+        columns_key = (project_id, metadata_columns_hash(biosample_metadata_columns))
+        if columns_key != key:
+            # metadata columns changed in the meantime, use the table of the new
+            # columns if it is cached and has the fields, else rebuild the whole table
+            pages.close()
+            columns_entry = cache.get(columns_key)
+            if columns_entry is not None and set(fields) <= set(
+                columns_entry["fields"]
+            ):
+                return (
+                    copy_column_defs(columns_entry["column_defs"]),
+                    columns_entry["row_data"],
+                )
+            return get_project_table(
+                project_id,
+                app_sync_endpoint,
+                app_sync_user,
+                page_size=page_size,
+                fields=set(fields) | set(entry["fields"]),
+                cache=cache,
+            )
+        partial_row_data, types = compile_schema(biosample_metadata_columns).typed_rows(
+            chain.from_iterable(
+                map(
+                    lambda page: page["biosamples"]["items"], chain([first_page], pages)
+                )
+            ),
+            entry["types"],
+        )
+        row_data = merge_row_columns(entry["row_data"], partial_row_data)
+        entry = cache.put(
+            key,
+            entry["column_defs"],
+            row_data,
+            entry["watermark"],
+            set(fields) | set(entry["fields"]),
+            types,
+            built_at=entry["built_at"],
+        )
+        return copy_column_defs(entry["column_defs"]), entry["row_data"]
@@ -0,0 +1,151 @@
+import json
+import os
+from typing import Union
+
+# json backends in order of preference, the first installed one is used
+# (JSON_BACKEND=json|orjson|msgspec forces one)
+JSON_BACKENDS = ["orjson", "msgspec", "json"]
+# scanner of the standard library decoder, decodes the json value at an index
+_scan_once = json.JSONDecoder().scan_once
+
+
+def available_backends() -> list[str]:
+    """
+    Returns the installed json backends in order of preference
+    """
+    backends = []
+    for backend in JSON_BACKENDS:
+        if backend == "json":
+            backends.append(backend)
+            continue
+        try:
+            __import__(backend)
+        except ImportError:
+            continue
+        backends.append(backend)
+    return backends
+
+
+class JsonCodec:
+    """
+    Encodes and decodes json with one of the json backends
+
+    Args:
+        backend (str): orjson, msgspec or json
+    """
+
+    def __init__(self, backend: str):
+        self.backend = backend
+        if backend == "orjson":
+            import orjson
+
+            self._loads = orjson.loads
+            self._dumps = orjson.dumps
+        elif backend == "msgspec":
+            import msgspec
+
+            self._msgspec = msgspec
+            self._loads = msgspec.json.Decoder().decode
+            self._dumps = msgspec.json.Encoder().encode
+        elif backend == "json":
+            self._loads = json.loads
+            self._dumps = lambda value: json.dumps(value).encode("utf-8")
+        else:
+            raise ValueError(f"Unknown json backend: {backend}")
+
+    def loads(self, data: Union[str, bytes]):
+        """
+        Decodes a json document (str or utf-8 bytes)
+        """
+        return self._loads(data)
+
+    def dumps(self, value) -> bytes:
+        """
+        Encodes a value as a json document (utf-8 bytes)
+        """
+        return self._dumps(value)
+
+    def decode_batch(self, documents: list[str], type=None) -> list:
+        """
+        Decodes a list of json documents (e.g. the metadata of a page)
+
+        Every document is decoded on its own: joined into a single array, a document
+        that is not valid json by itself (e.g. "1,2") would shift the others. With
+        the standard library backend the documents are scanned directly, skipping
+        the per-call overhead of json.loads.
+
+        Args:
+            documents (list[str]): The json documents
+            type (type): Type to decode each document into (e.g. a msgspec Struct or
+                a dataclass); with msgspec the documents are decoded and validated
+                straight into it, otherwise it is called with the decoded keys
+
+        Returns:
+            values (list): The decoded documents
+        """
+        if type is not None and self.backend == "msgspec":
+            return list(map(self._msgspec.json.Decoder(type).decode, documents))
+        if self.backend == "json":
+            values = list(map(self._scan_document, documents))
+        else:
+            values = list(map(self._loads, documents))
+        if type is not None:
+            return [type(**value) for value in values]
+        return values
+
+    @staticmethod
+    def _scan_document(document: Union[str, bytes]):
+        """
+        Decodes a json document with the scanner of the standard library decoder
+
+        The value is only used when it spans the whole document, anything else
+        (surrounding whitespace, trailing data, errors) goes through json.loads.
+        """
+        if isinstance(document, str):
+            try:
+                value, end = _scan_once(document, 0)
+                if end == len(document):
+                    return value
+            except (StopIteration, ValueError):
+                pass
+        return json.loads(document)
+
+
+def default_backend() -> str:
+    """
+    Returns the json backend to use (JSON_BACKEND or the preferred installed one)
+    """
+    return os.environ.get("JSON_BACKEND") or available_backends()[0]
+
+
+codec = JsonCodec(default_backend())
+
+
+def set_json_backend(backend: str) -> None:
+    """
+    Switches the json backend used by loads, dumps and decode_batch
+    """
+    global codec
+    codec = JsonCodec(backend)
+
+
+def loads(data: Union[str, bytes]):
+    """
+    Decodes a json document with the current backend
+    """
+    return codec.loads(data)
+
+
+def dumps(value) -> bytes:
+    """
+    Encodes a value as a json document (utf-8 bytes) with the current backend
+    """
+    return codec.dumps(value)
+
+
+def decode_batch(documents: list[str], type=None) -> list:
+    """
+    Decodes a list of json documents with the current backend
+    (see JsonCodec.decode_batch)
+    """
+    return codec.decode_batch(documents, type=type)
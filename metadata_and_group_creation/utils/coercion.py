@@ -0,0 +1,268 @@
+import logging
+import math
+from typing import Callable
+
+from utils import codec
+from utils.dates import ISO_DATE, iso_date
+
+# strings accepted in True/False columns (compared lowercase)
+TRUE_STRINGS = {"true", "yes", "y", "1"}
+FALSE_STRINGS = {"false", "no", "n", "0"}
+# number of distinct values looked at when inferring the type of a column
+INFERENCE_SAMPLE = 1000
+# number of failing values kept per column in a coercion report
+FAILURE_EXAMPLES = 5
+# marks values that could not be cast
+FAILED = object()
+logger = logging.getLogger(__name__)
+
+
+def coerce_number(value):
+    """
+    Casts a metadata value to a number (int or float)
+
+    Raises:
+        ValueError: If the value is not a number
+    """
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    if isinstance(value, bool):
+        raise ValueError(value)
+    if isinstance(value, (int, float)):
+        number = value
+    elif isinstance(value, str):
+        try:
+            number = int(value)
+        except ValueError:
+            number = float(value)
+    else:
+        raise ValueError(value)
+    if not math.isfinite(number):
+        # NaN and infinity are not valid json
+        raise ValueError(value)
+    return number
+
+
+def coerce_boolean(value):
+    """
+    Casts a metadata value to "true" or "false" (the values the column's text filter matches)
+
+    Raises:
+        ValueError: If the value is not a boolean
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)) and value in (0, 1):
+        return "true" if value else "false"
+    if isinstance(value, str):
+        if value.strip().lower() in TRUE_STRINGS:
+            return "true"
+        if value.strip().lower() in FALSE_STRINGS:
+            return "false"
+    raise ValueError(value)
+
+
+def coerce_date(value):
+    """
+    Casts a metadata value to an ISO-8601 date string
+
+    Raises:
+        ValueError: If the value is not a date
+    """
+    if value is None or value == "":
+        return None
+    if not isinstance(value, str):
+        raise ValueError(value)
+    return iso_date(value)
+
+
+def coerce_text(value):
+    """
+    Casts a metadata value to text
+    """
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (dict, list)):
+        return codec.dumps(value).decode("utf-8")
+    return str(value)
+
+
+def metadata_type_coercers() -> dict[str, Callable]:
+    """
+    Returns the metadata column types as keys and their coercers as values
+    """
+    return {
+        "Text": coerce_text,
+        "Number": coerce_number,
+        "Date": coerce_date,
+        "True/False": coerce_boolean,
+    }
+
+
+def infer_type(values: list, missing: object = None) -> str:
+    """
+    Infers the type of a metadata column that has no declared type
+
+    Args:
+        values (list): The values of the column
+        missing (object): Marker of absent values (ignored like nulls)
+
+    Returns:
+        dtype (str): True/False, Number, Date or Text
+    """
+    sample = []
+    seen = set()
+    for value in values:
+        if value is None or value is missing or value == "":
+            continue
+        try:
+            key = (value.__class__, value)
+            if key in seen:
+                continue
+            seen.add(key)
+        except TypeError:
+            # unhashable values (lists, dicts) are only displayed as text
+            return "Text"
+        sample.append(value)
+        if len(sample) >= INFERENCE_SAMPLE:
+            break
+    if not sample:
+        return "Text"
+    if all(
+        isinstance(value, bool)
+        or (isinstance(value, str) and value.lower() in ("true", "false"))
+        for value in sample
+    ):
+        return "True/False"
+    if all(succeeds(coerce_number, value) for value in sample):
+        return "Number"
+    # dates are only inferred from iso strings, dateutil would accept too much
+    if all(isinstance(value, str) and ISO_DATE.fullmatch(value) for value in sample):
+        return "Date"
+    return "Text"
+
+
+def succeeds(coerce: Callable, value) -> bool:
+    """
+    Whether the coercer can cast the value
+    """
+    try:
+        coerce(value)
+    except ValueError:
+        return False
+    return True
+
+
+def coerce_column(
+    values: list, dtype: str, missing: object = None
+) -> tuple[list, dict]:
+    """
+    Casts a whole metadata column to its type
+
+    Every distinct value is cast a single time. Nulls stay None, values that cannot
+    be cast become None and are reported.
+
+    Args:
+        values (list): The values of the column
+        dtype (str): Type of the column (Text, Number, Date or True/False)
+        missing (object): Marker of absent values, returned unchanged
+
+    Returns:
+        values (list): The cast values
+        failures (dict): Number of values that could not be cast ("count") and
+            a few of them ("examples")
+    """
+    coerce = metadata_type_coercers()[dtype]
+    failures = {"count": 0, "examples": []}
+
+    def cast_or_fail(value):
+        try:
+            return coerce(value)
+        except ValueError:
+            if len(failures["examples"]) < FAILURE_EXAMPLES:
+                failures["examples"].append(value)
+            return FAILED
+
+    # keyed by type too, so that 1, 1.0 and True are cast separately
+    cast = {}
+    coerced = []
+    for value in values:
+        if value is None or value is missing:
+            coerced.append(value)
+            continue
+        try:
+            key = (value.__class__, value)
+            result = cast[key]
+        except KeyError:
+            result = cast[key] = cast_or_fail(value)
+        except TypeError:
+            # unhashable values are cast one by one
+            result = cast_or_fail(value)
+        if result is FAILED:
+            failures["count"] += 1
+            result = None
+        coerced.append(result)
+    return coerced, failures
+
+
+def column_types(
+    columns: dict[str, list], types: dict[str, str], missing: object = None
+) -> dict[str, str]:
+    """
+    Returns the types of metadata columns, the declared ones or inferred from their values
+
+    Args:
+        columns (dict[str, list]): Metadata columns by field
+        types (dict[str, str]): Declared (or previously inferred) types by field
+        missing (object): Marker of absent values (ignored like nulls)
+
+    Returns:
+        types (dict[str, str]): Types of the columns by field
+    """
+    return {
+        field: types.get(field) or infer_type(values, missing=missing)
+        for field, values in columns.items()
+    }
+
+
+def coerce_columns(
+    columns: dict[str, list], types: dict[str, str], missing: object = None
+) -> tuple[dict[str, list], dict[str, dict]]:
+    """
+    Casts metadata columns to their declared types, inferring the types of the others
+
+    Args:
+        columns (dict[str, list]): Metadata columns by field
+        types (dict[str, str]): Declared types by field
+        missing (object): Marker of absent values, returned unchanged
+
+    Returns:
+        columns (dict[str, list]): The cast columns
+        report (dict[str, dict]): Type, number of failures and failing examples
+            of the columns with values that could not be cast
+    """
+    coerced = {}
+    report = {}
+    for field, dtype in column_types(columns, types, missing=missing).items():
+        coerced[field], failures = coerce_column(columns[field], dtype, missing=missing)
+        if failures["count"]:
+            report[field] = {"type": dtype, **failures}
+    return coerced, report
+
+
+def log_coercion_report(report: dict[str, dict]) -> None:
+    """
+    Logs the metadata columns with values that could not be cast (see coerce_columns)
+    """
+    for field, failures in report.items():
+        logger.warning(
+            "%d values of metadata column %s could not be cast to %s, e.g. %r",
+            failures["count"],
+            field,
+            failures["type"],
+            failures["examples"],
+        )
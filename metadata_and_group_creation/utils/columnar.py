@@ -0,0 +1,567 @@
+import sys
+from collections.abc import Mapping
+from itertools import chain
+from operator import itemgetter
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from utils import codec
+from utils.coercion import coerce_columns, column_types, log_coercion_report
+from utils.data import BYTES_PER_MEGABYTE, copy_column_defs
+from utils.schema import compile_schema
+
+# appsync number fields and their numpy dtypes (graphql Float / Int), the same
+# for every page of a table (sizes stored as integers by snapshots are floats too)
+NUMBER_FIELDS = {
+    "size": np.float64,
+    "r1FastqTotalReads": np.int64,
+    "r2FastqTotalReads": np.int64,
+    "r1FastqLength": np.int64,
+}
+# appsync text fields and the table columns they are displayed in
+TEXT_FIELDS = {
+    "fastqValidationStatus": "fastq validation status",
+    "created": "upload date",
+    "lotId": "bioskryb product lot id",
+}
+
+# marks metadata values that are absent from a row (as opposed to null)
+MISSING = object()
+# text columns with at most this share of distinct values are dictionary encoded
+CATEGORICAL_MAX_RATIO = 0.5
+
+
+def replace_none(values: list, null_value) -> list:
+    """
+    Returns the values with None replaced by null_value
+    """
+    return [null_value if value is None else value for value in values]
+
+
+class NumberColumn:
+    """
+    Typed numeric column with a null mask
+
+    Args:
+        values (np.ndarray): Column values (undefined where mask is set)
+        mask (np.ndarray): True where the value is null
+    """
+
+    __slots__ = ("values", "mask")
+
+    def __init__(self, values: np.ndarray, mask: np.ndarray):
+        self.values = values
+        self.mask = mask
+
+    @classmethod
+    def from_list(cls, values: list, dtype=None) -> "NumberColumn":
+        """
+        Builds the column from a list of numbers and None values
+        (dtype None: int64, or float64 when some values are floats)
+        """
+        array = np.array(values, dtype=object)
+        mask = np.equal(array, None)
+        array[mask] = 0
+        if dtype is None:
+            floats = any(isinstance(value, float) for value in values)
+            dtype = np.float64 if floats else np.int64
+        return cls(array.astype(dtype), mask)
+
+    @classmethod
+    def concatenate(cls, columns: list["NumberColumn"]) -> "NumberColumn":
+        """
+        Concatenates columns (e.g. one per page)
+        """
+        return cls(
+            np.concatenate([column.values for column in columns]),
+            np.concatenate([column.mask for column in columns]),
+        )
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def get(self, index: int, null_value=None):
+        """
+        Returns a single value as a python value, null_value for nulls
+        """
+        return null_value if self.mask[index] else self.values.item(index)
+
+    def to_list(self, null_value=None) -> list:
+        """
+        Returns the column as python values, with null_value for nulls
+        """
+        values = self.values.tolist()
+        for i in np.flatnonzero(self.mask).tolist():
+            values[i] = null_value
+        return values
+
+    def nbytes(self) -> int:
+        """
+        Returns the memory used by the column in bytes
+        """
+        return self.values.nbytes + self.mask.nbytes
+
+
+class CategoricalColumn:
+    """
+    Dictionary encoded column for values that repeat in many rows
+
+    Every distinct value is stored (interned) once in categories, the rows only
+    hold the position of their value as a small unsigned integer.
+
+    Args:
+        codes (np.ndarray): Position of each row's value in categories
+        categories (list): The distinct values
+    """
+
+    __slots__ = ("codes", "categories")
+
+    def __init__(self, codes: np.ndarray, categories: list):
+        self.codes = codes
+        self.categories = categories
+
+    @classmethod
+    def encode(cls, values: list, max_ratio: float = CATEGORICAL_MAX_RATIO):
+        """
+        Dictionary encodes a list of values
+
+        Args:
+            values (list): The values of the column
+            max_ratio (float): Maximum share of distinct values worth encoding
+
+        Returns:
+            column (CategoricalColumn | list): The encoded column, or the values
+                unchanged when they are (mostly) distinct or cannot be encoded
+        """
+        index = {}
+        try:
+            codes = [index.setdefault(value, len(index)) for value in values]
+        except TypeError:
+            # unhashable values (e.g. lists in metadata)
+            return values
+        if len(index) > max_ratio * len(values):
+            return values
+        if any(isinstance(value, (int, float)) for value in index):
+            # equal numbers of different types (1, 1.0, True) would be merged
+            return values
+        categories = [
+            sys.intern(value) if type(value) is str else value for value in index
+        ]
+        if len(categories) <= 1 << 8:
+            dtype = np.uint8
+        elif len(categories) <= 1 << 16:
+            dtype = np.uint16
+        else:
+            dtype = np.uint32
+        return cls(np.array(codes, dtype=dtype), categories)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def get(self, index: int):
+        """
+        Returns the value of a single row
+        """
+        return self.categories[self.codes[index]]
+
+    def to_list(self) -> list:
+        """
+        Returns the values of all rows
+        """
+        lookup = np.empty(len(self.categories), dtype=object)
+        lookup[:] = self.categories
+        return lookup[self.codes].tolist()
+
+    def nbytes(self) -> int:
+        """
+        Returns the memory used by the column in bytes
+        """
+        return (
+            self.codes.nbytes
+            + sys.getsizeof(self.categories)
+            + sum(map(sys.getsizeof, self.categories))
+        )
+
+
+def column_to_list(column) -> list:
+    """
+    Returns the values of a table column (list, NumberColumn or CategoricalColumn)
+    """
+    if isinstance(column, (NumberColumn, CategoricalColumn)):
+        return column.to_list()
+    return column
+
+
+def column_value(column, index: int):
+    """
+    Returns the value of a single row of a table column
+    """
+    if isinstance(column, (NumberColumn, CategoricalColumn)):
+        return column.get(index)
+    return column[index]
+
+
+def column_nbytes(column) -> int:
+    """
+    Returns the memory used by a table column in bytes
+    (objects shared between rows are counted once)
+    """
+    if isinstance(column, (NumberColumn, CategoricalColumn)):
+        return column.nbytes()
+    distinct = {id(value): value for value in column}
+    return sys.getsizeof(column) + sum(map(sys.getsizeof, distinct.values()))
+
+
+class RowView(Mapping):
+    """
+    Read-only row of a ColumnarTable that behaves like its row record
+
+    Values are looked up in the table's columns when accessed; a view only holds
+    the table and the row index.
+
+    Args:
+        table (ColumnarTable): The table
+        index (int): Position of the row in the table
+    """
+
+    __slots__ = ("table", "index")
+
+    def __init__(self, table: "ColumnarTable", index: int):
+        self.table = table
+        self.index = index
+
+    def __getitem__(self, key: str):
+        return self.table.value(self.index, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return self.table.row_keys(self.index)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"RowView({dict(self)!r})"
+
+
+class ColumnarTable:
+    """
+    Project table stored as typed columns instead of row dicts
+
+    The appsync items are turned into columns once; derived columns are computed
+    vectorized, and ag grid row records are only built by to_row_data.
+
+    Args:
+        column_defs (list[dict]): Column definitions for ag grid
+        columns (dict): Table columns by field name, lists of python values,
+            NumberColumn for numeric columns or CategoricalColumn
+        metadata_columns (dict): Metadata/custom columns (lists or CategoricalColumn),
+            MISSING where the key is absent from a biosample's metadata
+        coercion_report (dict[str, dict]): Metadata columns with values that could
+            not be cast to the column's type (see utils.coercion.coerce_columns)
+        metadata_key_orders (list | CategoricalColumn): Metadata keys of every
+            biosample in the order of its metadata json (None: the order of metadata_columns)
+        types (dict[str, str]): Types of the metadata columns, declared or inferred
+            (rows added to the table later are cast to the same types)
+    """
+
+    def __init__(
+        self,
+        column_defs: list[dict],
+        columns: dict,
+        metadata_columns: dict,
+        coercion_report: dict[str, dict] = None,
+        metadata_key_orders=None,
+        types: dict[str, str] = None,
+    ):
+        self.column_defs = column_defs
+        self.columns = columns
+        self.metadata_columns = metadata_columns
+        self.coercion_report = coercion_report or {}
+        self.metadata_key_orders = metadata_key_orders
+        self.types = types or {}
+
+    def __len__(self) -> int:
+        return len(self.columns["biosamplename"])
+
+    @classmethod
+    def from_pages(cls, appsync_pages: Iterable[dict]) -> "ColumnarTable":
+        """
+        Builds the table from biosample pages in the getProject shape
+
+        Args:
+            appsync_pages (Iterable[dict]): Biosample pages from appsync for a project
+
+        Returns:
+            table (ColumnarTable): The table
+        """
+        schema = None
+        fields = None
+        text = {}
+        numbers = {}
+        metadata_strings = []
+        for page in appsync_pages:
+            if schema is None:
+                schema = compile_schema(page["biosampleMetadataColumns"])
+            items = page["biosamples"]["items"]
+            if not items:
+                continue
+            if fields is None:
+                # every item of a response has the same (selected) fields
+                fields = [field for field in items[0]]
+            for field in fields:
+                values = list(map(itemgetter(field), items))
+                if field in NUMBER_FIELDS:
+                    numbers.setdefault(field, []).append(
+                        NumberColumn.from_list(values, NUMBER_FIELDS[field])
+                    )
+                elif field == "metadata":
+                    metadata_strings.extend(replace_none(values, "{}"))
+                else:
+                    null_value = None if field not in TEXT_FIELDS else ""
+                    text.setdefault(field, []).extend(replace_none(values, null_value))
+        fields = fields or []
+        numbers = {
+            field: NumberColumn.concatenate(pages) for field, pages in numbers.items()
+        }
+        # both read counts are summed up into a single column
+        reads = "r1FastqTotalReads" in numbers and "r2FastqTotalReads" in numbers
+        columns = {"biosamplename": text.pop("biosampleName", [])}
+        # fields without a column of their own keep their (lowercase) name,
+        # in the order of the fields, like create_column_defs_and_row_data
+        for field in fields:
+            if field == "metadata":
+                columns["metadata"] = metadata_strings
+            elif field in text and field not in TEXT_FIELDS:
+                columns[field.lower()] = text[field]
+            elif field in ("r1FastqTotalReads", "r2FastqTotalReads") and not reads:
+                columns[field.lower()] = numbers[field]
+        renamed = {}
+        for field in fields:
+            if field in TEXT_FIELDS:
+                renamed[TEXT_FIELDS[field]] = CategoricalColumn.encode(text[field])
+            elif field == "size":
+                renamed["size"] = numbers["size"]
+                renamed["size mb"] = NumberColumn(
+                    np.round(numbers["size"].values / BYTES_PER_MEGABYTE, 2),
+                    numbers["size"].mask,
+                )
+            elif field == "r1FastqLength":
+                renamed["read length"] = numbers["r1FastqLength"]
+        if reads:
+            r1, r2 = numbers["r1FastqTotalReads"], numbers["r2FastqTotalReads"]
+            renamed["total number of reads"] = NumberColumn(
+                r1.values + r2.values, r1.mask | r2.mask
+            )
+        # renamed columns follow the other fields, in table column order
+        for column in cls.column_order():
+            if column in renamed:
+                columns[column] = renamed[column]
+        metadata_columns, key_orders = cls.decode_metadata(metadata_strings)
+        if schema is None:
+            return cls([], columns, metadata_columns, metadata_key_orders=key_orders)
+        # metadata is cast to the declared (or inferred) types a column at a time
+        types = {
+            **schema.types,
+            **column_types(metadata_columns, schema.types, missing=MISSING),
+        }
+        metadata_columns, coercion_report = coerce_columns(
+            metadata_columns, types, missing=MISSING
+        )
+        metadata_columns = {
+            key: CategoricalColumn.encode(values)
+            for key, values in metadata_columns.items()
+        }
+        return cls(
+            schema.column_defs,
+            columns,
+            metadata_columns,
+            coercion_report,
+            metadata_key_orders=key_orders,
+            types=types,
+        )
+
+    @staticmethod
+    def column_order() -> list[str]:
+        """
+        Returns the order of the renamed mandatory columns in the row records
+        (the order create_column_defs_and_row_data produces, after biosamplename
+        and the fields that keep their name)
+        """
+        return [
+            "fastq validation status",
+            "size",
+            "size mb",
+            "total number of reads",
+            "read length",
+            "upload date",
+            "bioskryb product lot id",
+        ]
+
+    @staticmethod
+    def decode_metadata(metadata_strings: list[str]) -> tuple[dict[str, list], list]:
+        """
+        Decodes the metadata json strings into one column per metadata key
+
+        Returns:
+            metadata_columns (dict[str, list]): Values by metadata key, in order of
+                first appearance (MISSING where a biosample does not have the key)
+            key_orders (list | CategoricalColumn): Metadata keys of every biosample in
+                the order of its json, None when they all follow metadata_columns
+        """
+        # one decoder call for the whole table instead of one per row
+        decoded = codec.decode_batch(metadata_strings)
+        # metadata keys in order of first appearance
+        keys = dict.fromkeys(chain.from_iterable(decoded))
+        positions = {key: i for i, key in enumerate(keys)}
+        key_orders = CategoricalColumn.encode(list(map(tuple, decoded)))
+        distinct = (
+            key_orders.categories
+            if isinstance(key_orders, CategoricalColumn)
+            else key_orders
+        )
+        in_order = all(
+            list(order) == sorted(order, key=positions.__getitem__)
+            for order in distinct
+        )
+        metadata_columns = {
+            key: [metadata.get(key, MISSING) for metadata in decoded] for key in keys
+        }
+        return metadata_columns, None if in_order else key_orders
+
+    def metadata_keys(self, index: int):
+        """
+        Returns the metadata keys of a row in the order of its metadata json
+        (None when they follow metadata_columns)
+        """
+        if self.metadata_key_orders is None:
+            return None
+        return column_value(self.metadata_key_orders, index)
+
+    def row_columns(self) -> list[str]:
+        """
+        Returns the mandatory columns of the row records
+        (the ones create_column_defs_and_row_data produces)
+        """
+        return list(self.columns)
+
+    def value(self, index: int, key: str):
+        """
+        Returns the value of a row's column, as in the row record
+
+        Raises:
+            KeyError: If the row record does not have the column
+        """
+        if key in self.metadata_columns:
+            value = column_value(self.metadata_columns[key], index)
+            if value is not MISSING:
+                return value
+        if key in self.columns:
+            return column_value(self.columns[key], index)
+        raise KeyError(key)
+
+    def row_keys(self, index: int) -> Iterator[str]:
+        """
+        Yields the keys of a row record in order
+        """
+        columns = self.row_columns()
+        yield from columns
+        emitted = set(columns)
+        keys = self.metadata_keys(index)
+        if keys is not None:
+            yield from (key for key in keys if key not in emitted)
+            return
+        for key, column in self.metadata_columns.items():
+            if key not in emitted and column_value(column, index) is not MISSING:
+                yield key
+
+    def row(self, index: int) -> RowView:
+        """
+        Returns a view of a single row
+        """
+        return RowView(self, index)
+
+    def rows(self) -> Iterator[RowView]:
+        """
+        Yields views of all rows
+        """
+        return map(self.row, range(len(self)))
+
+    def nbytes(self) -> int:
+        """
+        Returns the memory used by the table's columns in bytes
+        """
+        return sum(map(column_nbytes, self.columns.values())) + sum(
+            map(column_nbytes, self.metadata_columns.values())
+        )
+
+    def bytes_per_row(self) -> float:
+        """
+        Returns the memory used per row in bytes (e.g. to size worker memory)
+        """
+        return self.nbytes() / len(self) if len(self) else 0.0
+
+    def to_row_data(self, columns: Iterable[str] = None) -> list[dict]:
+        """
+        Builds the ag grid row records
+
+        Args:
+            columns (Iterable[str]): Mandatory columns to include
+                (None for the ones create_column_defs_and_row_data produces)
+
+        Returns:
+            row_data (list[dict]): List of row data for ag grid
+        """
+        columns = self.row_columns() if columns is None else list(columns)
+        values = [column_to_list(self.columns[name]) for name in columns]
+        metadata_columns = {
+            key: column_to_list(column) for key, column in self.metadata_columns.items()
+        }
+        # metadata values override mandatory values of the same name (in place)
+        keys = list(dict.fromkeys(columns + list(metadata_columns)))
+        positions = {key: i for i, key in enumerate(keys)}
+        values += [None] * (len(keys) - len(values))
+        overridden = {}
+        for key, column in metadata_columns.items():
+            overridden[key] = values[positions[key]]
+            values[positions[key]] = column
+        row_data = [dict(zip(keys, row)) for row in zip(*values)]
+        # drop the metadata keys that are absent from a biosample's metadata
+        # (or restore the mandatory value they were overriding)
+        for key, column in metadata_columns.items():
+            mandatory = overridden[key]
+            for i, value in enumerate(column):
+                if value is MISSING:
+                    if mandatory is None:
+                        del row_data[i][key]
+                    else:
+                        row_data[i][key] = mandatory[i]
+        if self.metadata_key_orders is not None:
+            # metadata keys in the order of each biosample's json
+            emitted = set(columns)
+            for i, row in enumerate(row_data):
+                order = columns + [
+                    key for key in self.metadata_keys(i) if key not in emitted
+                ]
+                if list(row) != order:
+                    row_data[i] = {key: row[key] for key in order}
+        return row_data
+
+
+def create_column_defs_and_row_data_columnar(
+    appsync_pages: Iterable[dict],
+) -> tuple[list, list]:
+    """
+    Columnar counterpart of create_column_defs_and_row_data_from_pages
+
+    Args:
+        appsync_pages (Iterable[dict]): Biosample pages from appsync for a specific project
+
+    Returns:
+        column_defs (list): List of column definitions for ag grid
+        row_data (list): List of row data for ag grid
+    """
+    table = ColumnarTable.from_pages(appsync_pages)
+    log_coercion_report(table.coercion_report)
+    # the column definitions of the compiled schema are shared
+    return copy_column_defs(table.column_defs), table.to_row_data()
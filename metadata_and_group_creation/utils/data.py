@@ -1,15 +1,37 @@
+import functools
+import hashlib
 import json
 import pprint
-
-import dateutil.parser as parser
+from itertools import chain
+from typing import Iterable, Iterator
+
+from utils import codec
+from utils.coercion import (
+    coerce_columns,
+    column_types,
+    log_coercion_report,
+    metadata_type_coercers,
+)
+from utils.dates import normalize_date_value, to_datetime
+
+# number of distinct column definitions kept by the column def registry
+COLUMN_DEF_CACHE_SIZE = 1024
+# column definition keys that hold view state rather than the column itself
+COLUMN_STATE_KEYS = ["hide"]
+# bytes per megabyte of the size column
+BYTES_PER_MEGABYTE = 1024 * 1024
 
 
 def parse_date_from_iso(data):
-    return parser.parse(data).strftime("%m/%d/%Y")
+    return to_datetime(data).strftime("%m/%d/%Y")
 
 
 def parse_date_to_iso(data):
-    return parser.parse(data).isoformat()
+    return to_datetime(data).isoformat()
+
+
+def parse_date(data):
+    return normalize_date_value(data)
 
 
 def appsync_data_types() -> dict[str]:
@@ -29,6 +51,41 @@ def appsync_data_types() -> dict[str]:
     }
 
 
+def appsync_null_values() -> dict:
+    """
+    Returns the substitutes for None values by appsync field name
+    """
+    return {
+        field: get_alternative_value(dtype)
+        for field, dtype in appsync_data_types().items()
+    }
+
+
+def appsync_field_columns() -> dict[str, str]:
+    """
+    Returns appsync field names as keys and the (lowercase) table columns
+    they are renamed to as values, in table column order
+    """
+    return {
+        "fastqValidationStatus": "fastq validation status",
+        "size": "size",
+        "r1FastqLength": "read length",
+        "created": "upload date",
+        "lotId": "bioskryb product lot id",
+    }
+
+
+def size_in_megabytes(size):
+    """
+    Returns a size in bytes in megabytes rounded to 2 decimals (the "size mb" value
+    the size column displays and filters on), None when the size is unknown
+    """
+    if not isinstance(size, (int, float)) or isinstance(size, bool):
+        return None
+    # rounded like numpy.round, so both table engines produce the same values
+    return round(size / BYTES_PER_MEGABYTE * 100) / 100
+
+
 def mandatory_columns_export() -> list[str]:
     """
     Lists out the basejumper mandatory columns for export
@@ -59,11 +116,45 @@ def mandatory_columns() -> list[str]:
     ]
 
 
+def mandatory_column_fields() -> dict[str, list[str]]:
+    """
+    Returns basejumper mandatory column names as keys and the appsync fields they are built from as values
+    """
+    return {
+        "biosamplename": ["biosampleName"],
+        "fastq validation status": ["fastqValidationStatus"],
+        "size": ["size"],
+        "total number of reads": ["r1FastqTotalReads", "r2FastqTotalReads"],
+        "read length": ["r1FastqLength"],
+        "upload date": ["created"],
+        "bioskryb product lot id": ["lotId"],
+    }
+
+
+def fields_for_columns(columns: Iterable[str]) -> list[str]:
+    """
+    Returns the appsync biosample fields needed to display the given table columns
+
+    Mandatory columns map to their own fields, any other (custom) column is read
+    from the metadata json. biosampleName is always needed to identify the rows.
+
+    Args:
+        columns (Iterable[str]): Table column names (fields of the column definitions)
+
+    Returns:
+        fields (list[str]): Appsync biosample fields
+    """
+    column_fields = mandatory_column_fields()
+    fields = {"biosampleName"}
+    for column in columns:
+        fields.update(column_fields.get(column.lower(), ["metadata"]))
+    return sorted(fields)
+
+
 def convert_columns_for_export(column_defs: list[dict]) -> list[str]:
     # pprint.pprint(column_defs)
-    non_mandatory = list(
-        filter(lambda x: x["field"] not in mandatory_columns(), column_defs)
-    )
+    mandatory = set(mandatory_columns())
+    non_mandatory = list(filter(lambda x: x["field"] not in mandatory, column_defs))
     return mandatory_columns_export() + list(
         map(lambda x: x["headerName"], non_mandatory)
     )
@@ -76,7 +167,8 @@ def get_alternative_value(dtype: str):
     if dtype == "True/False":
         return ""
     elif dtype == "Number":
-        return ""
+        # numbers stay null, so the grid filters and sorts them as numbers
+        return None
     elif dtype == "Date":
         return ""
     elif dtype == "Text":
@@ -113,23 +205,25 @@ def modify_mandatory_data(
 
     for biosample in list_of_biosamples:
         # manually adding modified biosamples data from appsync to be displayed in the table
-        biosample["FASTQ Validation Status"] = biosample["fastqValidationStatus"]
-        biosample["Size"] = biosample["size"]
-        biosample["Total Number of Reads"] = (
-            biosample["r1FastqTotalReads"] + biosample["r2FastqTotalReads"]
-        )
-        biosample["Read Length"] = biosample["r1FastqLength"]
-        biosample["Upload Date"] = biosample["created"]
-        # biosample["Upload Date"] = parse_date(biosample["created"])
-        biosample["Bioskryb Product Lot ID"] = biosample["lotId"]
-        # removing the unnecessary data from the biosamples
-        del biosample["fastqValidationStatus"]
-        del biosample["size"]
-        del biosample["r1FastqTotalReads"]
-        del biosample["r2FastqTotalReads"]
-        del biosample["r1FastqLength"]
-        del biosample["created"]
-        del biosample["lotId"]
+        # and removing the unnecessary data from the biosamples
+        # (fields that were not requested from appsync are skipped)
+        if "fastqValidationStatus" in biosample:
+            biosample["FASTQ Validation Status"] = biosample.pop(
+                "fastqValidationStatus"
+            )
+        if "size" in biosample:
+            biosample["Size"] = biosample.pop("size")
+        if "r1FastqTotalReads" in biosample and "r2FastqTotalReads" in biosample:
+            biosample["Total Number of Reads"] = biosample.pop(
+                "r1FastqTotalReads"
+            ) + biosample.pop("r2FastqTotalReads")
+        if "r1FastqLength" in biosample:
+            biosample["Read Length"] = biosample.pop("r1FastqLength")
+        if "created" in biosample:
+            biosample["Upload Date"] = biosample.pop("created")
+            # biosample["Upload Date"] = parse_date(biosample["created"])
+        if "lotId" in biosample:
+            biosample["Bioskryb Product Lot ID"] = biosample.pop("lotId")
 
     # transforming the column names to lowercase for consistency
     column_data = list(
@@ -142,33 +236,87 @@ def modify_mandatory_data(
     return column_data, list_of_biosamples
 
 
-def modify_metadata(row_data: dict, metadata_columns: list[dict]) -> dict:
+def modify_metadata(row_data: dict, metadata_types: dict[str, str]) -> dict:
     """
     Modifies the metadata to be displayed in the table
 
     Args:
         row_data (dict): A single row of data from the appsync
-        metadata_columns (list[dict]): List of metadata columns
+        metadata_types (dict[str, str]): Declared types of the metadata columns
+            (metadata_column_types)
 
     Returns:
         metadata (dict): A single row modified metadata to be displayed in the table
+            (values that cannot be cast to their declared type are kept as they are)
     """
     # reads string and converts it to a dictionary
-    metadata = json.loads(row_data["metadata"])
+    # (metadata is missing when it was not requested from appsync)
+    metadata = codec.loads(row_data.get("metadata", "{}"))
 
-    # adds date and time filters to appropriate columns
-    metadata_date_columns = list(
+    # casts the values of the declared columns to their types
+    return coerce_metadata(metadata, metadata_coercers(metadata_types))
+
+
+def metadata_date_columns(metadata_types: dict[str, str]) -> list[str]:
+    """
+    Returns the fields of the metadata columns declared as dates
+    """
+    return list(
         map(
-            lambda y: y["field"],
-            filter(lambda x: x["filter"] == "agDateColumnFilter", metadata_columns),
+            lambda y: y[0],
+            filter(lambda x: x[1] == "Date", metadata_types.items()),
         )
     )
-    for column in metadata_date_columns:
+
+
+def metadata_column_types(biosample_metadata_columns: str) -> dict[str, str]:
+    """
+    Returns the fields of the metadata columns as keys and their declared types
+    (the "type" of the columns in biosampleMetadataColumns) as values
+
+    Columns of types without a coercer are left out, their values are
+    inferred like those of undeclared keys.
+
+    Args:
+        biosample_metadata_columns (str): biosampleMetadataColumns value from appsync (json string)
+
+    Returns:
+        types (dict[str, str]): Declared types by field
+    """
+    type_coercers = metadata_type_coercers()
+    return {
+        column["name"]: column["type"]
+        for column in codec.loads(biosample_metadata_columns)["columns"]
+        if column.get("type") in type_coercers
+    }
+
+
+def metadata_coercers(metadata_types: dict[str, str]) -> dict:
+    """
+    Returns the metadata fields as keys and the functions casting their values
+    to the declared types as values (raising ValueError, see coerce_metadata)
+    """
+    type_coercers = metadata_type_coercers()
+    return {field: type_coercers[dtype] for field, dtype in metadata_types.items()}
+
+
+def coerce_metadata(metadata: dict, coercers: dict, uncast: list = None) -> dict:
+    """
+    Converts the values of a decoded metadata dict with the coercers of their fields (in place)
+
+    Values that cannot be cast are kept as they are, their fields are added
+    to uncast (if given) so that the caller can null and report them
+    (see coerce_undeclared_metadata).
+    """
+    for column, coerce in coercers.items():
         try:
-            metadata[column] = parse_date(metadata[column])
+            metadata[column] = coerce(metadata[column])
         except KeyError:
-            # column doesn't contain any date
+            # the row has no value for the column
             pass
+        except ValueError:
+            if uncast is not None:
+                uncast.append(column)
     return metadata
 
 
@@ -267,16 +415,13 @@ def create_column_def(col: str, dtype: str, def_addition: dict = {}) -> dict:
             **def_addition,
         }
     # make size column to be displayed in megabytes
+    # (the formatters are defined in assets/dashAgGridFunctions.js)
     if col == "size":
         return {
             **default_def,
             **{
-                "valueFormatter": {
-                    "function": "(d3.format(',')((params.data.size / (1024 * 1024)).toFixed(2))) + ' MB'"
-                },
-                "filterValueGetter": {
-                    "function": "(params.data.size / (1024 * 1024)).toFixed(2)"
-                },
+                "valueFormatter": {"function": "formatSize(params)"},
+                "filterValueGetter": {"function": "sizeInMegabytes(params)"},
             },
             **def_addition,
         }
@@ -285,9 +430,7 @@ def create_column_def(col: str, dtype: str, def_addition: dict = {}) -> dict:
         return {
             **default_def,
             **{
-                "valueFormatter": {
-                    "function": f"(params.data['{col}']) ? d3.format(',')(params.data['{col}']) : ''"
-                },
+                "valueFormatter": {"function": "formatNumber(params)"},
                 # "valueFormatter": {"function": "params.data['{col}'].toLocaleString()"},
                 # "filterValueGetter": {"function": "params.data['{col}']"},
             },
@@ -303,9 +446,7 @@ def create_column_def(col: str, dtype: str, def_addition: dict = {}) -> dict:
                 },
                 # "valueGetter": {
                 # },
-                "valueFormatter": {
-                    "function": "d3.isoParse(params.value).toLocaleDateString('en-US')"
-                },
+                "valueFormatter": {"function": "formatDate(params)"},
                 # "filterValueGetter": {
                 #     "function": "d3.isoParse(params.value).toLocaleDateString('en-US')"
                 # },
@@ -326,6 +467,101 @@ def create_column_def(col: str, dtype: str, def_addition: dict = {}) -> dict:
         }
 
 
+def registered_column_def(col: str, dtype: str, def_addition: dict = {}) -> dict:
+    """
+    Returns the column definition of create_column_def from the column def registry
+
+    Definitions are built once per (column name, data type, additions); every
+    caller gets its own copy (see copy_column_def), which it may modify.
+
+    Args:
+        col (str): Column name
+        dtype (str): Data type of the column
+        def_addition (dict): Additional column definition to be added
+
+    Returns:
+        column_def (dict): Column definition for ag grid
+    """
+    try:
+        def_addition_key = (
+            json.dumps(def_addition, sort_keys=True) if def_addition else ""
+        )
+    except TypeError:
+        # additions that are not json (e.g. dash components) are not shared
+        return create_column_def(col, dtype, def_addition)
+    return copy_column_def(_frozen_column_def(col, dtype, def_addition_key))
+
+
+@functools.lru_cache(maxsize=COLUMN_DEF_CACHE_SIZE)
+def _frozen_column_def(col: str, dtype: str, def_addition_key: str) -> dict:
+    """
+    Returns the registered column definition for (column name, data type, additions as json)
+
+    The definition is kept by the registry and never handed out, only its copies.
+    """
+    return create_column_def(
+        col, dtype, json.loads(def_addition_key) if def_addition_key else {}
+    )
+
+
+def copy_column_def(column_def: dict) -> dict:
+    """
+    Returns a copy of a column definition
+
+    Column definitions are at most two dicts deep (e.g. filterParams) with lists
+    of strings at the bottom; these are copied as well.
+    """
+    copy = column_def.copy()
+    for key, value in column_def.items():
+        if isinstance(value, dict):
+            copy[key] = {
+                inner_key: (
+                    inner_value.copy()
+                    if isinstance(inner_value, (dict, list))
+                    else inner_value
+                )
+                for inner_key, inner_value in value.items()
+            }
+        elif isinstance(value, list):
+            copy[key] = value.copy()
+    return copy
+
+
+def copy_column_defs(column_defs: list[dict]) -> list[dict]:
+    """
+    Returns copies of column definitions (see copy_column_def)
+
+    Tables cached or compiled once share their column definitions, the functions
+    handing them out return copies, so callers may modify them (e.g. hide columns).
+    """
+    return list(map(copy_column_def, column_defs))
+
+
+def column_defs_fingerprint(column_defs: list[dict]) -> str:
+    """
+    Returns a hash of column definitions, ignoring view state such as hidden columns
+
+    Callbacks compare fingerprints to tell whether the columnDefs of a table
+    have to be sent again.
+
+    Args:
+        column_defs (list[dict]): Column definitions for ag grid
+
+    Returns:
+        fingerprint (str): The hash
+    """
+    columns = [
+        {
+            key: value
+            for key, value in column_def.items()
+            if key not in COLUMN_STATE_KEYS
+        }
+        for column_def in column_defs or []
+    ]
+    value = json.dumps(columns, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(value.encode("utf-8")).hexdigest()
+
+
 def clean_null_values_from_appsync_response(biosamples: list[dict]) -> list[dict]:
     """
     Cleans up the biosamples data from None values
@@ -335,14 +571,262 @@ def clean_null_values_from_appsync_response(biosamples: list[dict]) -> list[dict
     Returns:
         biosamples (list[dict]): List of biosamples from appsync with None values cleaned up
     """
+    null_values = appsync_null_values()
     for biosample in biosamples:
         for key, value in biosample.items():
             if value is None:
-                biosample[key] = get_alternative_value(appsync_data_types()[key])
+                biosample[key] = null_values[key]
 
     return biosamples
 
 
+def create_column_defs(biosample_metadata_columns: str) -> tuple[list, list]:
+    """
+    Creates the column definitions for the mandatory basejumper columns and the metadata/custom columns
+
+    The definitions are copies from the column def registry (registered_column_def).
+
+    Args:
+        biosample_metadata_columns (str): biosampleMetadataColumns value from appsync (json string)
+
+    Returns:
+        mandatory_column_defs (list): List of column definitions for the mandatory columns
+        metadata_column_defs (list): List of column definitions for the metadata/custom columns
+    """
+    modified_mandatory_column_data, _ = modify_mandatory_data([])
+    mandatory_column_defs = list(
+        map(
+            lambda x: registered_column_def(
+                x["name"], x["type"]
+            ),  # , {"pinned": "left"}),
+            [{"name": "biosampleName", "type": "Text"}]
+            + modified_mandatory_column_data,
+        )
+    )
+    metadata_column_defs = list(
+        map(
+            lambda x: registered_column_def(x["name"], x["type"]),
+            codec.loads(biosample_metadata_columns)["columns"],
+        )
+    )
+    return mandatory_column_defs, metadata_column_defs
+
+
+def create_row_data(biosamples: list[dict], metadata_types: dict[str, str]) -> list:
+    """
+    Creates the row data for the table from a list of appsync biosamples
+
+    Args:
+        biosamples (list[dict]): List of biosamples from appsync (a whole project or a single page)
+        metadata_types (dict[str, str]): Declared types of the metadata columns
+            (metadata_column_types)
+
+    Returns:
+        row_data (list): List of row data for ag grid
+    """
+    row_data, undeclared = transform_biosamples(
+        biosamples,
+        metadata_coercers(metadata_types),
+        appsync_null_values(),
+        appsync_field_columns(),
+    )
+    coerce_undeclared_metadata(row_data, undeclared, metadata_types)
+    return row_data
+
+
+def transform_biosample(
+    biosample: dict,
+    coercers: dict,
+    null_values: dict,
+    field_columns: dict[str, str],
+    uncast_keys: list = None,
+) -> dict:
+    """
+    Turns a single appsync biosample into a row of the table in one pass
+
+    Fuses clean_null_values_from_appsync_response, modify_mandatory_data,
+    modify_metadata and the merge of create_row_data; the biosample is not modified.
+    Metadata keys without a coercer keep their json values, as do values that
+    cannot be cast to their declared type (see coerce_undeclared_metadata).
+
+    Args:
+        biosample (dict): A biosample from appsync
+        coercers (dict): Coercers of the metadata fields (metadata_coercers)
+        null_values (dict): Substitutes for None values (appsync_null_values)
+        field_columns (dict[str, str]): Renamed mandatory fields (appsync_field_columns)
+        uncast_keys (list): Receives the metadata keys whose values were not cast (if given)
+
+    Returns:
+        row (dict): Row data for ag grid
+    """
+    # both read counts are summed up into a single column
+    reads = "r1FastqTotalReads" in biosample and "r2FastqTotalReads" in biosample
+    row = {"biosamplename": biosample["biosampleName"]}
+    renamed = {}
+    for key, value in biosample.items():
+        if value is None:
+            value = null_values.get(key)
+        if key in field_columns:
+            renamed[field_columns[key]] = value
+        elif reads and (key == "r1FastqTotalReads" or key == "r2FastqTotalReads"):
+            renamed[key] = value
+        else:
+            row[key.lower()] = value
+    # renamed columns follow the other fields, in table column order
+    for key, column in field_columns.items():
+        if key == "r1FastqLength" and reads:
+            r1, r2 = renamed["r1FastqTotalReads"], renamed["r2FastqTotalReads"]
+            row["total number of reads"] = None if r1 is None or r2 is None else r1 + r2
+        if column in renamed:
+            row[column] = renamed[column]
+            if column == "size":
+                # a graphql Float, also when a snapshot stored it as an integer
+                # (the columnar table holds a single float64 column)
+                if row[column] is not None:
+                    row[column] = float(row[column])
+                # precomputed, so the grid does not convert the size per cell
+                row["size mb"] = size_in_megabytes(renamed[column])
+    # metadata/custom columns override mandatory columns of the same name
+    metadata = codec.loads(row.get("metadata", "{}"))
+    if uncast_keys is not None:
+        uncast_keys.extend(filter(lambda key: key not in coercers, metadata))
+    row.update(coerce_metadata(metadata, coercers, uncast_keys))
+    return row
+
+
+def transform_biosamples(
+    biosamples: Iterable[dict],
+    coercers: dict,
+    null_values: dict,
+    field_columns: dict[str, str],
+) -> tuple[list[dict], dict[str, list[int]]]:
+    """
+    Turns appsync biosamples into rows of the table (see transform_biosample)
+
+    Args:
+        biosamples (Iterable[dict]): Biosamples from appsync
+        coercers (dict): Coercers of the metadata fields (metadata_coercers)
+        null_values (dict): Substitutes for None values (appsync_null_values)
+        field_columns (dict[str, str]): Renamed mandatory fields (appsync_field_columns)
+
+    Returns:
+        row_data (list[dict]): Row data for ag grid
+        undeclared (dict[str, list[int]]): Positions of the rows holding each
+            metadata key without a coercer, or a value its coercer could not cast
+            (these values are not cast yet)
+    """
+    row_data = []
+    undeclared = {}
+    uncast_keys = []
+    for position, biosample in enumerate(biosamples):
+        row_data.append(
+            transform_biosample(
+                biosample, coercers, null_values, field_columns, uncast_keys
+            )
+        )
+        for key in uncast_keys:
+            undeclared.setdefault(key, []).append(position)
+        uncast_keys.clear()
+    return row_data, undeclared
+
+
+def coerce_undeclared_metadata(
+    row_data: list[dict], undeclared: dict[str, list[int]], types: dict[str, str]
+) -> dict[str, str]:
+    """
+    Casts the metadata keys without a declared type a column at a time (in place),
+    like the columnar table does, so every transform produces the same values
+
+    Values of declared columns that could not be cast by the row transform are
+    cast again with their declared type: they become None and are reported
+    (log_coercion_report) with the failures of the undeclared keys.
+
+    Args:
+        row_data (list[dict]): Row data (from transform_biosamples)
+        undeclared (dict[str, list[int]]): Positions of the rows holding each key
+            (from transform_biosamples)
+        types (dict[str, str]): Types of the table's metadata columns; the types
+            of keys missing from it are inferred from the values
+
+    Returns:
+        types (dict[str, str]): types with the types of the undeclared keys
+    """
+    columns = {
+        key: [row_data[position][key] for position in positions]
+        for key, positions in undeclared.items()
+    }
+    types = {**types, **column_types(columns, types)}
+    columns, report = coerce_columns(columns, types)
+    log_coercion_report(report)
+    for key, positions in undeclared.items():
+        for position, value in zip(positions, columns[key]):
+            row_data[position][key] = value
+    return types
+
+
+def iter_row_data(
+    appsync_pages: Iterable[dict], metadata_types: dict[str, str]
+) -> Iterator[dict]:
+    """
+    Yields the rows of the table page by page
+
+    Only the page being transformed is held, the pages are not modified. Metadata
+    keys without a declared type keep their json values (the whole column is needed
+    to infer their types, see coerce_undeclared_metadata), as do values that cannot
+    be cast to their declared type.
+
+    Args:
+        appsync_pages (Iterable[dict]): Biosample pages from appsync for a specific project
+        metadata_types (dict[str, str]): Declared types of the metadata columns
+            (metadata_column_types)
+
+    Yields:
+        row (dict): Row data for ag grid
+    """
+    coercers = metadata_coercers(metadata_types)
+    null_values = appsync_null_values()
+    field_columns = appsync_field_columns()
+    for page in appsync_pages:
+        for biosample in page["biosamples"]["items"]:
+            yield transform_biosample(biosample, coercers, null_values, field_columns)
+
+
+def merge_row_data(row_data: list[dict], changed_row_data: list[dict]) -> list[dict]:
+    """
+    Merges changed rows (from a delta sync) into previously synced row data by biosamplename
+
+    Changed rows replace the existing rows in place, new biosamples are appended.
+
+    Args:
+        row_data (list[dict]): Previously synced row data (left unmodified)
+        changed_row_data (list[dict]): Row data of the changed biosamples
+
+    Returns:
+        row_data (list[dict]): New list with the merged row data
+    """
+    changed = {row["biosamplename"]: row for row in changed_row_data}
+    merged = []
+    for row in row_data:
+        merged.append(changed.pop(row["biosamplename"], row))
+    merged.extend(changed.values())
+    return merged
+
+
+def merge_row_columns(row_data: list[dict], partial_row_data: list[dict]) -> list[dict]:
+    """
+    Merges rows holding only some columns (e.g. lazily fetched ones) into row data by biosamplename
+
+    Args:
+        row_data (list[dict]): Row data of the table (left unmodified)
+        partial_row_data (list[dict]): Rows with biosamplename and the new columns
+
+    Returns:
+        row_data (list[dict]): New list of rows with the new columns added
+    """
+    partial = {row["biosamplename"]: row for row in partial_row_data}
+    return [{**row, **partial.get(row["biosamplename"], {})} for row in row_data]
+
+
 def create_column_defs_and_row_data(appsync_response: dict) -> tuple[list, list]:
     """
     Creates biosample column definitions and row data for the table based on the appsync response
@@ -357,42 +841,49 @@ def create_column_defs_and_row_data(appsync_response: dict) -> tuple[list, list]
     # with open("appsync_response.json", "w") as f:
     #     json.dump(appsync_response, f, indent=4)
 
-    # clean up the data from None values
-    appsync_response["biosamples"]["items"] = clean_null_values_from_appsync_response(
-        appsync_response["biosamples"]["items"],
-    )
-    # modify the data and separate the mandatory basejumper columns and metadata/custom columns
-    (
-        modified_mandatory_column_data,
-        modified_mandatory_row_data,
-    ) = modify_mandatory_data(appsync_response["biosamples"]["items"])
-    mandatory_columns = map(
-        lambda x: create_column_def(x["name"], x["type"]),  # , {"pinned": "left"}),
-        [{"name": "biosampleName", "type": "Text"}] + modified_mandatory_column_data,
-    )
-    metadata_columns = list(
-        map(
-            lambda x: create_column_def(x["name"], x["type"]),
-            json.loads(appsync_response["biosampleMetadataColumns"])["columns"],
-        )
+    mandatory_columns, metadata_columns = create_column_defs(
+        appsync_response["biosampleMetadataColumns"]
     )
-    modified_metadata_row_data = list(
-        map(
-            lambda x: modify_metadata(x, metadata_columns=metadata_columns),
-            modified_mandatory_row_data,
-        )
-    )
-    # merge the mandatory basejumper row data and metadata/custom row data
-    row_data = map(
-        lambda x: {
-            **{"biosamplename": x[0]["biosamplename"]},
-            **x[0],
-            **x[1],
-        },
-        zip(modified_mandatory_row_data, modified_metadata_row_data),
+    row_data = create_row_data(
+        appsync_response["biosamples"]["items"],
+        metadata_column_types(appsync_response["biosampleMetadataColumns"]),
     )
     # merge the mandatory basejumper columns and metadata/custom columns
-    column_defs = list(mandatory_columns) + list(metadata_columns)
+    column_defs = mandatory_columns + metadata_columns
     # pprint.pprint(column_defs)
-    row_data = list(row_data)
     return column_defs, row_data
+
+
+def create_column_defs_and_row_data_from_pages(
+    appsync_pages: Iterable[dict],
+) -> tuple[list, list]:
+    """
+    Creates biosample column definitions and row data from paginated appsync responses
+
+    Every page is transformed as soon as it arrives, so with a prefetching page
+    iterator the transform overlaps with the download of the following pages.
+    Metadata keys without a declared type are cast once all pages are in.
+
+    Args:
+        appsync_pages (Iterable[dict]): Biosample pages from appsync for a specific project
+
+    Returns:
+        column_defs (list): List of column definitions for ag grid
+        row_data (list): List of row data for ag grid
+    """
+    appsync_pages = iter(appsync_pages)
+    for page in appsync_pages:
+        mandatory_columns, metadata_columns = create_column_defs(
+            page["biosampleMetadataColumns"]
+        )
+        row_data = create_row_data(
+            chain.from_iterable(
+                map(
+                    lambda page: page["biosamples"]["items"],
+                    chain([page], appsync_pages),
+                )
+            ),
+            metadata_column_types(page["biosampleMetadataColumns"]),
+        )
+        return mandatory_columns + metadata_columns, row_data
+    return None, []
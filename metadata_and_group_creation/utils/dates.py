@@ -0,0 +1,113 @@
+import functools
+import re
+from datetime import datetime
+
+import dateutil.parser as parser
+
+# number of distinct date strings whose normalized value is kept in memory
+DATE_CACHE_SIZE = 4096
+# strict ISO-8601 (AWSDate / AWSDateTime) values that datetime.fromisoformat understands
+# once a trailing Z is replaced by +00:00 (fractions of 3 or 6 digits only)
+ISO_DATE = re.compile(
+    r"\d{4}-\d{2}-\d{2}"
+    r"(?:[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d{3}(?:\d{3})?)?)?(?:Z|[+-]\d{2}:\d{2})?)?"
+)
+# memoized in place of the normalized value of strings that are not dates
+NOT_A_DATE = object()
+
+
+def to_datetime(value: str) -> datetime:
+    """
+    Parses a date string, strict ISO-8601 values without going through dateutil
+
+    Args:
+        value (str): The date string
+
+    Returns:
+        date (datetime): The parsed date
+
+    Raises:
+        ValueError: If the value is not a date
+    """
+    if ISO_DATE.fullmatch(value):
+        if value.endswith("Z"):
+            value = value[:-1] + "+00:00"
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            # e.g. month 13, let dateutil report it
+            pass
+    try:
+        return parser.parse(value)
+    except OverflowError as error:
+        raise ValueError(value) from error
+
+
+@functools.lru_cache(maxsize=DATE_CACHE_SIZE)
+def parse_iso_date(value: str):
+    """
+    Returns the date string in ISO-8601 format, NOT_A_DATE if it is not a date
+
+    Results are memoized, failures included: the biosamples of a batch share the
+    same timestamps, and the same free text values of a column.
+    """
+    try:
+        return to_datetime(value).isoformat()
+    except ValueError:
+        return NOT_A_DATE
+
+
+def iso_date(value: str) -> str:
+    """
+    Returns the date string in ISO-8601 format (as the date columns of the table expect)
+
+    Args:
+        value (str): The date string
+
+    Returns:
+        value (str): The ISO-8601 date string
+
+    Raises:
+        ValueError: If the value is not a date
+    """
+    result = parse_iso_date(value)
+    if result is NOT_A_DATE:
+        raise ValueError(value)
+    return result
+
+
+def normalize_date(value: str) -> str:
+    """
+    Returns the date string in ISO-8601 format, values that are not dates unchanged
+    """
+    result = parse_iso_date(value)
+    return value if result is NOT_A_DATE else result
+
+
+def normalize_date_value(value):
+    """
+    Normalizes a metadata date value, leaving empty and non-string values as they are
+    """
+    if not isinstance(value, str) or not value:
+        return value
+    return normalize_date(value)
+
+
+def normalize_date_column(values: list) -> list:
+    """
+    Normalizes a whole date column at once
+
+    Every distinct date string is parsed a single time, no matter how many rows
+    share it; other values (e.g. nulls or absence markers) are returned unchanged.
+
+    Args:
+        values (list): The values of the column
+
+    Returns:
+        values (list): The normalized values
+    """
+    normalized = {}
+    for value in values:
+        if isinstance(value, str) and value not in normalized:
+            normalized[value] = normalize_date_value(value)
+    return [normalized[value] if isinstance(value, str) else value for value in values]
@@ -0,0 +1,433 @@
+import functools
+import json
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+import numpy as np
+
+# number of compiled filter models kept in memory
+FILTER_CACHE_SIZE = 256
+# number of tables whose filter columns are kept in memory
+FILTER_COLUMNS_CACHE_SIZE = 8
+
+# columns filtered on a derived value instead of their own (see create_column_def)
+FILTER_VALUE_COLUMNS = {"size": "size mb"}
+# filter options that have no filter value
+VALUELESS_OPTIONS = ("blank", "notBlank")
+
+
+def is_blank(value) -> bool:
+    """
+    Whether a cell is empty, as the ag grid blank filter option sees it
+    """
+    return value is None or value == ""
+
+
+def text_matches(value, condition: dict) -> bool:
+    """
+    Whether a cell passes a condition of an ag grid text filter (case insensitive)
+    """
+    filter_type = condition.get("type")
+    if filter_type == "blank":
+        return is_blank(value)
+    if filter_type == "notBlank":
+        return not is_blank(value)
+    if condition.get("filter") is None:
+        # not applied, as in ag grid
+        return True
+    if value is None:
+        # as in ag grid, missing values only pass the negated options
+        return filter_type in ("notEqual", "notContains")
+    text = str(value).lower()
+    filter_text = str(condition["filter"]).lower()
+    if filter_type == "equals":
+        return text == filter_text
+    if filter_type == "notEqual":
+        return text != filter_text
+    if filter_type == "contains":
+        return filter_text in text
+    if filter_type == "notContains":
+        return filter_text not in text
+    if filter_type == "startsWith":
+        return text.startswith(filter_text)
+    if filter_type == "endsWith":
+        return text.endswith(filter_text)
+    raise ValueError(f"Unknown text filter option: {filter_type}")
+
+
+def compare_scalar(value, condition: dict, low, high) -> bool:
+    """
+    Whether a (non-null) cell passes a condition of an ag grid number or date filter
+
+    Args:
+        value: The cell value, comparable to low and high
+        condition (dict): The filter condition
+        low: The filter value
+        high: The upper bound of inRange conditions
+    """
+    filter_type = condition.get("type")
+    if filter_type == "equals":
+        return value == low
+    if filter_type == "notEqual":
+        return value != low
+    if filter_type == "lessThan":
+        return value < low
+    if filter_type == "lessThanOrEqual":
+        return value <= low
+    if filter_type == "greaterThan":
+        return value > low
+    if filter_type == "greaterThanOrEqual":
+        return value >= low
+    if filter_type == "inRange":
+        # ag grid excludes the bounds of ranges by default
+        return low < value < high
+    raise ValueError(f"Unknown filter option: {filter_type}")
+
+
+def to_number(value):
+    """
+    Returns a cell value as a number, None when it is not one
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def number_operands(condition: dict) -> tuple:
+    """
+    Returns the filter value and the upper bound (inRange) of a number condition,
+    None when a value the condition needs is missing
+    """
+    low, high = to_number(condition.get("filter")), to_number(condition.get("filterTo"))
+    if low is None or (condition.get("type") == "inRange" and high is None):
+        return None
+    return low, high
+
+
+def number_matches(value, condition: dict) -> bool:
+    """
+    Whether a cell passes a condition of an ag grid number filter
+    """
+    filter_type = condition.get("type")
+    if filter_type == "blank":
+        return is_blank(value)
+    if filter_type == "notBlank":
+        return not is_blank(value)
+    operands = number_operands(condition)
+    if operands is None:
+        # not applied, as in ag grid
+        return True
+    number = to_number(value)
+    if number is None:
+        # ag grid leaves out blank cells unless includeBlanksIn... is set
+        return False
+    return compare_scalar(number, condition, *operands)
+
+
+def to_day(value):
+    """
+    Returns the day (YYYY-MM-DD) of an ISO-8601 date, None when it is not one
+    """
+    if not isinstance(value, str) or len(value) < 10:
+        return None
+    return value[:10]
+
+
+def date_operands(condition: dict) -> tuple:
+    """
+    Returns the day and the upper bound day (inRange) of a date condition,
+    None when a date the condition needs is missing
+    """
+    # the filter sends dates as "YYYY-MM-DD hh:mm:ss"
+    low, high = to_day(condition.get("dateFrom")), to_day(condition.get("dateTo"))
+    if low is None or (condition.get("type") == "inRange" and high is None):
+        return None
+    return low, high
+
+
+def date_matches(value, condition: dict) -> bool:
+    """
+    Whether a cell (ISO-8601 string) passes a condition of an ag grid date filter
+
+    Dates are compared by day, as the date filter selects days.
+    """
+    filter_type = condition.get("type")
+    if filter_type == "blank":
+        return is_blank(value)
+    if filter_type == "notBlank":
+        return not is_blank(value)
+    operands = date_operands(condition)
+    if operands is None:
+        # not applied, as in ag grid
+        return True
+    day = to_day(value)
+    if day is None:
+        return False
+    return compare_scalar(day, condition, *operands)
+
+
+def filter_matchers() -> dict:
+    """
+    Returns the ag grid filter types (filterType of a filter model) as keys
+    and the functions matching cells against their conditions as values
+    """
+    return {
+        "text": text_matches,
+        "number": number_matches,
+        "date": date_matches,
+    }
+
+
+def is_complete(condition: dict) -> bool:
+    """
+    Whether a condition has the filter values its option needs (ag grid does not
+    apply the others, e.g. a range without its upper bound)
+    """
+    if condition.get("type") in VALUELESS_OPTIONS:
+        return True
+    if condition["filterType"] == "number":
+        return number_operands(condition) is not None
+    if condition["filterType"] == "date":
+        return date_operands(condition) is not None
+    return condition.get("filter") is not None
+
+
+def model_conditions(column_model: dict) -> list[dict]:
+    """
+    Returns the conditions of a combined column filter model
+    (the conditions list, or condition1 and condition2 of older ag grid versions)
+    """
+    if column_model.get("conditions"):
+        return column_model["conditions"]
+    return [
+        column_model[key]
+        for key in ("condition1", "condition2")
+        if column_model.get(key)
+    ]
+
+
+class FilterColumns:
+    """
+    The columns of a table as numpy arrays, extracted when a filter first needs them
+
+    Every column is split into its distinct values (categories) and the index of
+    the value of every row (codes), so text and date conditions are evaluated once
+    per distinct value instead of once per row.
+
+    Args:
+        row_data (list[dict]): List of row data for ag grid (read-only)
+    """
+
+    def __init__(self, row_data: list[dict]):
+        self.row_data = row_data
+        self._categories = {}
+        self._numbers = {}
+
+    def __len__(self) -> int:
+        return len(self.row_data)
+
+    def categories(self, field: str) -> tuple[np.ndarray, list]:
+        """
+        Returns the codes (index of every row's value) and categories (distinct values)
+        of a column, None for rows without the field
+        """
+        if field in self._categories:
+            return self._categories[field]
+        index = {}
+        categories = []
+        codes = np.empty(len(self.row_data), dtype=np.int64)
+        for i, row in enumerate(self.row_data):
+            value = row.get(field)
+            # keyed by type too, so that 1 and "1" stay apart
+            try:
+                key = (value.__class__, value)
+                code = index[key]
+            except KeyError:
+                code = index[key] = len(categories)
+                categories.append(value)
+            except TypeError:
+                # unhashable values (lists, dicts) get a category of their own
+                code = len(categories)
+                categories.append(value)
+            codes[i] = code
+        self._categories[field] = codes, categories
+        return codes, categories
+
+    def numbers(self, field: str) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the values of a column as numbers (NaN where they are not numbers)
+        and whether each row has a number
+        """
+        if field in self._numbers:
+            return self._numbers[field]
+        codes, categories = self.categories(field)
+        numbers = list(map(to_number, categories))
+        valid = np.array([number is not None for number in numbers], dtype=bool)
+        values = np.array(
+            [np.nan if number is None else number for number in numbers],
+            dtype=np.float64,
+        )
+        self._numbers[field] = values[codes], valid[codes]
+        return self._numbers[field]
+
+
+_filter_columns = OrderedDict()
+_filter_columns_lock = threading.Lock()
+
+
+def filter_columns(row_data: list[dict]) -> FilterColumns:
+    """
+    Returns the filter columns of a table, kept for the FILTER_COLUMNS_CACHE_SIZE
+    most recently filtered tables
+
+    Args:
+        row_data (list[dict]): List of row data for ag grid (read-only)
+
+    Returns:
+        columns (FilterColumns): The filter columns of the table
+    """
+    # the columns hold on to the table, so its id is not reused while they are cached
+    key = id(row_data)
+    with _filter_columns_lock:
+        columns = _filter_columns.get(key)
+        if columns is not None:
+            _filter_columns.move_to_end(key)
+            return columns
+        columns = _filter_columns[key] = FilterColumns(row_data)
+        while len(_filter_columns) > FILTER_COLUMNS_CACHE_SIZE:
+            _filter_columns.popitem(last=False)
+    return columns
+
+
+def compile_category_condition(field: str, condition: dict) -> Callable:
+    """
+    Compiles a text or date condition, evaluated once per distinct value of the column
+    """
+    matches = filter_matchers()[condition["filterType"]]
+
+    def predicate(columns: FilterColumns) -> np.ndarray:
+        codes, categories = columns.categories(field)
+        passing = np.fromiter(
+            (matches(value, condition) for value in categories),
+            dtype=bool,
+            count=len(categories),
+        )
+        return passing[codes]
+
+    return predicate
+
+
+def compile_number_condition(field: str, condition: dict) -> Callable:
+    """
+    Compiles a number condition into vectorized comparisons
+    """
+    filter_type = condition.get("type")
+    if filter_type in VALUELESS_OPTIONS:
+        return compile_category_condition(field, condition)
+    low, high = number_operands(condition)
+    comparisons = {
+        "equals": lambda values: values == low,
+        "notEqual": lambda values: values != low,
+        "lessThan": lambda values: values < low,
+        "lessThanOrEqual": lambda values: values <= low,
+        "greaterThan": lambda values: values > low,
+        "greaterThanOrEqual": lambda values: values >= low,
+        # ag grid excludes the bounds of ranges by default
+        "inRange": lambda values: (values > low) & (values < high),
+    }
+    if filter_type not in comparisons:
+        raise ValueError(f"Unknown number filter option: {filter_type}")
+    compare = comparisons[filter_type]
+
+    def predicate(columns: FilterColumns) -> np.ndarray:
+        values, valid = columns.numbers(field)
+        # ag grid leaves out blank cells unless includeBlanksIn... is set
+        with np.errstate(invalid="ignore"):
+            return compare(values) & valid
+
+    return predicate
+
+
+def compile_column_model(field: str, column_model: dict) -> Callable:
+    """
+    Compiles the filter model of a column (a condition, or conditions joined by AND/OR)
+    into a function returning which rows of FilterColumns pass it
+    """
+    filter_type = column_model.get("filterType", "text")
+    if filter_type not in filter_matchers():
+        raise ValueError(f"Unknown filter type: {filter_type}")
+    conditions = list(
+        filter(
+            is_complete,
+            map(
+                lambda condition: {**condition, "filterType": filter_type},
+                model_conditions(column_model) or [column_model],
+            ),
+        )
+    )
+    if not conditions:
+        # conditions missing their filter values are not applied, as in ag grid
+        return lambda columns: np.ones(len(columns), dtype=bool)
+    predicates = list(
+        map(
+            lambda condition: (
+                compile_number_condition(field, condition)
+                if filter_type == "number"
+                else compile_category_condition(field, condition)
+            ),
+            conditions,
+        )
+    )
+    combine = np.logical_and if column_model.get("operator") == "AND" else np.logical_or
+    return lambda columns: functools.reduce(
+        combine, map(lambda predicate: predicate(columns), predicates)
+    )
+
+
+def filter_model_key(filter_model: dict) -> str:
+    """
+    Returns a key identifying a filter model (its json with sorted keys)
+    """
+    return json.dumps(filter_model or {}, sort_keys=True)
+
+
+def compile_filter_model(filter_model: dict) -> Callable:
+    """
+    Compiles an ag grid filter model into a vectorized predicate
+
+    Compiled filter models are memoized by their key (filter_model_key), so the
+    repeated requests of a grid scrolling through filtered rows compile it once.
+
+    Args:
+        filter_model (dict): Filter models by column, as sent by the grid
+
+    Returns:
+        predicate (Callable): Function of FilterColumns returning a boolean array,
+            True for the rows passing all column filters
+    """
+    return compiled_filter_model(filter_model_key(filter_model))
+
+
+@functools.lru_cache(maxsize=FILTER_CACHE_SIZE)
+def compiled_filter_model(key: str) -> Callable:
+    """
+    Returns the compiled filter model of a filter model key
+    """
+    predicates = [
+        compile_column_model(FILTER_VALUE_COLUMNS.get(column, column), column_model)
+        for column, column_model in json.loads(key).items()
+    ]
+
+    def predicate(columns: FilterColumns) -> np.ndarray:
+        mask = np.ones(len(columns), dtype=bool)
+        for column_predicate in predicates:
+            mask &= column_predicate(columns)
+        return mask
+
+    return predicate
@@ -0,0 +1,188 @@
+import functools
+import operator
+import threading
+from collections import OrderedDict
+from typing import Iterable
+
+import numpy as np
+
+# number of tables whose biosample index is kept in memory
+BIOSAMPLE_INDEX_CACHE_SIZE = 8
+
+
+class Group:
+    """
+    A group of biosamples as a bitset over a BiosampleIndex (bit i: biosample i)
+
+    Groups support set algebra: a | b (union), a & b (intersection),
+    a - b (difference) and a ^ b (symmetric difference).
+
+    Args:
+        bits (np.ndarray): The bitset (np.packbits of a boolean mask)
+        size (int): Number of biosamples of the index
+    """
+
+    __slots__ = ("bits", "size")
+
+    def __init__(self, bits: np.ndarray, size: int):
+        self.bits = bits
+        self.size = size
+
+    @classmethod
+    def empty(cls, size: int) -> "Group":
+        return cls(np.zeros((size + 7) // 8, dtype=np.uint8), size)
+
+    @classmethod
+    def from_positions(cls, positions: np.ndarray, size: int) -> "Group":
+        mask = np.zeros(size, dtype=bool)
+        mask[positions] = True
+        return cls(np.packbits(mask), size)
+
+    def mask(self) -> np.ndarray:
+        """
+        Returns the group as a boolean mask over the biosample index
+        """
+        return np.unpackbits(self.bits, count=self.size).astype(bool)
+
+    def positions(self) -> np.ndarray:
+        """
+        Returns the sorted positions of the group's biosamples in the index
+        """
+        return np.flatnonzero(np.unpackbits(self.bits, count=self.size))
+
+    def __len__(self) -> int:
+        return int(np.unpackbits(self.bits, count=self.size).sum())
+
+    def _check(self, other: "Group") -> None:
+        if self.size != other.size:
+            raise ValueError("Groups of different biosample indexes")
+
+    def __or__(self, other: "Group") -> "Group":
+        self._check(other)
+        return Group(self.bits | other.bits, self.size)
+
+    def __and__(self, other: "Group") -> "Group":
+        self._check(other)
+        return Group(self.bits & other.bits, self.size)
+
+    def __sub__(self, other: "Group") -> "Group":
+        self._check(other)
+        return Group(self.bits & ~other.bits, self.size)
+
+    def __xor__(self, other: "Group") -> "Group":
+        self._check(other)
+        return Group(self.bits ^ other.bits, self.size)
+
+    def __eq__(self, other) -> bool:
+        return (
+            isinstance(other, Group)
+            and self.size == other.size
+            and np.array_equal(self.bits, other.bits)
+        )
+
+
+class BiosampleIndex:
+    """
+    Stable integer index of the biosamples of a project table (their row positions)
+
+    Delta syncs replace rows in place and append new biosamples, so the positions
+    of existing biosamples do not change while the table is cached.
+
+    Args:
+        biosample_names (list[str]): Biosample names in row order
+    """
+
+    def __init__(self, biosample_names: list[str]):
+        self.biosample_names = biosample_names
+        self.positions = {name: i for i, name in enumerate(biosample_names)}
+
+    @classmethod
+    def from_row_data(cls, row_data: list[dict]) -> "BiosampleIndex":
+        return cls(list(map(operator.itemgetter("biosamplename"), row_data)))
+
+    def __len__(self) -> int:
+        return len(self.biosample_names)
+
+    def group(self, biosample_names: Iterable[str]) -> Group:
+        """
+        Returns the group of the given biosamples (names not in the table are left out)
+        """
+        positions = self.positions
+        return Group.from_positions(
+            np.fromiter(
+                (positions[name] for name in biosample_names if name in positions),
+                dtype=np.int64,
+            ),
+            len(self),
+        )
+
+    def names(self, group: Group) -> list[str]:
+        """
+        Returns the names of a group's biosamples, in row order
+        """
+        return list(map(self.biosample_names.__getitem__, group.positions().tolist()))
+
+    def rows(self, group: Group, row_data: list[dict]) -> list[dict]:
+        """
+        Returns the rows of a group's biosamples (row_data must be the indexed table)
+        """
+        return list(map(row_data.__getitem__, group.positions().tolist()))
+
+    def union(self, groups: Iterable[Group]) -> Group:
+        """
+        Returns the union of groups (the empty group when there are none)
+        """
+        return functools.reduce(operator.or_, groups, Group.empty(len(self)))
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def biosample_index(row_data: list[dict]) -> BiosampleIndex:
+    """
+    Returns the biosample index of a table, kept for the
+    BIOSAMPLE_INDEX_CACHE_SIZE most recently used tables
+
+    Args:
+        row_data (list[dict]): List of row data for ag grid (read-only)
+
+    Returns:
+        index (BiosampleIndex): The biosample index of the table
+    """
+    # the entry holds on to the table, so its id is not reused while it is cached
+    key = id(row_data)
+    with _indexes_lock:
+        entry = _indexes.get(key)
+        if entry is not None:
+            _indexes.move_to_end(key)
+            return entry[1]
+    index = BiosampleIndex.from_row_data(row_data)
+    with _indexes_lock:
+        _indexes[key] = (row_data, index)
+        while len(_indexes) > BIOSAMPLE_INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+    return index
+
+
+def select_groups(
+    row_data: list[dict], group_store: dict[str, list], group_names: Iterable[str]
+) -> list[str]:
+    """
+    Returns the names of the biosamples in any of the given groups, in row order
+
+    Args:
+        row_data (list[dict]): List of row data for ag grid (read-only)
+        group_store (dict[str, list]): Biosample names by group name
+        group_names (Iterable[str]): Names of the selected groups
+
+    Returns:
+        biosample_names (list[str]): Names of the selected biosamples
+            (biosamples missing from the table are left out)
+    """
+    index = biosample_index(row_data)
+    return index.names(
+        index.union(
+            map(lambda group_name: index.group(group_store[group_name]), group_names)
+        )
+    )
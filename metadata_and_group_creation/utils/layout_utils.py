@@ -1,8 +1,54 @@
+import os
+
 import dash_bootstrap_components as dbc
 import dash_mantine_components as dmc
-from dash import dcc, html
+import flask
+from dash import Dash, dcc, html
 from dash_iconify import DashIconify
 
+# value formatters of the biosample table, named in its column definitions
+GRID_FUNCTIONS_FILE = "dashAgGridFunctions.js"
+GRID_FUNCTIONS_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+    "assets",
+    GRID_FUNCTIONS_FILE,
+)
+# route the formatters are served under when the app's assets folder lacks them
+GRID_FUNCTIONS_ROUTE = "_metadata-and-group-creation/" + GRID_FUNCTIONS_FILE
+
+
+def serve_grid_functions(app: Dash) -> None:
+    """
+    Serves the value formatters of the biosample table from this package
+
+    Dash only serves the assets folder of the app itself, so an app embedding
+    this module gets the file from a route of its server, loaded as an external
+    script (the version in the url changes with the file). Apps whose assets
+    folder already has the file (e.g. app.py) are left as they are.
+
+    Args:
+        app: Dash - dash app object
+    Returns:
+        None
+    """
+    if app.config.include_assets_files and os.path.isfile(
+        os.path.join(app.config.assets_folder, GRID_FUNCTIONS_FILE)
+    ):
+        return
+    route = app.config.routes_pathname_prefix + GRID_FUNCTIONS_ROUTE
+    if route not in app.server.view_functions:
+        app.server.add_url_rule(
+            route,
+            endpoint=route,
+            view_func=lambda: flask.send_file(
+                GRID_FUNCTIONS_PATH, mimetype="application/javascript"
+            ),
+        )
+    version = int(os.path.getmtime(GRID_FUNCTIONS_PATH))
+    url = f"{app.config.requests_pathname_prefix}{GRID_FUNCTIONS_ROUTE}?v={version}"
+    if url not in app.config.external_scripts:
+        app.config.external_scripts.append(url)
+
 
 def html_header(name):
     return dmc.Header(
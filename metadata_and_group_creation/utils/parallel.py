@@ -0,0 +1,188 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import chain
+from typing import Iterable
+
+from utils.data import coerce_undeclared_metadata, copy_column_defs
+from utils.schema import compile_schema
+
+logger = logging.getLogger(__name__)
+
+# projects with fewer biosamples are transformed in-process, below this size
+# sending the pages to the workers and the rows back costs more than it saves
+PARALLEL_MIN_BIOSAMPLES = 50_000
+# start method of the worker processes (TRANSFORM_START_METHOD=fork|forkserver|spawn),
+# fork is avoided because the page prefetching threads may hold locks, forkserver
+# is preferred to spawn because its workers are forked from a server that only
+# imported the transform (see FORKSERVER_PRELOAD)
+PARALLEL_START_METHOD = os.environ.get(
+    "TRANSFORM_START_METHOD",
+    (
+        "forkserver"
+        if "forkserver" in multiprocessing.get_all_start_methods()
+        else "spawn"
+    ),
+)
+# modules imported once by the fork server, the workers it forks inherit them
+FORKSERVER_PRELOAD = ["utils.parallel"]
+
+_pool = None
+_pool_pid = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+
+
+def transform_page(
+    biosample_metadata_columns: str, biosamples: list[dict]
+) -> tuple[list, dict]:
+    """
+    Returns the rows of the table for the biosamples of a page (runs in a worker)
+    and the positions of the rows holding each undeclared metadata key
+
+    The compiled schema is memoized in every worker, so it is built once per
+    worker and project rather than once per page. The types of undeclared metadata
+    keys are inferred from the whole table, so their values are cast by the parent.
+    """
+    return compile_schema(biosample_metadata_columns).page_rows(biosamples)
+
+
+def transform_pool(max_workers: int) -> ProcessPoolExecutor:
+    """
+    Returns the process pool of the transform, created on first use
+
+    The pool is kept between calls (worker start-up is not paid per project)
+    and recreated in forked processes, e.g. gunicorn workers. Workers still run
+    the main module of the app (as __mp_main__), which must not build the layout then.
+
+    Args:
+        max_workers (int): Number of worker processes
+
+    Returns:
+        pool (ProcessPoolExecutor): The process pool
+    """
+    global _pool, _pool_pid, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid() or _pool_workers != max_workers:
+            if _pool is not None and _pool_pid == os.getpid():
+                _pool.shutdown(wait=False)
+            context = multiprocessing.get_context(PARALLEL_START_METHOD)
+            if PARALLEL_START_METHOD == "forkserver":
+                context.set_forkserver_preload(FORKSERVER_PRELOAD)
+            _pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
+            _pool_pid = os.getpid()
+            _pool_workers = max_workers
+        return _pool
+
+
+def shutdown_transform_pool() -> None:
+    """
+    Stops the worker processes of the transform (they are started again when needed)
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown()
+        _pool = None
+
+
+def create_column_defs_and_row_data_parallel(
+    appsync_pages: Iterable[dict],
+    max_workers: int = None,
+    min_biosamples: int = PARALLEL_MIN_BIOSAMPLES,
+) -> tuple[list, list]:
+    """
+    Creates biosample column definitions and row data from paginated appsync
+    responses, transforming the pages in a process pool
+
+    Pages are buffered until the project has min_biosamples biosamples; smaller
+    projects are transformed in-process. Past the threshold every page is sent
+    to the pool as soon as it arrives and the rows are merged in page order, so
+    the result is the same as create_column_defs_and_row_data_from_pages.
+
+    Args:
+        appsync_pages (Iterable[dict]): Biosample pages from appsync for a specific project
+        max_workers (int): Number of worker processes (None: number of CPUs)
+        min_biosamples (int): Size below which the project is transformed in-process
+
+    Returns:
+        column_defs (list): List of column definitions for ag grid
+        row_data (list): List of row data for ag grid
+    """
+    column_defs, row_data, _ = transform_pages_parallel(
+        appsync_pages, max_workers=max_workers, min_biosamples=min_biosamples
+    )
+    return column_defs and copy_column_defs(column_defs), row_data
+
+
+def transform_pages_parallel(
+    appsync_pages: Iterable[dict],
+    max_workers: int = None,
+    min_biosamples: int = PARALLEL_MIN_BIOSAMPLES,
+) -> tuple[list, list, dict]:
+    """
+    create_column_defs_and_row_data_parallel that also returns the types of the
+    metadata columns (declared or inferred), e.g. to cast the rows of later delta syncs
+
+    Returns:
+        column_defs (list): List of column definitions for ag grid (read-only)
+        row_data (list): List of row data for ag grid
+        types (dict[str, str]): Types of the metadata columns
+    """
+    appsync_pages = iter(appsync_pages)
+    first_page = next(appsync_pages, None)
+    if first_page is None:
+        return None, [], {}
+    metadata_columns = first_page["biosampleMetadataColumns"]
+    schema = compile_schema(metadata_columns)
+
+    buffered = [first_page["biosamples"]["items"]]
+    biosample_count = len(buffered[0])
+    for page in appsync_pages:
+        buffered.append(page["biosamples"]["items"])
+        biosample_count += len(buffered[-1])
+        if biosample_count >= min_biosamples:
+            break
+    # a worker process (or a module it imported) never starts a pool of its own
+    if biosample_count < min_biosamples or multiprocessing.parent_process() is not None:
+        pages = chain(
+            buffered, map(lambda page: page["biosamples"]["items"], appsync_pages)
+        )
+        row_data, types = schema.typed_rows(chain.from_iterable(pages))
+        return schema.column_defs, row_data, types
+
+    pages = buffered
+    try:
+        pool = transform_pool(max_workers or os.cpu_count() or 1)
+        futures = list(
+            map(
+                lambda items: pool.submit(transform_page, metadata_columns, items),
+                pages,
+            )
+        )
+        for page in appsync_pages:
+            items = page["biosamples"]["items"]
+            pages.append(items)
+            futures.append(pool.submit(transform_page, metadata_columns, items))
+        row_data = []
+        undeclared = {}
+        for future in futures:
+            page_rows, page_undeclared = future.result()
+            for key, positions in page_undeclared.items():
+                undeclared.setdefault(key, []).extend(
+                    map(len(row_data).__add__, positions)
+                )
+            row_data.extend(page_rows)
+    except BrokenProcessPool:
+        # a worker died (e.g. killed for memory), finish in-process
+        logger.warning("Transform pool broken, transforming in-process")
+        shutdown_transform_pool()
+        for page in appsync_pages:
+            pages.append(page["biosamples"]["items"])
+        row_data, types = schema.typed_rows(chain.from_iterable(pages))
+        return schema.column_defs, row_data, types
+    types = coerce_undeclared_metadata(row_data, undeclared, schema.types)
+    return schema.column_defs, row_data, types
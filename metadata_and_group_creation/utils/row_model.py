@@ -0,0 +1,122 @@
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from utils.filter_model import compile_filter_model, filter_columns
+
+# number of filtered and sorted views of tables kept in memory
+ROW_VIEW_CACHE_SIZE = 32
+
+
+def filter_rows(row_data: list[dict], filter_model: dict) -> list[dict]:
+    """
+    Returns the rows passing an ag grid filter model (all column filters)
+
+    Args:
+        row_data (list[dict]): List of row data for ag grid
+        filter_model (dict): Filter models by column, as sent by the grid
+
+    Returns:
+        row_data (list[dict]): The rows passing the filters, in order
+    """
+    if not filter_model:
+        return row_data
+    mask = compile_filter_model(filter_model)(filter_columns(row_data))
+    return list(map(row_data.__getitem__, np.flatnonzero(mask).tolist()))
+
+
+def sort_key(value) -> tuple:
+    """
+    Returns the sort key of a cell; like the ag grid comparator, blanks come first
+    when sorting in ascending order, and numbers before text in mixed columns
+    """
+    if value is None:
+        return (0,)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return (1, value)
+    return (2, str(value))
+
+
+def sort_rows(row_data: list[dict], sort_model: list[dict]) -> list[dict]:
+    """
+    Returns the rows sorted by an ag grid sort model
+
+    Args:
+        row_data (list[dict]): List of row data for ag grid
+        sort_model (list[dict]): Columns (colId) and directions (sort: asc/desc),
+            most significant first
+
+    Returns:
+        row_data (list[dict]): The sorted rows
+    """
+    row_data = list(row_data)
+    # stable sorts from the least to the most significant column
+    for column_sort in reversed(sort_model or []):
+        row_data.sort(
+            key=lambda row: sort_key(row.get(column_sort["colId"])),
+            reverse=column_sort.get("sort") == "desc",
+        )
+    return row_data
+
+
+def model_key(model) -> str:
+    """
+    Returns a key identifying a filter or sort model
+    """
+    return json.dumps(model or None, sort_keys=True)
+
+
+_views = OrderedDict()
+_views_lock = threading.Lock()
+
+
+def row_view(row_data: list[dict], filter_model: dict, sort_model: list) -> list:
+    """
+    Returns the rows of a table passing the filter model, sorted by the sort model
+
+    Views are kept (ROW_VIEW_CACHE_SIZE), so scrolling through a filtered table
+    does not filter and sort it again for every block of rows.
+
+    Args:
+        row_data (list[dict]): List of row data for ag grid (read-only)
+        filter_model (dict): Filter models by column, as sent by the grid
+        sort_model (list[dict]): Sort model, as sent by the grid
+
+    Returns:
+        row_data (list[dict]): The filtered and sorted rows (read-only)
+    """
+    if not filter_model and not sort_model:
+        return row_data
+    # the view holds on to the table, so its id is not reused while it is cached
+    key = (id(row_data), model_key(filter_model), model_key(sort_model))
+    with _views_lock:
+        view = _views.get(key)
+        if view is not None:
+            _views.move_to_end(key)
+            return view[1]
+    rows = sort_rows(filter_rows(row_data, filter_model), sort_model)
+    with _views_lock:
+        _views[key] = (row_data, rows)
+        while len(_views) > ROW_VIEW_CACHE_SIZE:
+            _views.popitem(last=False)
+    return rows
+
+
+def get_rows(row_data: list[dict], request: dict) -> dict:
+    """
+    Answers a getRowsRequest of the ag grid infinite row model
+
+    Args:
+        row_data (list[dict]): List of row data for ag grid (read-only)
+        request (dict): startRow, endRow, filterModel and sortModel of the block
+
+    Returns:
+        response (dict): The rows of the block (rowData) and the number of rows
+            passing the filters (rowCount), for getRowsResponse
+    """
+    rows = row_view(row_data, request.get("filterModel"), request.get("sortModel"))
+    start = request.get("startRow") or 0
+    end = request.get("endRow")
+    return {"rowData": rows[start:end], "rowCount": len(rows)}
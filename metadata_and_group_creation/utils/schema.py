@@ -0,0 +1,139 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Iterable, Iterator
+
+from utils.data import (
+    appsync_field_columns,
+    appsync_null_values,
+    coerce_undeclared_metadata,
+    column_defs_fingerprint,
+    create_column_defs,
+    iter_row_data,
+    metadata_coercers,
+    metadata_column_types,
+    metadata_date_columns,
+    transform_biosample,
+    transform_biosamples,
+)
+
+# number of compiled schemas kept in memory
+SCHEMA_CACHE_SIZE = 256
+
+
+def metadata_columns_hash(biosample_metadata_columns: str) -> str:
+    """
+    Returns a short hash of the biosampleMetadataColumns value of a project
+    """
+    value = (biosample_metadata_columns or "").encode("utf-8")
+    return hashlib.sha1(value).hexdigest()
+
+
+class CompiledSchema:
+    """
+    Everything the row transform needs to know about a project's columns,
+    computed once per biosampleMetadataColumns value
+
+    Compiled schemas are shared between callers and must be treated as read-only.
+
+    Args:
+        biosample_metadata_columns (str): biosampleMetadataColumns value from appsync (json string)
+    """
+
+    def __init__(self, biosample_metadata_columns: str):
+        self.hash = metadata_columns_hash(biosample_metadata_columns)
+        self.mandatory_column_defs, self.metadata_column_defs = create_column_defs(
+            biosample_metadata_columns
+        )
+        self.column_defs = self.mandatory_column_defs + self.metadata_column_defs
+        self.fingerprint = column_defs_fingerprint(self.column_defs)
+        self.types = metadata_column_types(biosample_metadata_columns)
+        self.date_columns = frozenset(metadata_date_columns(self.types))
+        self.null_values = appsync_null_values()
+        self.field_columns = appsync_field_columns()
+        self.coercers = metadata_coercers(self.types)
+
+    def transform(self, biosample: dict) -> dict:
+        """
+        Returns the row of the table for a single appsync biosample
+        """
+        return transform_biosample(
+            biosample, self.coercers, self.null_values, self.field_columns
+        )
+
+    def page_rows(self, biosamples: Iterable[dict]) -> tuple[list, dict]:
+        """
+        Returns the rows of the table for a list of appsync biosamples and the
+        positions of the rows holding each undeclared metadata key, whose values
+        are not cast yet (see utils.data.coerce_undeclared_metadata)
+        """
+        return transform_biosamples(
+            biosamples, self.coercers, self.null_values, self.field_columns
+        )
+
+    def typed_rows(
+        self, biosamples: Iterable[dict], types: dict[str, str] = None
+    ) -> tuple[list, dict]:
+        """
+        Returns the rows of the table for a list of appsync biosamples, with the
+        undeclared metadata keys cast to the table's types
+
+        Args:
+            biosamples (Iterable[dict]): Biosamples from appsync
+            types (dict[str, str]): Types of the table the rows belong to (e.g. of
+                a cached table the rows are merged into); the types of other keys
+                are inferred from the rows
+
+        Returns:
+            row_data (list[dict]): Row data for ag grid
+            types (dict[str, str]): Types of the metadata columns
+        """
+        row_data, undeclared = self.page_rows(biosamples)
+        types = coerce_undeclared_metadata(
+            row_data, undeclared, {**(types or {}), **self.types}
+        )
+        return row_data, types
+
+    def rows(self, biosamples: Iterable[dict]) -> list[dict]:
+        """
+        Returns the rows of the table for a list of appsync biosamples
+        """
+        return self.typed_rows(biosamples)[0]
+
+    def iter_rows(self, appsync_pages: Iterable[dict]) -> Iterator[dict]:
+        """
+        Yields the rows of the table for biosample pages from appsync
+        (undeclared metadata keys are not cast, see typed_rows)
+        """
+        return iter_row_data(appsync_pages, self.types)
+
+
+_schemas = OrderedDict()
+_schemas_lock = threading.Lock()
+
+
+def compile_schema(biosample_metadata_columns: str) -> CompiledSchema:
+    """
+    Returns the compiled schema of a biosampleMetadataColumns value
+
+    Schemas are memoized by the hash of the value, so projects (and pages) with
+    the same metadata columns share one schema.
+
+    Args:
+        biosample_metadata_columns (str): biosampleMetadataColumns value from appsync (json string)
+
+    Returns:
+        schema (CompiledSchema): The compiled schema
+    """
+    key = metadata_columns_hash(biosample_metadata_columns)
+    with _schemas_lock:
+        schema = _schemas.get(key)
+        if schema is not None:
+            _schemas.move_to_end(key)
+            return schema
+    schema = CompiledSchema(biosample_metadata_columns)
+    with _schemas_lock:
+        _schemas[key] = schema
+        while len(_schemas) > SCHEMA_CACHE_SIZE:
+            _schemas.popitem(last=False)
+    return schema
@@ -0,0 +1,576 @@
+import abc
+import functools
+import json
+import os
+import sqlite3
+import time
+from itertools import chain
+from typing import Callable, Iterable, Iterator
+
+from utils.appsync import (
+    BIOSAMPLE_FIELDS,
+    DEFAULT_PAGE_SIZE,
+    fetch_biosample_pages_from_appsync,
+    select_biosample_fields,
+)
+from utils.cache import get_project_table, get_project_table_columns
+from utils.columnar import create_column_defs_and_row_data_columnar
+from utils.data import fields_for_columns
+
+# sqlite column types of the biosample fields
+SQLITE_FIELD_TYPES = {
+    "biosampleName": "TEXT",
+    "fastqValidationStatus": "TEXT",
+    "size": "INTEGER",
+    "r1FastqTotalReads": "INTEGER",
+    "r2FastqTotalReads": "INTEGER",
+    "r1FastqLength": "INTEGER",
+    "created": "TEXT",
+    "lotId": "TEXT",
+    "metadata": "TEXT",
+}
+# parquet schema metadata key holding the biosampleMetadataColumns json
+PARQUET_METADATA_COLUMNS_KEY = b"biosampleMetadataColumns"
+# number of parsed json snapshots kept in memory (by path and modification time)
+JSON_SNAPSHOT_CACHE_SIZE = 8
+# payload keys that are never sent to the browser (see source_descriptor)
+SECRET_KEYS = ("app_sync_user",)
+
+
+class BiosampleSource(abc.ABC):
+    """
+    Source of the biosamples of a project
+
+    Sources yield pages in the getProject shape (biosampleMetadataColumns and
+    biosamples.items), so every source goes through the same transform.
+
+    Args:
+        page_size (int): Maximum number of biosamples per page
+    """
+
+    def __init__(self, page_size: int = DEFAULT_PAGE_SIZE):
+        self.page_size = page_size
+
+    @abc.abstractmethod
+    def pages(self, fields: Iterable[str] = None) -> Iterator[dict]:
+        """
+        Yields the biosamples page by page
+
+        Args:
+            fields (Iterable[str]): Appsync biosample fields the rows need (None for all)
+        """
+
+    def is_stale(self) -> bool:
+        """
+        Whether the source is out of date and should not be used
+        """
+        return False
+
+    def table(self, fields: Iterable[str] = None) -> tuple[list, list]:
+        """
+        Returns the column definitions and row data for the table
+
+        Args:
+            fields (Iterable[str]): Appsync biosample fields the rows need (None for all)
+
+        Returns:
+            column_defs (list): List of column definitions for ag grid
+            row_data (list): List of row data for ag grid
+        """
+        return create_column_defs_and_row_data_columnar(self.pages(fields))
+
+    def table_columns(self, columns: Iterable[str]) -> tuple[list, list]:
+        """
+        Returns the table with (at least) the given columns filled in
+
+        Args:
+            columns (Iterable[str]): Table columns that need data
+
+        Returns:
+            column_defs (list): List of column definitions for ag grid
+            row_data (list): List of row data for ag grid
+        """
+        return self.table(fields_for_columns(columns))
+
+
+class AppSyncSource(BiosampleSource):
+    """
+    Biosamples fetched from appsync (through the project table cache)
+
+    Args:
+        project_id (str): The project id
+        app_sync_endpoint (str): The appsync endpoint url
+        app_sync_user (dict): The appsync user
+        page_size (int): Maximum number of biosamples per page
+        prefetch (int): Number of pages to download ahead of the transform
+        workers (int): Number of processes transforming the pages of large projects
+            (0 transforms in-process)
+    """
+
+    def __init__(
+        self,
+        project_id: str,
+        app_sync_endpoint: str,
+        app_sync_user: dict,
+        page_size: int = DEFAULT_PAGE_SIZE,
+        prefetch: int = 0,
+        workers: int = 0,
+    ):
+        super().__init__(page_size)
+        self.project_id = project_id
+        self.app_sync_endpoint = app_sync_endpoint
+        self.app_sync_user = app_sync_user
+        self.prefetch = prefetch
+        self.workers = workers
+
+    def pages(self, fields: Iterable[str] = None) -> Iterator[dict]:
+        return fetch_biosample_pages_from_appsync(
+            self.project_id,
+            self.app_sync_endpoint,
+            self.app_sync_user,
+            page_size=self.page_size,
+            prefetch=self.prefetch,
+            fields=fields,
+        )
+
+    def table(self, fields: Iterable[str] = None) -> tuple[list, list]:
+        return get_project_table(
+            project_id=self.project_id,
+            app_sync_endpoint=self.app_sync_endpoint,
+            app_sync_user=self.app_sync_user,
+            page_size=self.page_size,
+            prefetch=self.prefetch,
+            fields=fields,
+            workers=self.workers,
+        )
+
+    def table_columns(self, columns: Iterable[str]) -> tuple[list, list]:
+        return get_project_table_columns(
+            project_id=self.project_id,
+            app_sync_endpoint=self.app_sync_endpoint,
+            app_sync_user=self.app_sync_user,
+            columns=columns,
+            page_size=self.page_size,
+        )
+
+
+class SnapshotSource(BiosampleSource):
+    """
+    Biosamples read from a pre-materialized local snapshot file
+
+    Args:
+        path (str): Path of the snapshot
+        max_age (float): Seconds after which the snapshot is stale (None: never)
+        page_size (int): Maximum number of biosamples per page
+    """
+
+    def __init__(
+        self, path: str, max_age: float = None, page_size: int = DEFAULT_PAGE_SIZE
+    ):
+        super().__init__(page_size)
+        self.path = path
+        self.max_age = max_age
+
+    def synced_at(self) -> float:
+        """
+        Returns when the snapshot was written (unix time)
+        """
+        return os.path.getmtime(self.path)
+
+    def is_stale(self) -> bool:
+        if not os.path.exists(self.path):
+            return True
+        if self.max_age is None:
+            return False
+        return time.time() - self.synced_at() > self.max_age
+
+
+@functools.lru_cache(maxsize=JSON_SNAPSHOT_CACHE_SIZE)
+def _load_json_snapshot(path: str, mtime_ns: int, size: int) -> dict:
+    """
+    Returns the parsed json snapshot at path, memoized until the file changes
+    (modification time or size); the result is shared and must not be modified.
+    """
+    with open(path) as f:
+        return json.load(f)
+
+
+class JsonFileSource(SnapshotSource):
+    """
+    Biosamples read from a json file in the getProject shape
+    (e.g. data_example/appsync_response.json)
+
+    The parsed file is kept in memory until it changes, so the pages of
+    later calls are not read and parsed again.
+    """
+
+    def pages(self, fields: Iterable[str] = None) -> Iterator[dict]:
+        fields = select_biosample_fields(fields)
+        stat = os.stat(self.path)
+        project = _load_json_snapshot(self.path, stat.st_mtime_ns, stat.st_size)
+        items = project["biosamples"]["items"]
+        for start in range(0, max(len(items), 1), self.page_size):
+            yield {
+                "biosampleMetadataColumns": project["biosampleMetadataColumns"],
+                "biosamples": {
+                    "items": [
+                        {field: item[field] for field in fields if field in item}
+                        for item in items[start : start + self.page_size]
+                    ]
+                },
+            }
+
+
+class SQLiteSource(SnapshotSource):
+    """
+    Biosamples read from a sqlite snapshot (see write_sqlite_snapshot)
+
+    Args:
+        path (str): Path of the sqlite database
+        project_id (str): The project id
+        max_age (float): Seconds after which the snapshot is stale (None: never)
+        page_size (int): Maximum number of biosamples per page
+    """
+
+    def __init__(
+        self,
+        path: str,
+        project_id: str,
+        max_age: float = None,
+        page_size: int = DEFAULT_PAGE_SIZE,
+    ):
+        super().__init__(path, max_age=max_age, page_size=page_size)
+        self.project_id = project_id
+
+    def synced_at(self) -> float:
+        with sqlite3.connect(self.path) as connection:
+            row = connection.execute(
+                "SELECT synced_at FROM projects WHERE project_id = ?",
+                (self.project_id,),
+            ).fetchone()
+        return row[0] if row else 0.0
+
+    def pages(self, fields: Iterable[str] = None) -> Iterator[dict]:
+        fields = select_biosample_fields(fields)
+        connection = sqlite3.connect(self.path)
+        try:
+            row = connection.execute(
+                "SELECT biosample_metadata_columns FROM projects WHERE project_id = ?",
+                (self.project_id,),
+            ).fetchone()
+            if row is None:
+                raise KeyError(f"project {self.project_id} not in {self.path}")
+            columns = ", ".join(f'"{field}"' for field in fields)
+            cursor = connection.execute(
+                f"SELECT {columns} FROM biosamples WHERE project_id = ? ORDER BY position",
+                (self.project_id,),
+            )
+            while True:
+                rows = cursor.fetchmany(self.page_size)
+                yield {
+                    "biosampleMetadataColumns": row[0],
+                    "biosamples": {
+                        "items": [dict(zip(fields, values)) for values in rows]
+                    },
+                }
+                if len(rows) < self.page_size:
+                    return
+        finally:
+            connection.close()
+
+
+def whole_number_as_int(value):
+    """
+    Returns a float holding a whole number as an int (other values unchanged),
+    the way the INTEGER columns of sqlite snapshots store numbers
+    """
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+class ParquetSource(SnapshotSource):
+    """
+    Biosamples read (memory-mapped) from a parquet snapshot (see write_parquet_snapshot)
+
+    Requires pyarrow.
+    """
+
+    def pages(self, fields: Iterable[str] = None) -> Iterator[dict]:
+        import pyarrow.parquet as pq
+
+        fields = select_biosample_fields(fields)
+        parquet_file = pq.ParquetFile(self.path, memory_map=True)
+        # sizes are stored as float64, whole byte counts are read back as integers
+        normalize = "size" in fields
+        metadata_columns = parquet_file.schema_arrow.metadata[
+            PARQUET_METADATA_COLUMNS_KEY
+        ].decode("utf-8")
+        batches = parquet_file.iter_batches(
+            batch_size=self.page_size, columns=list(fields)
+        )
+        empty = True
+        for batch in batches:
+            empty = False
+            items = batch.to_pylist()
+            if normalize:
+                for item in items:
+                    item["size"] = whole_number_as_int(item["size"])
+            yield {
+                "biosampleMetadataColumns": metadata_columns,
+                "biosamples": {"items": items},
+            }
+        if empty:
+            yield {
+                "biosampleMetadataColumns": metadata_columns,
+                "biosamples": {"items": []},
+            }
+
+
+class FallbackSource(BiosampleSource):
+    """
+    Uses the snapshot source while it is fresh, and the fallback source otherwise
+
+    Args:
+        snapshot (BiosampleSource): Preferred (local) source
+        fallback (BiosampleSource): Source used when the snapshot is stale
+    """
+
+    def __init__(self, snapshot: BiosampleSource, fallback: BiosampleSource):
+        super().__init__(snapshot.page_size)
+        self.snapshot = snapshot
+        self.fallback = fallback
+
+    def active(self) -> BiosampleSource:
+        """
+        Returns the source currently in use
+        """
+        return self.fallback if self.snapshot.is_stale() else self.snapshot
+
+    def pages(self, fields: Iterable[str] = None) -> Iterator[dict]:
+        return self.active().pages(fields)
+
+    def is_stale(self) -> bool:
+        return self.snapshot.is_stale() and self.fallback.is_stale()
+
+    def table(self, fields: Iterable[str] = None) -> tuple[list, list]:
+        return self.active().table(fields)
+
+    def table_columns(self, columns: Iterable[str]) -> tuple[list, list]:
+        return self.active().table_columns(columns)
+
+
+def source_from_payload(payload: dict) -> BiosampleSource:
+    """
+    Creates the biosample source selected by the PAYLOAD
+
+    The optional "source" key selects a local snapshot:
+        {"type": "json" | "sqlite" | "parquet", "path": str, "max_age": seconds}
+    Without it the biosamples come from appsync. When the payload has appsync
+    credentials, a stale snapshot falls back to appsync.
+
+    Args:
+        payload (dict): dictionary object containing data from the project
+
+    Returns:
+        source (BiosampleSource): The biosample source
+
+    Raises:
+        ValueError: The payload selects appsync (no "source") without an appsync endpoint,
+            or an unknown source type
+    """
+    page_size = payload.get("page_size", DEFAULT_PAGE_SIZE)
+    appsync_source = None
+    if payload.get("app_sync_endpoint"):
+        appsync_source = AppSyncSource(
+            project_id=payload["project_id"],
+            app_sync_endpoint=payload["app_sync_endpoint"],
+            app_sync_user=payload["app_sync_user"],
+            page_size=page_size,
+            prefetch=payload.get("prefetch_pages", 2),
+            workers=payload.get("transform_workers", 0),
+        )
+    source_config = payload.get("source")
+    if not source_config or source_config.get("type", "appsync") == "appsync":
+        if appsync_source is None:
+            raise ValueError(
+                "The payload has neither a biosample source nor an app_sync_endpoint"
+            )
+        return appsync_source
+
+    source_type = source_config["type"]
+    max_age = source_config.get("max_age")
+    if source_type == "json":
+        snapshot = JsonFileSource(source_config["path"], max_age, page_size)
+    elif source_type == "sqlite":
+        snapshot = SQLiteSource(
+            source_config["path"], payload["project_id"], max_age, page_size
+        )
+    elif source_type == "parquet":
+        snapshot = ParquetSource(source_config["path"], max_age, page_size)
+    else:
+        raise ValueError(f"Unknown biosample source type: {source_type}")
+    if appsync_source is None:
+        return snapshot
+    return FallbackSource(snapshot, appsync_source)
+
+
+def source_descriptor(payload: dict) -> dict:
+    """
+    Returns the PAYLOAD without its credentials
+
+    The descriptor is what the layout keeps in the browser to reach the biosample
+    source again from callbacks; credentials are resolved on the server for every
+    request (see source_from_descriptor).
+    """
+    return {key: value for key, value in payload.items() if key not in SECRET_KEYS}
+
+
+def app_sync_user_from_env(descriptor: dict) -> dict:
+    """
+    Default appsync credentials resolver: the APP_SYNC_USER_* environment variables
+
+    Returns:
+        app_sync_user (dict): The appsync user, None when the variables are not set
+    """
+    if "APP_SYNC_USER_USERNAME" not in os.environ:
+        return None
+    return {
+        "username": os.environ["APP_SYNC_USER_USERNAME"],
+        "password": os.environ.get("APP_SYNC_USER_PASSWORD"),
+        "clientId": os.environ.get("APP_SYNC_USER_CLIENT_ID"),
+        "appClientSecret": os.environ.get("APP_SYNC_USER_APP_CLIENT_SECRET"),
+    }
+
+
+app_sync_user_resolver = app_sync_user_from_env
+
+
+def set_app_sync_user_resolver(
+    resolver: Callable[[dict], dict] = app_sync_user_from_env,
+) -> None:
+    """
+    Sets how callbacks resolve the appsync credentials of a source descriptor
+
+    The resolver is called with the descriptor (e.g. to pick credentials by
+    project_id or by the logged in user of the request) and returns the appsync
+    user, or None when the request has no credentials.
+    """
+    global app_sync_user_resolver
+    app_sync_user_resolver = resolver
+
+
+def source_from_descriptor(descriptor: dict) -> BiosampleSource:
+    """
+    Creates the biosample source of a descriptor (see source_descriptor)
+    with the appsync credentials resolved for the current request
+
+    Without credentials, an appsync endpoint is left out: a snapshot source is
+    then used without falling back to appsync.
+
+    Args:
+        descriptor (dict): The payload without its credentials
+
+    Returns:
+        source (BiosampleSource): The biosample source
+
+    Raises:
+        ValueError: The descriptor selects appsync and no credentials were resolved
+    """
+    payload = dict(descriptor)
+    if payload.get("app_sync_endpoint"):
+        app_sync_user = app_sync_user_resolver(descriptor)
+        if app_sync_user:
+            payload["app_sync_user"] = app_sync_user
+        else:
+            del payload["app_sync_endpoint"]
+    return source_from_payload(payload)
+
+
+def write_sqlite_snapshot(project_id: str, pages: Iterable[dict], path: str) -> None:
+    """
+    Writes biosample pages (getProject shape, all fields) to a sqlite snapshot
+
+    Sizes are stored as integers (appsync sends whole byte counts as floats).
+
+    Args:
+        project_id (str): The project id
+        pages (Iterable[dict]): Biosample pages, e.g. from fetch_biosample_pages_from_appsync
+        path (str): Path of the sqlite database (created if needed)
+    """
+    columns = ", ".join(
+        f'"{field}" {SQLITE_FIELD_TYPES[field]}' for field in BIOSAMPLE_FIELDS
+    )
+    placeholders = ", ".join("?" for _ in range(len(BIOSAMPLE_FIELDS) + 2))
+    with sqlite3.connect(path) as connection:
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS projects ("
+            "project_id TEXT PRIMARY KEY, biosample_metadata_columns TEXT, synced_at REAL)"
+        )
+        connection.execute(
+            f"CREATE TABLE IF NOT EXISTS biosamples (project_id TEXT, position INTEGER, {columns})"
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS biosamples_project "
+            "ON biosamples (project_id, position)"
+        )
+        connection.execute("DELETE FROM biosamples WHERE project_id = ?", (project_id,))
+        position = 0
+        metadata_columns = None
+        for page in pages:
+            metadata_columns = page["biosampleMetadataColumns"]
+            items = page["biosamples"]["items"]
+            connection.executemany(
+                f"INSERT INTO biosamples VALUES ({placeholders})",
+                [
+                    (project_id, position + i)
+                    + tuple(item.get(field) for field in BIOSAMPLE_FIELDS)
+                    for i, item in enumerate(items)
+                ],
+            )
+            position += len(items)
+        connection.execute(
+            "INSERT OR REPLACE INTO projects VALUES (?, ?, ?)",
+            (project_id, metadata_columns, time.time()),
+        )
+
+
+def write_parquet_snapshot(pages: Iterable[dict], path: str) -> None:
+    """
+    Writes biosample pages (getProject shape, all fields) to a parquet snapshot
+
+    Sizes are stored as float64 (appsync sends them as floats) and read back
+    as integers when they are whole byte counts, like the sqlite snapshot does.
+
+    Requires pyarrow.
+
+    Args:
+        pages (Iterable[dict]): Biosample pages, e.g. from fetch_biosample_pages_from_appsync
+        path (str): Path of the parquet file
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema(
+        [
+            ("biosampleName", pa.string()),
+            ("fastqValidationStatus", pa.string()),
+            ("size", pa.float64()),
+            ("r1FastqTotalReads", pa.int64()),
+            ("r2FastqTotalReads", pa.int64()),
+            ("r1FastqLength", pa.int64()),
+            ("created", pa.string()),
+            ("lotId", pa.string()),
+            ("metadata", pa.string()),
+        ]
+    )
+    pages = iter(pages)
+    first_page = next(pages)
+    schema = schema.with_metadata(
+        {PARQUET_METADATA_COLUMNS_KEY: first_page["biosampleMetadataColumns"]}
+    )
+    with pq.ParquetWriter(path, schema) as writer:
+        for page in chain([first_page], pages):
+            writer.write_table(
+                pa.Table.from_pylist(page["biosamples"]["items"], schema=schema)
+            )
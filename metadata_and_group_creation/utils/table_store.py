@@ -0,0 +1,154 @@
+import threading
+import uuid
+from collections import OrderedDict
+
+from utils.cache import estimate_table_size
+
+# upper bound for the estimated size of all session tables
+TABLE_STORE_MAX_BYTES = 512 * 1024 * 1024
+# upper bound for the number of session tables
+TABLE_STORE_MAX_ENTRIES = 256
+
+
+class TableStore:
+    """
+    LRU store of the tables displayed by the sessions, bounded by their number
+    and their estimated size in bytes
+
+    Every browser session holds a handle minted for it (kept in session storage),
+    callbacks resolve the handle instead of receiving the table from the browser.
+    A session keeps its table (and its row order) until it stores a new one, even
+    if the project changes meanwhile. Stored tables are shared with the callers
+    (and usually the project table cache) and must be treated as read-only.
+
+    Args:
+        max_entries (int): Maximum number of tables
+        max_bytes (int): Maximum estimated size of all tables
+    """
+
+    def __init__(
+        self,
+        max_entries: int = TABLE_STORE_MAX_ENTRIES,
+        max_bytes: int = TABLE_STORE_MAX_BYTES,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def new_handle() -> str:
+        """
+        Returns a new handle for a session table
+        """
+        return uuid.uuid4().hex
+
+    def get(self, handle: str):
+        """
+        Returns the entry stored under handle (or None) and marks it as recently used
+
+        Entries are dicts with project_id, fields, column_defs and row_data.
+        """
+        with self._lock:
+            entry = self._entries.get(handle)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(handle)
+            self.hits += 1
+            return entry
+
+    def lookup(self, handle: str, project_id: str, fields: list[str]):
+        """
+        Returns the entry stored under handle if it is a table of the project
+        with (at least) the given appsync fields, None otherwise
+
+        A session may have stored the table of another project, or of fewer
+        columns, e.g. in an earlier page load of the same browser tab.
+        """
+        entry = self.get(handle)
+        if (
+            entry is None
+            or entry["project_id"] != project_id
+            or not set(fields) <= set(entry["fields"])
+        ):
+            return None
+        return entry
+
+    def put(
+        self,
+        handle: str,
+        project_id: str,
+        column_defs: list[dict],
+        row_data: list[dict],
+        fields: list[str] = (),
+    ) -> dict:
+        """
+        Stores a table and evicts the least recently used ones above the bounds
+
+        Args:
+            handle (str): Handle of the table (see new_handle)
+            project_id (str): The project id
+            column_defs (list[dict]): Column definitions of the table
+            row_data (list[dict]): Row data of the table
+            fields (list[str]): Appsync fields the rows were built from
+
+        Returns:
+            entry (dict): The stored entry
+        """
+        entry = {
+            "project_id": project_id,
+            "fields": list(fields),
+            "column_defs": column_defs,
+            "row_data": row_data,
+            "bytes": estimate_table_size(column_defs, row_data),
+        }
+        with self._lock:
+            self.discard(handle)
+            self._entries[handle] = entry
+            self.bytes += entry["bytes"]
+            # always keep the newest entry, even if it is larger than the budget
+            while (
+                self.bytes > self.max_bytes or len(self._entries) > self.max_entries
+            ) and len(self._entries) > 1:
+                oldest = next(iter(self._entries))
+                self.discard(oldest)
+                self.evictions += 1
+        return entry
+
+    def discard(self, handle: str) -> None:
+        """
+        Removes the entry stored under handle (if any)
+        """
+        with self._lock:
+            entry = self._entries.pop(handle, None)
+            if entry is not None:
+                self.bytes -= entry["bytes"]
+
+    def clear(self) -> None:
+        """
+        Removes all entries (counters are kept)
+        """
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        """
+        Returns the store counters (hits, misses, evictions, entries, bytes)
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+            }
+
+
+table_store = TableStore()
@@ -4,5 +4,11 @@ setup(
     name="bioskryb-dash-utils",
     version="0.1",
     packages=find_packages(),
+    # optional backends: orjson/msgspec for json decoding (utils/codec.py),
+    # pyarrow for parquet snapshots (utils/sources.py)
+    extras_require={
+        "json": ["orjson>=3.8", "msgspec>=0.18"],
+        "parquet": ["pyarrow>=14"],
+    },
     # Add other parameters as needed
 )